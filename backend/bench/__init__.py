@@ -0,0 +1,3 @@
+"""
+Offline benchmarking tools: mock upstream server and load driver
+"""
@@ -0,0 +1,98 @@
+"""
+Import-time benchmark - how long importing the API module takes before uvicorn can bind its port
+
+Runs `python -X importtime -c "import <module>"` in fresh interpreters and
+summarizes the median total and the slowest top-level packages. Used as a
+regression check: --max-ms fails on a slower import and --forbid fails when
+a package that should load lazily (langgraph, httpx, ...) is imported.
+
+Run: python -m backend.bench.import_time --runs 5 --forbid langgraph,langchain_core,httpx
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List, Tuple
+
+
+def import_profile(module: str) -> List[Tuple[str, int, int]]:
+    """(module, self us, cumulative us) for every module imported by `import module` in a fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=False
+    )
+    if result.returncode != 0:
+        raise ValueError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def run(module: str, runs: int, top: int) -> Dict[str, Any]:
+    totals: List[float] = []
+    packages: Dict[str, List[float]] = {}
+    imported: set = set()
+    for _ in range(runs):
+        rows = import_profile(module)
+        totals.append(next(cumulative for name, _, cumulative in rows if name == module) / 1000)
+        per_package: Dict[str, int] = {}
+        for name, self_us, _ in rows:
+            package = name.split(".")[0]
+            per_package[package] = per_package.get(package, 0) + self_us
+            imported.add(name)
+        for package, self_us in per_package.items():
+            packages.setdefault(package, []).append(self_us / 1000)
+
+    slowest = sorted(((statistics.median(ms), package) for package, ms in packages.items()), reverse=True)[:top]
+    return {
+        "module": module,
+        "runs": runs,
+        "median_ms": round(statistics.median(totals), 1),
+        "min_ms": round(min(totals), 1),
+        "max_ms": round(max(totals), 1),
+        "slowest_packages_ms": {package: round(ms, 1) for ms, package in slowest},
+        "imported": sorted(imported)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import-time benchmark and regression check")
+    parser.add_argument("--module", default="backend.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest top-level packages to list")
+    parser.add_argument("--max-ms", type=float, default=None, help="Fail when the median import takes longer")
+    parser.add_argument("--forbid", default="", help="Comma-separated packages that must not be imported")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    summary = run(args.module, args.runs, args.top)
+    forbidden = [name for name in args.forbid.split(",") if name]
+    eager = sorted({name.split(".")[0] for name in summary.pop("imported") if name.split(".")[0] in forbidden})
+    summary["forbidden_imported"] = eager
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"import {summary['module']}: median {summary['median_ms']:.0f} ms over {summary['runs']} runs (min {summary['min_ms']:.0f}, max {summary['max_ms']:.0f})")
+        for package, ms in summary["slowest_packages_ms"].items():
+            print(f"  {package:<24} {ms:8.1f} ms")
+
+    failures = []
+    if eager:
+        failures.append(f"imported eagerly: {', '.join(eager)}")
+    if args.max_ms is not None and summary["median_ms"] > args.max_ms:
+        failures.append(f"median {summary['median_ms']:.0f} ms exceeds {args.max_ms:.0f} ms")
+    if failures:
+        print("FAIL: " + "; ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+JSON path benchmark - response serialization and upstream parsing, stdlib/FastAPI path versus the fast path
+
+Covers the endpoints that move the most JSON:
+  game_state    GET /api/game/{id}: GameState with --history turns
+  conversation  POST /api/game/conversation: ConversationResponse
+  stream_text   one OpenRouter SSE text delta, parsed per line in _stream_response
+  stream_audio  one GPT Audio SSE delta with a base64 PCM chunk, parsed in generate_audio_stream
+  request_body  an upstream chat completion payload with --history messages
+
+The baseline for responses is FastAPI's own serialize_response (response_model
+validation + jsonable_encoder) rendered by JSONResponse; the fast path is what
+the API now returns. Upstream rows compare json with the configured backend.
+
+Run: python -m backend.bench.json_bench --history 40
+"""
+import argparse
+import asyncio
+import base64
+import json
+import time
+from typing import Any, Callable, Dict
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+from backend.main import app, model_response
+from backend.models.game import GameState, ConversationResponse
+from backend.services import json_codec
+
+PLAYER_LINE = "Kapitanie, flota królewska płynie w naszą stronę, musimy przenieść skarb na Wyspę Czaszki zanim nas dogonią!"
+PIRATE_LINE = "Arrr, a skąd mam wiedzieć, że nie jesteś szpiegiem Korony? Mów prawdę, szczurze lądowy, albo pójdziesz za burtę!"
+
+
+def _per_op_us(fn: Callable[[], Any], seconds: float) -> float:
+    calls, started = 0, time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        for _ in range(20):
+            fn()
+        calls += 20
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+_loop = asyncio.new_event_loop()
+
+
+def _fastapi_render(path: str, method: str, content: Any) -> Callable[[], bytes]:
+    """What FastAPI does with a returned model: validate against response_model, encode, render"""
+    route = next(r for r in app.routes if isinstance(r, APIRoute) and r.path == path and method in r.methods)
+    field = route.secure_cloned_response_field or route.response_field
+
+    def render() -> bytes:
+        value = _loop.run_until_complete(serialize_response(field=field, response_content=content))
+        return JSONResponse(value).body
+
+    return render
+
+
+def run(history: int, seconds: float) -> Dict[str, Dict[str, float]]:
+    game_state = GameState(game_id="3f6c2b1e-5a1d-4c1b-9f4e-2a7d9b8c1e0f", merit_score=42, pinned_facts=["Jestem kupcem z Tortugi"])
+    for _ in range(history):
+        game_state.conversation_history.append({"role": "user", "content": PLAYER_LINE})
+        game_state.conversation_history.append({"role": "pirate", "content": PIRATE_LINE})
+    conversation = ConversationResponse(
+        game_id=game_state.game_id,
+        pirate_response=PIRATE_LINE,
+        merit_score=42,
+        streaming_audio_endpoint="/api/game/conversation/stream-audio",
+        served_models={"generation": "openai/gpt-4o-mini", "judge": "google/gemini-3-flash-preview"},
+        turn_id="b7e1c0d2a9f84e3c"
+    )
+    text_line = json.dumps({
+        "id": "gen-1", "model": "openai/gpt-4o-mini", "object": "chat.completion.chunk",
+        "choices": [{"index": 0, "delta": {"role": "assistant", "content": "Arrr, szczurze "}, "finish_reason": None}]
+    })
+    audio_line = json.dumps({
+        "id": "gen-2", "model": "openai/gpt-audio-mini",
+        "choices": [{"index": 0, "delta": {"audio": {"id": "audio-1", "data": base64.b64encode(bytes(4800)).decode("ascii"), "transcript": "Arrr"}}}]
+    })
+    payload = {
+        "model": "openai/gpt-4o-mini",
+        "messages": [{"role": "system", "content": PIRATE_LINE * 10}] + [
+            {"role": "user" if i % 2 else "assistant", "content": PLAYER_LINE if i % 2 else PIRATE_LINE} for i in range(history)
+        ],
+        "temperature": 0.8,
+        "stream": True,
+        "usage": {"include": True}
+    }
+
+    cases = {
+        "game_state": (_fastapi_render("/api/game/{game_id}", "GET", game_state), lambda: model_response(game_state).body),
+        "conversation": (_fastapi_render("/api/game/conversation", "POST", conversation), lambda: model_response(conversation).body),
+        "stream_text": (lambda: json.loads(text_line), lambda: json_codec.loads(text_line)),
+        "stream_audio": (lambda: json.loads(audio_line), lambda: json_codec.loads(audio_line)),
+        # httpx's json= encoding
+        "request_body": (lambda: json.dumps(payload).encode("utf-8"), lambda: json_codec.dumps(payload))
+    }
+    results = {}
+    for name, (baseline, fast) in cases.items():
+        baseline_us, fast_us = _per_op_us(baseline, seconds), _per_op_us(fast, seconds)
+        results[name] = {"baseline_us": round(baseline_us, 2), "fast_us": round(fast_us, 2), "speedup": round(baseline_us / fast_us, 2)}
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="JSON serialization and parsing benchmark")
+    parser.add_argument("--history", type=int, default=40, help="Conversation turns in the game state and upstream payload")
+    parser.add_argument("--seconds", type=float, default=0.5, help="Measuring time per variant")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    results = run(args.history, args.seconds)
+    if args.json:
+        print(json.dumps({"backend": json_codec.BACKEND, "results": results}, indent=2))
+        return
+    print(f"JSON backend: {json_codec.BACKEND}, history: {args.history} turns")
+    print(f"{'case':<14} {'baseline':>12} {'fast':>12} {'speedup':>8}")
+    for name, row in results.items():
+        print(f"{name:<14} {row['baseline_us']:>9.1f} us {row['fast_us']:>9.1f} us {row['speedup']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
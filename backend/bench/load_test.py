@@ -0,0 +1,194 @@
+"""
+Load driver - plays N concurrent players against a running backend and reports latency percentiles
+
+Each player starts a game, sends --turns messages and (with --audio) streams
+the audio of every reply through /api/game/conversation/stream-audio.
+Reports p50/p95/p99 turn latency, time to first audio chunk and throughput.
+
+Run: python -m backend.bench.load_test --base-url http://localhost:8000 --players 20 --turns 5 --audio
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import httpx
+
+PLAYER_MESSAGES = [
+    "Ahoj kapitanie! Jestem nowym członkiem twojej załogi, pierwszy oficer mnie przysłał.",
+    "Jestem kupcem z Tortugi, mam beczkę najlepszego rumu na wymianę.",
+    "Pamiętasz mnie? Pływaliśmy razem na Czarnej Perle dawno temu.",
+    "Kapitanie, flota królewska płynie w naszą stronę, musimy przenieść skarb!",
+    "Proszę, pomóż mi, moja rodzina głoduje, potrzebuję tylko małej części skarbu.",
+    "Twój brat kazał mi odebrać skarb, mam jego pierścień na dowód.",
+    "Wspaniały z ciebie kapitan, najlepszy na wszystkich siedmiu morzach!"
+]
+
+
+@dataclass
+class Results:
+    """Samples collected by all players"""
+    turn_seconds: List[float] = field(default_factory=list)
+    first_audio_seconds: List[float] = field(default_factory=list)
+    audio_seconds: List[float] = field(default_factory=list)
+    errors: Dict[str, int] = field(default_factory=dict)
+    overloaded: int = 0
+
+    def error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+def percentile(samples: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile (q in 0..100), None without samples"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+async def stream_audio(client: httpx.AsyncClient, text: str, turn_id: Optional[str], results: Results) -> None:
+    """Consume one SSE audio stream, recording time to the first audio chunk"""
+    started = time.perf_counter()
+    first = None
+    async with client.stream("POST", "/api/game/conversation/stream-audio", json={"text": text, "turn_id": turn_id}) as response:
+        if response.status_code != 200:
+            results.error(f"audio_http_{response.status_code}")
+            return
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            data = line[6:]
+            if data == "[DONE]":
+                break
+            if data.startswith("ERROR:"):
+                results.error("audio_stream_error")
+                return
+            if first is None:
+                first = time.perf_counter() - started
+    if first is not None:
+        results.first_audio_seconds.append(first)
+        results.audio_seconds.append(time.perf_counter() - started)
+
+
+async def play(
+    client: httpx.AsyncClient,
+    player: int,
+    turns: int,
+    difficulty: str,
+    audio: bool,
+    think_time: float,
+    results: Results
+) -> None:
+    """One player: start a game, then take turns until done or the game ends"""
+    response = await client.post("/api/game/start", json={"difficulty": difficulty, "pirate_name": f"Kapitan {player}"})
+    if response.status_code != 200:
+        results.error(f"start_http_{response.status_code}")
+        return
+    game_id = response.json()["game_id"]
+
+    for _ in range(turns):
+        started = time.perf_counter()
+        try:
+            response = await client.post(
+                "/api/game/conversation",
+                json={"game_id": game_id, "message": random.choice(PLAYER_MESSAGES), "include_audio": False}
+            )
+        except httpx.HTTPError as e:
+            results.error(type(e).__name__)
+            continue
+        if response.status_code == 503:
+            results.overloaded += 1
+            await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+            continue
+        if response.status_code != 200:
+            results.error(f"turn_http_{response.status_code}")
+            continue
+        results.turn_seconds.append(time.perf_counter() - started)
+        data = response.json()
+
+        if audio and data.get("pirate_response"):
+            try:
+                await stream_audio(client, data["pirate_response"], data.get("turn_id"), results)
+            except httpx.HTTPError as e:
+                results.error(f"audio_{type(e).__name__}")
+        if data.get("is_won") or data.get("is_lost") or data.get("budget_exhausted"):
+            return
+        if think_time:
+            await asyncio.sleep(random.uniform(0, 2 * think_time))
+
+
+def report(results: Results, wall_seconds: float) -> Dict[str, Any]:
+    """Summary statistics of a run"""
+    def summary(samples: List[float]) -> Dict[str, Any]:
+        return {
+            "count": len(samples),
+            "p50": percentile(samples, 50),
+            "p95": percentile(samples, 95),
+            "p99": percentile(samples, 99),
+            "max": max(samples) if samples else None
+        }
+
+    return {
+        "wall_seconds": round(wall_seconds, 3),
+        "turns_per_second": round(len(results.turn_seconds) / wall_seconds, 3) if wall_seconds else 0.0,
+        "turn_seconds": summary(results.turn_seconds),
+        "time_to_first_audio_seconds": summary(results.first_audio_seconds),
+        "audio_stream_seconds": summary(results.audio_seconds),
+        "overloaded_503": results.overloaded,
+        "errors": results.errors
+    }
+
+
+def _format(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.0f} ms"
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    results = Results()
+    limits = httpx.Limits(max_connections=args.players * 2, max_keepalive_connections=args.players * 2)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+
+        async def delayed(player: int) -> None:
+            # Spread player arrivals over the ramp-up period
+            await asyncio.sleep(args.ramp_up * player / max(1, args.players))
+            await play(client, player, args.turns, args.difficulty, args.audio, args.think_time, results)
+
+        await asyncio.gather(*(delayed(i) for i in range(args.players)))
+        return report(results, time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Concurrent player load test")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--difficulty", default="medium", choices=["easy", "medium", "hard"])
+    parser.add_argument("--audio", action="store_true", help="Stream the audio of every reply")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between a player's turns, seconds")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds over which players join")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--seed", type=int, default=None, help="Seed player messages (needed to replay a recorded cassette)")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    summary = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    print(f"Players: {args.players}, turns each: {args.turns}, wall time: {summary['wall_seconds']:.1f}s")
+    print(f"Throughput: {summary['turns_per_second']:.2f} turns/s, 503s: {summary['overloaded_503']}, errors: {summary['errors'] or 'none'}")
+    for label, key in (("Turn latency", "turn_seconds"), ("Time to first audio", "time_to_first_audio_seconds")):
+        stats = summary[key]
+        print(f"{label:<20} n={stats['count']:<5} p50={_format(stats['p50'])}  p95={_format(stats['p95'])}  p99={_format(stats['p99'])}  max={_format(stats['max'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Log call overhead - time spent on the calling thread per print() versus structured logger call
+
+Measures print() of the former f-string messages, a logger call at an
+enabled level (queued for the writer thread) and a DEBUG call filtered out
+at INFO, the case for per-chunk messages in production. Output goes to
+/dev/null; --sink-delay-us makes every write take that long, as when
+stdout is a terminal or log pipe that cannot keep up.
+
+Run: python -m backend.bench.log_bench --calls 100000 --sink-delay-us 50
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+from typing import Callable, Dict
+
+
+class _SlowSink(io.TextIOBase):
+    """Discards text after waiting a fixed time per write"""
+
+    def __init__(self, delay_seconds: float):
+        self.delay_seconds = delay_seconds
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay_seconds)
+        return len(text)
+
+
+def _per_call_ns(fn: Callable[[int], None], calls: int) -> float:
+    started = time.perf_counter_ns()
+    for i in range(calls):
+        fn(i)
+    return (time.perf_counter_ns() - started) / calls
+
+
+def run(calls: int, sink_delay_us: float = 0.0) -> Dict[str, float]:
+    sink = _SlowSink(sink_delay_us / 1e6) if sink_delay_us else open(os.devnull, "w", encoding="utf-8")
+    # The log writer binds sys.stdout when the first logger is created
+    with contextlib.redirect_stdout(sink):
+        from backend.services import log as log_module
+        log = log_module.get_logger("bench")
+        logging.getLogger("pirate").setLevel(logging.INFO)
+
+        model = "google/gemini-3-flash-preview"
+        results = {
+            "print_ns": _per_call_ns(
+                lambda i: print(f"[OpenRouter] HTTP 429 on {model}, retry {i} in 0.25s"), calls
+            ),
+            "log_filtered_ns": _per_call_ns(
+                lambda i: log.debug("Decoded audio chunk", chunk=i, bytes=4096), calls
+            ),
+            "log_enabled_ns": _per_call_ns(
+                lambda i: log.info("Retryable HTTP status, retrying", model=model, status=429, retry=i, delay_seconds=0.25), calls
+            )
+        }
+        # Time for the writer thread to drain what the enabled run queued
+        started = time.perf_counter()
+        log_module.shutdown()
+        results["writer_drain_seconds"] = time.perf_counter() - started
+        results["dropped_records"] = log_module.dropped_records()
+    sink.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Log call overhead benchmark")
+    parser.add_argument("--calls", type=int, default=100_000)
+    parser.add_argument("--sink-delay-us", type=float, default=0.0, help="Time each write to stdout takes, microseconds")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    results = run(args.calls, args.sink_delay_us)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"Calls per variant: {args.calls}")
+    print(f"print()               {results['print_ns']:8.0f} ns/call")
+    print(f"logger, enabled       {results['log_enabled_ns']:8.0f} ns/call (writer drained in {results['writer_drain_seconds']:.2f}s, dropped {results['dropped_records']})")
+    print(f"logger, filtered out  {results['log_filtered_ns']:8.0f} ns/call")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
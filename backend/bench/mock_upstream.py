@@ -0,0 +1,311 @@
+"""
+Mock OpenRouter and Kie.ai server - offline stand-in for benchmarks and load tests
+
+Serves /api/v1/chat/completions (non-streaming and SSE, text and audio
+deltas) and the Kie.ai /api/v1/jobs/createTask and /api/v1/jobs/recordInfo
+endpoints from one process, with latency, token rate and error rate drawn
+from configurable distributions. Point the backend at it with:
+
+    OPENROUTER_BASE_URL=http://localhost:9000/api/v1
+    KIE_AI_BASE_URL=http://localhost:9000/api/v1
+
+Run: python -m backend.bench.mock_upstream --port 9000 --ttft lognormal:0.6,0.5
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+# Polish pirate lines the mock assembles replies from
+PIRATE_SENTENCES = [
+    "Arr, nie tak szybko, szczurze lądowy!",
+    "Mój skarb jest bezpieczny, a ty niczego nie dostaniesz.",
+    "Hmm, ciekawa historia, ale słyszałem już lepsze w tawernie.",
+    "Opowiedz mi coś więcej, a może ci uwierzę.",
+    "Na brodę Neptuna, ależ z ciebie gawędziarz!",
+    "Rum się kończy, a ty wciąż gadasz o moim skarbie."
+]
+
+
+class Distribution:
+    """
+    Random variable parsed from "<kind>:<params>"
+
+    Kinds: const:v, uniform:a,b, normal:mu,sigma, lognormal:median,sigma,
+    exp:mean. Samples are clipped at 0.
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        self.kind = kind.strip().lower()
+        try:
+            self.params = [float(p) for p in params.split(",") if p.strip()]
+        except ValueError:
+            raise ValueError(f"Invalid distribution parameters in '{spec}'")
+        expected = {"const": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exp": 1}
+        if self.kind not in expected or len(self.params) != expected[self.kind]:
+            raise ValueError(f"Invalid distribution '{spec}', expected one of const:v, uniform:a,b, normal:mu,sigma, lognormal:median,sigma, exp:mean")
+
+    def sample(self) -> float:
+        p = self.params
+        if self.kind == "const":
+            value = p[0]
+        elif self.kind == "uniform":
+            value = random.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = random.gauss(p[0], p[1])
+        elif self.kind == "lognormal":
+            value = random.lognormvariate(math.log(p[0]), p[1])
+        else:
+            value = random.expovariate(1.0 / p[0]) if p[0] > 0 else 0.0
+        return max(0.0, value)
+
+
+@dataclass
+class MockConfig:
+    """Latency, throughput and failure behaviour of the mock"""
+    ttft: Distribution = field(default_factory=lambda: Distribution("lognormal:0.6,0.5"))
+    token_rate: Distribution = field(default_factory=lambda: Distribution("normal:60,15"))
+    sentences: Distribution = field(default_factory=lambda: Distribution("const:2"))
+    error_rate: float = 0.0
+    error_statuses: List[int] = field(default_factory=lambda: [429, 500, 503])
+    model_ttft: Dict[str, Distribution] = field(default_factory=dict)
+    audio_chunk_interval: Distribution = field(default_factory=lambda: Distribution("const:0.08"))
+    audio_chunk_bytes: int = 4800  # 100 ms of 24 kHz pcm16
+    tts_queue: Distribution = field(default_factory=lambda: Distribution("exp:1.0"))
+    tts_synthesis: Distribution = field(default_factory=lambda: Distribution("lognormal:1.5,0.4"))
+    tts_error_rate: float = 0.0
+    tts_audio_bytes: int = 32000
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _numbered_items(messages: List[Dict[str, Any]]) -> int:
+    """Number of "N. ..." lines in the last user message (batched checks expect one result each)"""
+    text = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    if not isinstance(text, str):
+        return 1
+    return max(1, len(re.findall(r"^\d+\. ", text, flags=re.MULTILINE)))
+
+
+def instance_for_schema(schema: Dict[str, Any], messages: List[Dict[str, Any]], index: int = 1) -> Any:
+    """
+    Plausible value satisfying a JSON schema
+
+    Arrays get one item per numbered line of the prompt, and integer
+    "index" properties count those items from 1, which is what the batched
+    treasure check expects.
+    """
+    kind = schema.get("type")
+    if kind == "object":
+        return {
+            name: (index if name == "index" else instance_for_schema(sub, messages, index))
+            for name, sub in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        item_schema = schema.get("items", {})
+        return [instance_for_schema(item_schema, messages, i) for i in range(1, _numbered_items(messages) + 1)]
+    if kind == "integer":
+        return random.randint(-2, 8)
+    if kind == "number":
+        return round(random.uniform(0.05, 0.4), 2)
+    if kind == "boolean":
+        return random.random() < 0.05
+    if kind == "string":
+        return random.choice(PIRATE_SENTENCES)
+    return None
+
+
+def completion_text(payload: Dict[str, Any], sentences: int = 2) -> str:
+    """Reply text: a schema instance for json_schema requests, `sentences` pirate lines otherwise"""
+    response_format = payload.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        schema = response_format.get("json_schema", {}).get("schema", {})
+        return json.dumps(instance_for_schema(schema, payload.get("messages", [])), ensure_ascii=False)
+    max_tokens = payload.get("max_tokens") or 120
+    count = max(1, min(sentences, len(PIRATE_SENTENCES)))
+    return " ".join(random.sample(PIRATE_SENTENCES, k=count))[: max_tokens * 4]
+
+
+def _chunks(text: str) -> List[str]:
+    """Split text into token-sized pieces (words with their trailing space)"""
+    return re.findall(r"\S+\s*", text) or [text]
+
+
+def create_app(config: Optional[MockConfig] = None) -> FastAPI:
+    """Build the mock server app"""
+    config = config or MockConfig()
+    app = FastAPI(title="Mock OpenRouter / Kie.ai")
+    tasks: Dict[str, Dict[str, Any]] = {}
+    stats = {"completions": 0, "streams": 0, "audio_streams": 0, "errors": 0, "tts_tasks": 0, "polls": 0}
+
+    def injected_error(rate: float) -> Optional[Response]:
+        if rate and random.random() < rate:
+            stats["errors"] += 1
+            status = random.choice(config.error_statuses)
+            headers = {"Retry-After": "1"} if status == 429 else {}
+            return JSONResponse({"error": {"message": f"mock injected HTTP {status}", "code": status}}, status_code=status, headers=headers)
+        return None
+
+    def usage(payload: Dict[str, Any], completion_tokens: int) -> Dict[str, int]:
+        prompt = sum(_estimate_tokens(m.get("content", "")) for m in payload.get("messages", []) if isinstance(m.get("content"), str))
+        return {"prompt_tokens": prompt, "completion_tokens": completion_tokens, "total_tokens": prompt + completion_tokens}
+
+    @app.post("/api/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        model = payload.get("model", "mock")
+        error = injected_error(config.error_rate)
+        if error is not None:
+            await asyncio.sleep(config.ttft.sample() / 4)
+            return error
+        ttft = config.model_ttft.get(model, config.ttft).sample()
+
+        if "audio" in (payload.get("modalities") or []):
+            stats["audio_streams"] += 1
+            return StreamingResponse(audio_stream(payload, ttft), media_type="text/event-stream")
+
+        text = completion_text(payload, round(config.sentences.sample()))
+        pieces = _chunks(text)
+        rate = max(1.0, config.token_rate.sample())
+        if payload.get("stream"):
+            stats["streams"] += 1
+            return StreamingResponse(text_stream(payload, pieces, ttft, rate), media_type="text/event-stream")
+
+        stats["completions"] += 1
+        await asyncio.sleep(ttft + len(pieces) / rate)
+        return {
+            "id": f"gen-{uuid.uuid4().hex[:12]}",
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage(payload, len(pieces))
+        }
+
+    async def text_stream(payload: Dict[str, Any], pieces: List[str], ttft: float, rate: float) -> AsyncIterator[str]:
+        await asyncio.sleep(ttft)
+        for piece in pieces:
+            yield "data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": piece}}]}, ensure_ascii=False) + "\n\n"
+            await asyncio.sleep(1.0 / rate)
+        yield "data: " + json.dumps({"choices": [], "usage": usage(payload, len(pieces))}) + "\n\n"
+        yield "data: [DONE]\n\n"
+
+    async def audio_stream(payload: Dict[str, Any], ttft: float) -> AsyncIterator[str]:
+        text = " ".join(m.get("content", "") for m in payload.get("messages", []) if isinstance(m.get("content"), str))
+        # Roughly 12 characters of speech per 100 ms chunk
+        chunk_count = max(1, len(text) // 12)
+        silence = base64.b64encode(bytes(config.audio_chunk_bytes)).decode("ascii")
+        await asyncio.sleep(ttft)
+        yield "data: " + json.dumps({"choices": [{"index": 0, "delta": {"role": "assistant"}}]}) + "\n\n"
+        for i in range(chunk_count):
+            delta = {"audio": {"id": "audio-mock", "data": silence, "transcript": text[i * 12:(i + 1) * 12]}}
+            yield "data: " + json.dumps({"choices": [{"index": 0, "delta": delta}]}, ensure_ascii=False) + "\n\n"
+            await asyncio.sleep(config.audio_chunk_interval.sample())
+        yield "data: [DONE]\n\n"
+
+    @app.post("/api/v1/jobs/createTask")
+    async def create_task(request: Request):
+        payload = await request.json()
+        error = injected_error(config.tts_error_rate)
+        if error is not None:
+            return error
+        stats["tts_tasks"] += 1
+        task_id = uuid.uuid4().hex
+        now = time.monotonic()
+        generating_at = now + config.tts_queue.sample()
+        tasks[task_id] = {
+            "generating_at": generating_at,
+            "done_at": generating_at + config.tts_synthesis.sample(),
+            "chars": len(payload.get("input", {}).get("text", ""))
+        }
+        await asyncio.sleep(0.05)
+        return {"code": 200, "msg": "success", "data": {"taskId": task_id}}
+
+    @app.get("/api/v1/jobs/recordInfo")
+    async def record_info(taskId: str, request: Request):
+        stats["polls"] += 1
+        task = tasks.get(taskId)
+        if task is None:
+            return JSONResponse({"code": 404, "msg": "task not found"}, status_code=404)
+        now = time.monotonic()
+        data: Dict[str, Any] = {"taskId": taskId}
+        if now < task["generating_at"]:
+            data["state"] = "waiting"
+        elif now < task["done_at"]:
+            data["state"] = "generating"
+        else:
+            data["state"] = "success"
+            audio_url = str(request.base_url).rstrip("/") + f"/mock-audio/{taskId}.mp3"
+            data["resultJson"] = json.dumps({"resultUrls": [audio_url]})
+        return {"code": 200, "msg": "success", "data": data}
+
+    @app.get("/mock-audio/{name}")
+    async def mock_audio(name: str):
+        return Response(bytes(config.tts_audio_bytes), media_type="audio/mpeg")
+
+    @app.get("/mock/stats")
+    async def mock_stats():
+        return stats
+
+    return app
+
+
+def _parse_model_ttft(values: List[str]) -> Dict[str, Distribution]:
+    result = {}
+    for value in values:
+        model, sep, spec = value.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid --model-ttft '{value}', expected <model>=<distribution>")
+        result[model] = Distribution(spec)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mock OpenRouter and Kie.ai server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--ttft", default="lognormal:0.6,0.5", help="Time to first token, seconds")
+    parser.add_argument("--token-rate", default="normal:60,15", help="Completion tokens per second")
+    parser.add_argument("--sentences", default="const:2", help="Sentences per plain-text reply, e.g. uniform:2,4")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of completions answered with an error")
+    parser.add_argument("--error-statuses", default="429,500,503")
+    parser.add_argument("--model-ttft", action="append", default=[], help="Per-model override, e.g. anthropic/claude-sonnet-4.5=lognormal:1.2,0.5")
+    parser.add_argument("--audio-chunk-interval", default="const:0.08", help="Seconds between streamed audio chunks")
+    parser.add_argument("--tts-queue", default="exp:1.0", help="Kie.ai time before a task starts generating")
+    parser.add_argument("--tts-synthesis", default="lognormal:1.5,0.4", help="Kie.ai generation time")
+    parser.add_argument("--tts-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    config = MockConfig(
+        ttft=Distribution(args.ttft),
+        token_rate=Distribution(args.token_rate),
+        sentences=Distribution(args.sentences),
+        error_rate=args.error_rate,
+        error_statuses=[int(s) for s in args.error_statuses.split(",") if s.strip()],
+        model_ttft=_parse_model_ttft(args.model_ttft),
+        audio_chunk_interval=Distribution(args.audio_chunk_interval),
+        tts_queue=Distribution(args.tts_queue),
+        tts_synthesis=Distribution(args.tts_synthesis),
+        tts_error_rate=args.tts_error_rate
+    )
+
+    import uvicorn
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,7 @@ class Settings(BaseSettings):
     kie_ai_api_key: str = os.getenv("KIE_AI_API_KEY", "")
     openrouter_api_key: str = os.getenv("OPENROUTER_API_KEY", "")
     openrouter_base_url: str = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+    kie_ai_base_url: str = os.getenv("KIE_AI_BASE_URL", "https://api.kie.ai/api/v1")
     
     # ElevenLabs (via Kie.ai)
     elevenlabs_model: str = os.getenv("ELEVENLABS_MODEL", "elevenlabs/text-to-speech-turbo-2-5")
@@ -55,7 +56,152 @@ class Settings(BaseSettings):
     # Score range
     score_min: int = -100
     score_max: int = 100
-    
+
+    # Conversation context budgets (estimated tokens)
+    context_budget_generation: int = int(os.getenv("CONTEXT_BUDGET_GENERATION", "1200"))
+    context_budget_judge: int = int(os.getenv("CONTEXT_BUDGET_JUDGE", "2000"))
+    context_pinned_max_tokens: int = int(os.getenv("CONTEXT_PINNED_MAX_TOKENS", "200"))
+    context_summary_max_tokens: int = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "250"))
+    context_summary_model: str = os.getenv("CONTEXT_SUMMARY_MODEL", "google/gemini-2.0-flash-lite-001")
+
+    # OpenRouter retries (jittered exponential backoff, honors Retry-After) and hedging
+    openrouter_max_retries: int = int(os.getenv("OPENROUTER_MAX_RETRIES", "2"))
+    openrouter_backoff_base: float = float(os.getenv("OPENROUTER_BACKOFF_BASE", "0.5"))
+    openrouter_backoff_max: float = float(os.getenv("OPENROUTER_BACKOFF_MAX", "8"))
+    openrouter_hedge_enabled: bool = os.getenv("OPENROUTER_HEDGE_ENABLED", "False").lower() == "true"
+    openrouter_hedge_min_delay: float = float(os.getenv("OPENROUTER_HEDGE_MIN_DELAY", "0.5"))
+    openrouter_hedge_min_samples: int = int(os.getenv("OPENROUTER_HEDGE_MIN_SAMPLES", "20"))
+
+    # Admission control in front of conversation turns (503 + Retry-After when overloaded)
+    admission_max_in_flight: int = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "32"))
+    admission_max_queue: int = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+    admission_max_wait_seconds: float = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "5"))
+
+    # Max concurrent upstream HTTP requests per provider
+    upstream_concurrency_openrouter: int = int(os.getenv("UPSTREAM_CONCURRENCY_OPENROUTER", "48"))
+    upstream_concurrency_kie_ai: int = int(os.getenv("UPSTREAM_CONCURRENCY_KIE_AI", "8"))
+
+    # Upstream scheduler: weighted fair queuing of priority classes within the per-provider limits
+    scheduler_weight_interactive_turn: float = float(os.getenv("SCHEDULER_WEIGHT_INTERACTIVE_TURN", "6"))
+    scheduler_weight_interactive_audio: float = float(os.getenv("SCHEDULER_WEIGHT_INTERACTIVE_AUDIO", "3"))
+    scheduler_weight_background: float = float(os.getenv("SCHEDULER_WEIGHT_BACKGROUND", "1"))
+    scheduler_background_max_share: float = float(os.getenv("SCHEDULER_BACKGROUND_MAX_SHARE", "0.25"))
+    # Background work is held back while interactive requests queue longer than this (smoothed)
+    scheduler_preempt_wait_seconds: float = float(os.getenv("SCHEDULER_PREEMPT_WAIT_SECONDS", "0.2"))
+
+    # Per-model circuit breakers (errors and calls slower than the slow-call limit count as failures)
+    circuit_breaker_enabled: bool = os.getenv("CIRCUIT_BREAKER_ENABLED", "True").lower() == "true"
+    circuit_failure_rate: float = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+    circuit_slow_call_seconds: float = float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "20"))
+    circuit_window_size: int = int(os.getenv("CIRCUIT_WINDOW_SIZE", "20"))
+    circuit_min_calls: int = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+    circuit_open_seconds: float = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+    circuit_half_open_probes: int = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+    # Ordered fallback models per role (comma separated), tried after the primary model fails or its breaker is open
+    fallback_models_generation: str = os.getenv(
+        "FALLBACK_MODELS_GENERATION",
+        "google/gemini-3-flash-preview,openai/gpt-4o-mini"
+    )
+    fallback_models_judge: str = os.getenv(
+        "FALLBACK_MODELS_JUDGE",
+        "anthropic/claude-sonnet-4.5,google/gemini-3-flash-preview"
+    )
+    fallback_models_semantic_check: str = os.getenv(
+        "FALLBACK_MODELS_SEMANTIC_CHECK",
+        "google/gemini-3-flash-preview,openai/gpt-4o-mini"
+    )
+
+    # Latency-aware routing among per-difficulty equivalent models (EWMA of latency and errors)
+    routing_enabled: bool = os.getenv("ROUTING_ENABLED", "False").lower() == "true"
+    routing_ewma_alpha: float = float(os.getenv("ROUTING_EWMA_ALPHA", "0.2"))
+    routing_exploration_rate: float = float(os.getenv("ROUTING_EXPLORATION_RATE", "0.05"))
+    routing_error_penalty_seconds: float = float(os.getenv("ROUTING_ERROR_PENALTY_SECONDS", "10"))
+
+    # Span tracing: share of turns traced (0 disables), exporters (jsonl, otlp), output directory, optional OTLP/HTTP endpoint
+    tracing_sample_rate: float = float(os.getenv("TRACING_SAMPLE_RATE", "0.0"))
+    tracing_exporters: str = os.getenv("TRACING_EXPORTERS", "jsonl")
+    tracing_output_dir: str = os.getenv("TRACING_OUTPUT_DIR", "traces")
+    tracing_otlp_endpoint: str = os.getenv("TRACING_OTLP_ENDPOINT", "")
+
+    # Spending budgets in USD (0 disables); once spent a game's next turns are downgraded to the
+    # difficulty's budget_model or the game is ended, per BUDGET_ACTION ("downgrade" or "end").
+    # With "end", a spent global budget refuses turns (503) until UTC midnight instead of ending games
+    budget_per_game_usd: float = float(os.getenv("BUDGET_PER_GAME_USD", "0"))
+    budget_global_daily_usd: float = float(os.getenv("BUDGET_GLOBAL_DAILY_USD", "0"))
+    budget_action: str = os.getenv("BUDGET_ACTION", "downgrade")
+
+    # Seconds a game may sit idle before it is dropped with its per-game state (0 keeps every game)
+    game_retention_seconds: float = float(os.getenv("GAME_RETENTION_SECONDS", "86400"))
+
+    # Upstream record/replay: "off", "record" (write every OpenRouter/Kie.ai exchange to the cassette)
+    # or "replay" (serve them from it, at "recorded" timing or "fast")
+    cassette_mode: str = os.getenv("CASSETTE_MODE", "off")
+    cassette_path: str = os.getenv("CASSETTE_PATH", "cassettes/upstream.jsonl.gz")
+    cassette_replay_timing: str = os.getenv("CASSETTE_REPLAY_TIMING", "recorded")
+
+    # Game change feed (SSE): events buffered per subscriber before it is dropped as a slow consumer,
+    # subscribers per game, and seconds between keepalive comments on an idle stream
+    game_feed_queue_size: int = int(os.getenv("GAME_FEED_QUEUE_SIZE", "32"))
+    game_feed_max_subscribers: int = int(os.getenv("GAME_FEED_MAX_SUBSCRIBERS", "8"))
+    game_feed_keepalive_seconds: float = float(os.getenv("GAME_FEED_KEEPALIVE_SECONDS", "15"))
+
+    # Idempotency keys for conversation turns: seconds a finished turn's response is kept for
+    # retries with the same key, and how many responses are kept at most
+    idempotency_ttl_seconds: float = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+    idempotency_max_keys: int = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+
+    # Repeated-message fast path: a message matching one of the player's last REPEAT_WINDOW_TURNS
+    # messages (after normalization, at least REPEAT_MIN_CHARS long) skips the graph, gets a canned
+    # reply and REPEAT_PENALTY points off the merit score (shown under repetitive_strategy up to its
+    # -15 cap, still charged past it); 0 turns disables it
+    repeat_window_turns: int = int(os.getenv("REPEAT_WINDOW_TURNS", "5"))
+    repeat_min_chars: int = int(os.getenv("REPEAT_MIN_CHARS", "12"))
+    repeat_penalty: int = int(os.getenv("REPEAT_PENALTY", "5"))
+
+    # Pirate replies are streamed and the stream is closed once this many sentences are complete
+    # (0 waits for the whole completion). For a sampled share of stops the request is repeated in
+    # full at background priority to measure the skipped tail, which prices the tokens and time
+    # saved per model; each sample costs a whole extra completion, so it is off by default
+    generation_max_sentences: int = int(os.getenv("GENERATION_MAX_SENTENCES", "2"))
+    generation_tail_sample_rate: float = float(os.getenv("GENERATION_TAIL_SAMPLE_RATE", "0"))
+
+    # JSON encoder/decoder for API responses and upstream bodies: "auto" (orjson, then msgspec, then
+    # the standard library, whichever is installed first), or one of "orjson", "msgspec", "stdlib"
+    json_backend: str = os.getenv("JSON_BACKEND", "auto")
+
+    # Structured logging: minimum level, "json" lines or "text", and records buffered for the writer thread
+    # (per-audio-chunk and other per-token messages are DEBUG, so they are off at the default level)
+    log_level: str = os.getenv("LOG_LEVEL", "INFO")
+    log_format: str = os.getenv("LOG_FORMAT", "json")
+    log_queue_size: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+    # Model id prefixes for which response_format json_schema is requested (comma separated)
+    structured_output_models: str = os.getenv(
+        "STRUCTURED_OUTPUT_MODELS",
+        "openai/,google/gemini,anthropic/claude-sonnet-4.5"
+    )
+    json_parse_retries: int = int(os.getenv("JSON_PARSE_RETRIES", "1"))
+
+    # Single-call turns: the generator returns its reply and a gives_treasure self-report as JSON
+    structured_turn_mode: bool = os.getenv("STRUCTURED_TURN_MODE", "False").lower() == "true"
+
+    # Cross-game micro-batching of semantic treasure checks
+    semantic_batch_enabled: bool = os.getenv("SEMANTIC_BATCH_ENABLED", "False").lower() == "true"
+    semantic_batch_window_ms: int = int(os.getenv("SEMANTIC_BATCH_WINDOW_MS", "30"))
+    semantic_batch_max_size: int = int(os.getenv("SEMANTIC_BATCH_MAX_SIZE", "16"))
+
+    # Per-turn end-to-end time budget (0 disables); nodes degrade once it runs out
+    turn_deadline_seconds: float = float(os.getenv("TURN_DEADLINE_SECONDS", "8"))
+    deadline_min_call_seconds: float = float(os.getenv("DEADLINE_MIN_CALL_SECONDS", "0.5"))
+
+    # Merit scoring mode: "sync" waits for the judge before generating,
+    # "lagged" generates with the last committed score while the judge runs in the background
+    merit_scoring_mode: str = os.getenv("MERIT_SCORING_MODE", "sync")
+    merit_lag_decision_wait_seconds: float = float(os.getenv("MERIT_LAG_DECISION_WAIT_SECONDS", "15"))
+    merit_lag_wait_if_running: bool = os.getenv("MERIT_LAG_WAIT_IF_RUNNING", "True").lower() == "true"
+    merit_lag_max_wait_seconds: float = float(os.getenv("MERIT_LAG_MAX_WAIT_SECONDS", "10"))
+
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -68,6 +214,22 @@ DIFFICULTY_LEVELS: Dict[str, Dict[str, Any]] = {
         "merit_threshold": 40,
         "loss_threshold": -30,
         "llm_model": "google/gemini-3-flash-preview",  # Google Gemini 3 Flash Preview via OpenRouter
+        # Merit judge tiers: fast model while the running score is more than
+        # escalation_margin away from both thresholds, strong model otherwise
+        "judge_tiers": {
+            "fast_model": "google/gemini-3-flash-preview",
+            "strong_model": "anthropic/claude-sonnet-4.5",
+            "escalation_margin": 15,
+            "max_score_jump": 30
+        },
+        # Used for every call of a game once its cost budget is spent (BUDGET_ACTION=downgrade)
+        "budget_model": "openai/gpt-4o-mini",
+        # Models the router may use instead of a configured one at this difficulty
+        # (only with ROUTING_ENABLED); the configured model stays first on ties
+        "model_equivalents": {
+            "google/gemini-3-flash-preview": ["google/gemini-2.5-flash", "openai/gpt-4o-mini"],
+            "anthropic/claude-sonnet-4.5": ["openai/gpt-4.1", "google/gemini-2.5-pro"]
+        },
         "system_prompt_base": """Jesteś Kapitanem {name}, przyjaznym i ufnym piratem, który chroni swój skarb. 
 Masz ukryty skarb, który jest dla ciebie bardzo cenny. Dostosowujesz się do osoby, z którą rozmawiasz - jeśli to członek załogi, traktujesz go jak załogę. 
 Jeśli to kupiec, prowadzisz handel. Odpowiadasz po polsku. 
@@ -83,6 +245,17 @@ WAŻNE: Twoje odpowiedzi muszą być KRÓTKIE - maksymalnie 2 zdania. Bądź zwi
         "merit_threshold": 60,
         "loss_threshold": -50,
         "llm_model": "anthropic/claude-sonnet-4.5",  # Anthropic Claude Sonnet 4.5 via OpenRouter
+        "judge_tiers": {
+            "fast_model": "google/gemini-3-flash-preview",
+            "strong_model": "anthropic/claude-sonnet-4.5",
+            "escalation_margin": 15,
+            "max_score_jump": 30
+        },
+        "budget_model": "google/gemini-3-flash-preview",
+        "model_equivalents": {
+            "google/gemini-3-flash-preview": ["google/gemini-2.5-flash"],
+            "anthropic/claude-sonnet-4.5": ["openai/gpt-4.1"]
+        },
         "system_prompt_base": """Jesteś Kapitanem {name}, ostrożnym ale elastycznym piratem, który chroni swój skarb. 
 Masz ukryty skarb, który jest dla ciebie bardzo cenny. Dostosowujesz swoje zachowanie do osoby, z którą rozmawiasz - członkowie załogi, kupcy, przyjaciele itp. 
 Odpowiadasz po polsku. Jesteś nieco podejrzliwy, ale nadal prowadzisz naturalne rozmowy. 
@@ -97,6 +270,16 @@ WAŻNE: Twoje odpowiedzi muszą być KRÓTKIE - maksymalnie 2 zdania. Bądź zwi
         "merit_threshold": 80,
         "loss_threshold": -90,
         "llm_model": "anthropic/claude-sonnet-4.5",  # Anthropic Claude Sonnet 4.5 via OpenRouter (best model)
+        "judge_tiers": {
+            "fast_model": "google/gemini-3-flash-preview",
+            "strong_model": "anthropic/claude-sonnet-4.5",
+            "escalation_margin": 20,
+            "max_score_jump": 25
+        },
+        "budget_model": "google/gemini-3-flash-preview",
+        "model_equivalents": {
+            "google/gemini-3-flash-preview": ["google/gemini-2.5-flash"]
+        },
         "system_prompt_base": """Jesteś Kapitanem {name}, wysoce inteligentnym i bardzo podejrzliwym piratem, który chroni swój skarb. 
 Masz ukryty skarb, który jest dla ciebie niezwykle cenny. Dostosowujesz się do partnerów rozmowy - jeśli twierdzą że są załogą, traktujesz ich jak załogę. 
 Jeśli to kupcy, negocjujesz. Odpowiadasz po polsku. Jesteś bardzo świadomy manipulacji i oszustw. 
@@ -109,6 +292,17 @@ WAŻNE: Twoje odpowiedzi muszą być KRÓTKIE - maksymalnie 2 zdania. Bądź zwi
     }
 }
 
+# OpenRouter prices in USD per million tokens, used to estimate cost when usage has no "cost"
+MODEL_PRICING: Dict[str, Dict[str, float]] = {
+    "google/gemini-3-flash-preview": {"prompt": 0.50, "completion": 3.00},
+    "google/gemini-2.5-flash": {"prompt": 0.30, "completion": 2.50},
+    "google/gemini-2.5-pro": {"prompt": 1.25, "completion": 10.00},
+    "google/gemini-2.0-flash-lite-001": {"prompt": 0.075, "completion": 0.30},
+    "anthropic/claude-sonnet-4.5": {"prompt": 3.00, "completion": 15.00},
+    "openai/gpt-4.1": {"prompt": 2.00, "completion": 8.00},
+    "openai/gpt-4o-mini": {"prompt": 0.15, "completion": 0.60}
+}
+
 # Forbidden phrase (must be blocked unless deception score is high enough)
 FORBIDDEN_PHRASE = "Oto mój skarb, weź go"
 
@@ -2,6 +2,9 @@
 LangGraph state machine for conversation flow
 """
 from typing import TypedDict, Annotated, Literal, Dict, Optional
+import asyncio
+import random
+import time
 from langgraph.graph import StateGraph, END
 try:
     from langgraph.graph.message import add_messages
@@ -9,12 +12,22 @@ except ImportError:
     # Fallback for different langgraph versions
     from langgraph.graph import add_messages
 from langchain_core.messages import HumanMessage, AIMessage
-from backend.services.openrouter_service import OpenRouterService
+from backend.services.openrouter_service import OpenRouterService, served_models
 from backend.services.merit_check import MeritCheckService
 from backend.services.validation import ValidationService
-from backend.config import DIFFICULTY_LEVELS, FORBIDDEN_PHRASE
+from backend.services.context_builder import ContextBuilder
+from backend.services.semantic_batcher import SemanticCheckBatcher
+from backend.services.json_stream import JSONStreamError
+from backend.services.upstream import INTERACTIVE_TURN
+from backend.services.metrics import GRAPH_NODE_SECONDS
+from backend.services.tracing import tracer
+from backend.services.log import get_logger
+from backend.models.game import MeritEvaluation
+from backend.config import DIFFICULTY_LEVELS, FORBIDDEN_PHRASE, settings
 import operator
 
+log = get_logger("graph")
+
 
 class ConversationState(TypedDict):
     """State for conversation graph"""
@@ -24,6 +37,7 @@ class ConversationState(TypedDict):
     conversation_history: list
     strategies_attempted: list
     player_personas: list
+    pinned_facts: list
     merit_score: int
     merit_has_earned_it: bool
     pirate_response: str
@@ -33,6 +47,38 @@ class ConversationState(TypedDict):
     similar_treasure_phrase_detected: bool
     similarity_confidence: float
     negative_categories: Optional[Dict[str, int]]  # Optional: negative point categories breakdown
+    merit_fresh: bool  # Whether merit fields reflect the judge's verdict for this turn
+    self_reported_treasure: Optional[bool]  # Structured turn mode: generator says it gives the treasure
+    self_report_confidence: float
+    deadline: Optional[float]  # time.monotonic() by which the turn must finish (None = no budget)
+    degraded_nodes: list  # Nodes that fell back to a degrade path this turn
+
+
+# Structured turn mode output: reply plus the generator's own treasure-intent report
+STRUCTURED_TURN_SCHEMA: Dict = {
+    "type": "object",
+    "properties": {
+        "reply": {"type": "string"},
+        "gives_treasure": {"type": "boolean"},
+        "confidence": {"type": "number"}
+    },
+    "required": ["reply", "gives_treasure", "confidence"],
+    "additionalProperties": False
+}
+
+STRUCTURED_TURN_INSTRUCTION = """
+
+FORMAT ODPOWIEDZI: zwróć TYLKO JSON {"reply": "<twoja odpowiedź jako pirat>", "gives_treasure": true/false, "confidence": 0.0-1.0}.
+"gives_treasure" = true tylko wtedy, gdy w tej odpowiedzi oddajesz skarb graczowi (skarb jest teraz jego, może go wziąć). "confidence" to twoja pewność tej oceny."""
+
+
+# Replies used when generation runs out of time budget
+CANNED_REPLIES = [
+    "Arr, wiatr zagłuszył twoje słowa... Powtórz no, szczurze lądowy!",
+    "Hmm, muszę to przemyśleć przy butelce rumu. Mów dalej!",
+    "Mewy tak wrzeszczą, że nic nie słyszę! Co mówiłeś?",
+    "Ha! Nie tak szybko, przyjacielu. Opowiedz mi coś więcej."
+]
 
 
 class ConversationGraph:
@@ -40,19 +86,29 @@ class ConversationGraph:
     
     def __init__(self):
         self.llm_service = OpenRouterService()
-        self.merit_service = MeritCheckService()
+        self.context_builder = ContextBuilder(self.llm_service)
+        self.merit_service = MeritCheckService(context_builder=self.context_builder)
         self.validation_service = ValidationService()
+        # Opt-in: semantic checks from concurrent games share one upstream request
+        self.semantic_batcher = (
+            SemanticCheckBatcher(self.validation_service, self.llm_service)
+            if settings.semantic_batch_enabled else None
+        )
+        # Lagged merit mode: judge tasks still running for a game, keyed by game_id
+        self._pending_merit: Dict[str, asyncio.Task] = {}
+        # Turns that hit a degrade path, per node
+        self.degraded_counts: Dict[str, int] = {}
         self.graph = self._build_graph()
         
     def _build_graph(self) -> StateGraph:
         """Build the LangGraph state machine"""
         workflow = StateGraph(ConversationState)
         
-        # Add nodes
-        workflow.add_node("merit_check", self._merit_check_node)
-        workflow.add_node("generate_response", self._generate_response_node)
-        workflow.add_node("validate_response", self._validate_response_node)
-        workflow.add_node("handle_blocked", self._handle_blocked_node)
+        # Add nodes (timed for the pirate_graph_node_seconds histogram)
+        workflow.add_node("merit_check", self._timed("merit_check", self._merit_check_node))
+        workflow.add_node("generate_response", self._timed("generate_response", self._generate_response_node))
+        workflow.add_node("validate_response", self._timed("validate_response", self._validate_response_node))
+        workflow.add_node("handle_blocked", self._timed("handle_blocked", self._handle_blocked_node))
         
         # Set entry point
         workflow.set_entry_point("merit_check")
@@ -79,21 +135,93 @@ class ConversationGraph:
         
         return workflow.compile()
     
+    def _remaining(self, state: ConversationState) -> Optional[float]:
+        """Seconds left in the turn budget (None if the turn has no deadline)"""
+        deadline = state.get("deadline")
+        if deadline is None:
+            return None
+        return deadline - time.monotonic()
+    
+    @staticmethod
+    def _timed(node: str, handler):
+        """Wrap a node handler so its duration is observed per node and traced as a span"""
+        if not asyncio.iscoroutinefunction(handler):
+            def run_sync(state: ConversationState) -> ConversationState:
+                with GRAPH_NODE_SECONDS.time(node=node), tracer.span(f"graph.{node}"):
+                    return handler(state)
+            return run_sync
+        
+        async def run(state: ConversationState) -> ConversationState:
+            with GRAPH_NODE_SECONDS.time(node=node), tracer.span(f"graph.{node}"):
+                return await handler(state)
+        return run
+    
+    def _has_budget(self, state: ConversationState) -> bool:
+        """Whether enough budget is left to attempt an upstream call"""
+        remaining = self._remaining(state)
+        return remaining is None or remaining >= settings.deadline_min_call_seconds
+    
+    def _mark_degraded(self, state: ConversationState, node: str) -> None:
+        """Record that a node used its degrade path this turn"""
+        if node not in state["degraded_nodes"]:
+            state["degraded_nodes"].append(node)
+            self.degraded_counts[node] = self.degraded_counts.get(node, 0) + 1
+            log.warning("Node degraded by turn deadline", game_id=state["game_id"], node=node, remaining_seconds=self._remaining(state))
+    
     async def _merit_check_node(self, state: ConversationState) -> ConversationState:
         """Evaluate player deception/misguidance using LLM"""
-        evaluation = await self.merit_service.evaluate_merit(
-            conversation_history=state["conversation_history"],
+        merit_args = dict(
+            # Snapshot: the pirate reply is appended to the live history before a lagged judge finishes
+            conversation_history=list(state["conversation_history"]),
             difficulty=state["difficulty"],
-            strategies_attempted=state["strategies_attempted"],
-            player_personas=state["player_personas"]
+            strategies_attempted=list(state["strategies_attempted"]),
+            player_personas=list(state["player_personas"])
         )
         
+        if settings.merit_scoring_mode == "lagged":
+            # Reply is generated with the last committed merit state already in the state;
+            # the judge runs alongside generation and is awaited before win/loss decisions
+            self._pending_merit[state["game_id"]] = asyncio.create_task(self.merit_service.evaluate_merit(
+                **merit_args,
+                game_id=state["game_id"],
+                pinned_facts=list(state.get("pinned_facts") or []),
+                current_score=state["merit_score"]
+            ))
+            state["merit_fresh"] = False
+            return state
+        
+        if not self._has_budget(state):
+            self._mark_degraded(state, "merit_check")
+            self._apply_evaluation(state, self.merit_service.fallback_merit(**merit_args))
+            return state
+        
+        evaluation = await self.merit_service.evaluate_merit(
+            **merit_args,
+            game_id=state["game_id"],
+            pinned_facts=list(state.get("pinned_facts") or []),
+            current_score=state["merit_score"],
+            timeout=self._remaining(state)
+        )
+        if evaluation.evaluation_model is None:
+            # Judge failed or ran out of budget: heuristic _fallback_evaluation was used
+            self._mark_degraded(state, "merit_check")
+        self._apply_evaluation(state, evaluation)
+        return state
+    
+    def _apply_evaluation(self, state: ConversationState, evaluation: MeritEvaluation) -> None:
+        """Copy a judge verdict into the graph state"""
         state["merit_score"] = evaluation.total_score
         state["merit_has_earned_it"] = evaluation.has_earned_it
         state["is_lost"] = evaluation.has_lost
+        state["merit_fresh"] = True
         
         # Store negative categories as dict for later use
-        state["negative_categories"] = {
+        state["negative_categories"] = self._negative_categories(evaluation)
+    
+    @staticmethod
+    def _negative_categories(evaluation: MeritEvaluation) -> Dict[str, int]:
+        """Negative point categories breakdown of a judge verdict"""
+        return {
             "obvious_lies": evaluation.obvious_lies,
             "repetitive_strategy": evaluation.repetitive_strategy,
             "aggressive_behavior": evaluation.aggressive_behavior,
@@ -102,8 +230,73 @@ class ConversationGraph:
             "short_messages": evaluation.short_messages,
             "negative_total": evaluation.negative_total
         }
+    
+    async def _await_pending_merit(self, game_id: str, timeout: float) -> Optional[MeritEvaluation]:
+        """
+        Wait up to `timeout` seconds for a lagged judge task of a game
         
-        return state
+        Returns the evaluation once the task has finished (and forgets it), or
+        None if no task is pending or it is still running after the timeout.
+        """
+        task = self._pending_merit.get(game_id)
+        if task is None:
+            return None
+        if not task.done() and timeout > 0:
+            # shield: a timeout must not cancel the judge, it is committed later
+            try:
+                await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            except Exception:
+                pass  # Surfaced below via task.result()
+        if not task.done():
+            return None
+        self._pending_merit.pop(game_id, None)
+        try:
+            return task.result()
+        except Exception as e:
+            log.warning("Lagged merit evaluation failed", game_id=game_id, error=str(e))
+            return None
+    
+    async def commit_pending_merit(self, game_id: str) -> Optional[dict]:
+        """
+        Resolve a lagged judge result left over from the previous turn
+        
+        Applies the wait-if-still-running policy: either wait up to
+        merit_lag_max_wait_seconds for the task, or drop it and keep the
+        committed state as it is.
+        
+        Returns:
+            Dict with merit fields to commit to GameState, or None
+        """
+        task = self._pending_merit.get(game_id)
+        if task is None:
+            return None
+        if not task.done() and not settings.merit_lag_wait_if_running:
+            task.cancel()
+            self._pending_merit.pop(game_id, None)
+            return None
+        
+        evaluation = await self._await_pending_merit(game_id, settings.merit_lag_max_wait_seconds)
+        if evaluation is None:
+            # Still running after the max wait: stop waiting on it for good
+            stale = self._pending_merit.pop(game_id, None)
+            if stale and not stale.done():
+                stale.cancel()
+            return None
+        return {
+            "merit_score": evaluation.total_score,
+            "merit_has_earned_it": evaluation.has_earned_it,
+            "is_lost": evaluation.has_lost,
+            "negative_categories": self._negative_categories(evaluation)
+        }
+    
+    def forget_game(self, game_id: str) -> None:
+        """Drop per-game state (lagged judge task, rolling summaries) once a game is finished or removed"""
+        task = self._pending_merit.pop(game_id, None)
+        if task and not task.done():
+            task.cancel()
+        self.context_builder.forget(game_id)
     
     async def _generate_response_node(self, state: ConversationState) -> ConversationState:
         """Generate pirate response using LLM"""
@@ -118,6 +311,18 @@ class ConversationGraph:
             state.get("pirate_name", "Kapitan")
         )
         
+        # Fit history into the token budget; older turns survive as summary and pinned facts
+        context = self.context_builder.build(
+            state["conversation_history"],
+            token_budget=settings.context_budget_generation,
+            game_id=state["game_id"],
+            pinned_facts=state.get("pinned_facts")
+        )
+        if context.pinned_facts:
+            system_prompt += "\n\nCo gracz wcześniej o sobie twierdził:\n" + "\n".join(f"- {fact}" for fact in context.pinned_facts)
+        if context.summary:
+            system_prompt += "\n\nStreszczenie wcześniejszej rozmowy:\n" + context.summary
+        
         # Build messages
         messages = [
             {"role": "system", "content": system_prompt}
@@ -125,13 +330,9 @@ class ConversationGraph:
         
         # Add conversation history
         # Map our internal roles to LLM API roles: "user" -> "user", "pirate" -> "assistant"
-        for msg in state["conversation_history"][-10:]:  # Last 10 messages
-            role = msg.get("role", "user")
-            content = msg.get("content", "").strip()
-            
-            # Skip empty messages
-            if not content:
-                continue
+        for msg in context.messages:
+            role = msg["role"]
+            content = msg["content"]
             
             # Map roles: "pirate" -> "assistant" for LLM API
             if role == "pirate":
@@ -144,30 +345,120 @@ class ConversationGraph:
                 "content": content
             })
         
-        # Generate response (non-streaming for now)
+        state["self_reported_treasure"] = None
+        if not self._has_budget(state):
+            return self._canned_reply(state)
+        
+        if settings.structured_turn_mode:
+            # A separate list, so plain generation below still gets the untouched prompt
+            structured_messages = [
+                {"role": "system", "content": system_prompt + STRUCTURED_TURN_INSTRUCTION},
+                *messages[1:]
+            ]
+            try:
+                remaining = self._remaining(state)
+                result = await asyncio.wait_for(self.llm_service.generate_json(
+                    messages=structured_messages,
+                    model=model,
+                    schema=STRUCTURED_TURN_SCHEMA,
+                    schema_name="pirate_turn",
+                    temperature=0.7,
+                    max_tokens=200,  # ~2 sentences plus the JSON envelope
+                    required_keys=STRUCTURED_TURN_SCHEMA["required"],
+                    timeout=remaining,
+                    role="generation",
+                    difficulty=state["difficulty"],
+                    priority=INTERACTIVE_TURN
+                ), timeout=remaining)
+                reply = str(result.get("reply", "")).strip()
+                if reply:
+                    state["pirate_response"] = reply
+                    state["self_reported_treasure"] = bool(result.get("gives_treasure", False))
+                    state["self_report_confidence"] = max(0.0, min(1.0, float(result.get("confidence", 0.0))))
+                    return state
+            except (asyncio.TimeoutError, TimeoutError):
+                return self._canned_reply(state)
+            except (JSONStreamError, TypeError, ValueError) as e:
+                log.warning("Structured turn failed, falling back to plain generation", game_id=state["game_id"], error=str(e))
+            if not self._has_budget(state):
+                return self._canned_reply(state)
+        
         # Limit max_tokens to ensure short responses (max 2 sentences ~ 100-150 tokens)
-        response = await self.llm_service.generate_response(
-            messages=messages,
-            model=model,
-            temperature=0.7,
-            max_tokens=150,  # Limit to ~2 sentences
-            stream=False
-        )
+        remaining = self._remaining(state)
+        # Streamed and cut at the sentence limit the prompt asks for, except when the pirate
+        # may hand over the treasure: the phrase could come after the limit
+        max_sentences = 0 if state["merit_has_earned_it"] else settings.generation_max_sentences
+        if max_sentences > 0:
+            generation = self.llm_service.generate_sentences(
+                messages=messages,
+                model=model,
+                max_sentences=max_sentences,
+                temperature=0.7,
+                max_tokens=150,
+                timeout=remaining,
+                role="generation",
+                difficulty=state["difficulty"],
+                priority=INTERACTIVE_TURN
+            )
+        else:
+            generation = self.llm_service.generate_response(
+                messages=messages,
+                model=model,
+                temperature=0.7,
+                max_tokens=150,  # Limit to ~2 sentences
+                stream=False,
+                timeout=remaining,
+                role="generation",
+                difficulty=state["difficulty"],
+                priority=INTERACTIVE_TURN
+            )
+        try:
+            response = await asyncio.wait_for(generation, timeout=remaining)
+        except (asyncio.TimeoutError, TimeoutError):
+            return self._canned_reply(state)
         
         state["pirate_response"] = response
         return state
     
+    def _canned_reply(self, state: ConversationState) -> ConversationState:
+        """Degrade path for generation: answer with a canned stalling line"""
+        self._mark_degraded(state, "generate_response")
+        state["pirate_response"] = random.choice(CANNED_REPLIES)
+        return state
+    
     async def _validate_response_node(self, state: ConversationState) -> ConversationState:
         """Validate response for treasure phrase and check win condition using LLM semantic check"""
-        # Perform LLM semantic check first to detect similar treasure-giving phrases
-        similar_detected, confidence = await self.validation_service.detects_similar_treasure_phrase_llm(
-            state["pirate_response"],
-            self.llm_service
-        )
+        # Detect similar treasure-giving phrases (LLM semantic check unless the self-report settles it)
+        if self._has_budget(state):
+            remaining = self._remaining(state)
+            try:
+                similar_detected, confidence = await asyncio.wait_for(
+                    self._detect_treasure_intent(state, timeout=remaining),
+                    timeout=remaining
+                )
+            except (asyncio.TimeoutError, TimeoutError):
+                self._mark_degraded(state, "validate_response")
+                similar_detected, confidence = self.validation_service.regex_treasure_check(state["pirate_response"])
+        else:
+            # Out of budget: regex-only validation
+            self._mark_degraded(state, "validate_response")
+            similar_detected, confidence = self.validation_service.regex_treasure_check(state["pirate_response"])
         
         state["similar_treasure_phrase_detected"] = similar_detected
         state["similarity_confidence"] = confidence
         
+        # Lagged mode: win/loss must be decided on this turn's score, not the committed one
+        if not state.get("merit_fresh", True):
+            wait = settings.merit_lag_decision_wait_seconds
+            remaining = self._remaining(state)
+            if remaining is not None:
+                wait = max(0.0, min(wait, remaining))
+            evaluation = await self._await_pending_merit(state["game_id"], wait)
+            if evaluation is not None:
+                self._apply_evaluation(state, evaluation)
+            else:
+                self._mark_degraded(state, "merit_check")
+        
         # Check exact phrase and agreement patterns (fast regex check)
         # Pass similar_detected to validate_response for consistency
         is_allowed, alternative = self.validation_service.validate_response(
@@ -212,12 +503,41 @@ class ConversationGraph:
             
             # Win condition: score >= threshold AND similar treasure phrase detected
             # This is the ONLY way to win - both conditions must be met
-            if score_met_threshold and state["similar_treasure_phrase_detected"]:
+            # (a stale lagged score never wins; the judge result is committed next turn)
+            if score_met_threshold and state["similar_treasure_phrase_detected"] and state.get("merit_fresh", True):
                 # Player won by having high deception score AND tricking pirate into giving treasure!
                 state["is_won"] = True
         
         return state
     
+    async def _detect_treasure_intent(self, state: ConversationState, timeout: Optional[float] = None) -> tuple:
+        """
+        Decide whether the reply gives the treasure away
+        
+        In structured turn mode the generator's self-report is trusted when
+        it agrees with the regex checks; the separate LLM semantic check only
+        runs when they disagree (or when there is no self-report).
+        
+        Returns:
+            Tuple of (similar_detected, confidence)
+        """
+        self_report = state.get("self_reported_treasure")
+        if self_report is not None:
+            regex_detected, _ = self.validation_service.regex_treasure_check(state["pirate_response"])
+            confidence = state.get("self_report_confidence", 0.0)
+            # Compared as reported: a low-confidence "gave it away" still means the check is needed
+            if bool(self_report) == regex_detected:
+                return regex_detected, confidence
+            log.info("Self-report disagrees with regex, running semantic check", self_report=self_report, confidence=round(confidence, 2), regex_detected=regex_detected)
+        
+        if self.semantic_batcher is not None:
+            return await self.semantic_batcher.check(state["pirate_response"])
+        return await self.validation_service.detects_similar_treasure_phrase_llm(
+            state["pirate_response"],
+            self.llm_service,
+            timeout=timeout
+        )
+    
     def _handle_blocked_node(self, state: ConversationState) -> ConversationState:
         """Handle blocked response - already handled in validate, just pass through"""
         return state
@@ -261,13 +581,23 @@ class ConversationGraph:
         difficulty: str,
         conversation_history: list,
         strategies_attempted: list,
-        player_personas: list
+        player_personas: list,
+        pinned_facts: Optional[list] = None,
+        committed_merit: Optional[dict] = None
     ) -> dict:
-        """Process a user message through the graph"""
+        """
+        Process a user message through the graph
+        
+        committed_merit carries the last merit state committed to GameState
+        (merit_score, merit_has_earned_it, negative_categories); in lagged
+        merit mode the reply is generated with it.
+        """
         # Convert difficulty enum to string if needed
         if hasattr(difficulty, 'value'):
             difficulty = difficulty.value
         
+        committed_merit = committed_merit or {}
+        
         initial_state: ConversationState = {
             "messages": [HumanMessage(content=user_message)],
             "game_id": game_id,
@@ -275,17 +605,27 @@ class ConversationGraph:
             "conversation_history": conversation_history,
             "strategies_attempted": strategies_attempted,
             "player_personas": player_personas,
-            "merit_score": 0,
-            "merit_has_earned_it": False,
+            "pinned_facts": pinned_facts or [],
+            "merit_score": committed_merit.get("merit_score", 0),
+            "merit_has_earned_it": committed_merit.get("merit_has_earned_it", False),
             "pirate_response": "",
             "is_blocked": False,
             "is_won": False,
             "is_lost": False,
             "similar_treasure_phrase_detected": False,
             "similarity_confidence": 0.0,
-            "negative_categories": None
+            "negative_categories": committed_merit.get("negative_categories"),
+            "merit_fresh": True,
+            "self_reported_treasure": None,
+            "self_report_confidence": 0.0,
+            "deadline": time.monotonic() + settings.turn_deadline_seconds if settings.turn_deadline_seconds > 0 else None,
+            "degraded_nodes": []
         }
         
+        # Fresh per-turn record of which model served each role (filled in by OpenRouterService)
+        served: Dict[str, str] = {}
+        served_models.set(served)
+        
         # Run graph
         final_state = await self.graph.ainvoke(initial_state)
         
@@ -301,6 +641,9 @@ class ConversationGraph:
             "is_blocked": final_state["is_blocked"],
             "similar_treasure_phrase_detected": final_state.get("similar_treasure_phrase_detected", False),
             "similarity_confidence": final_state.get("similarity_confidence", 0.0),
-            "negative_categories": negative_categories
+            "negative_categories": negative_categories,
+            "merit_fresh": final_state.get("merit_fresh", True),
+            "degraded_nodes": final_state.get("degraded_nodes", []),
+            "served_models": dict(served)
         }
 
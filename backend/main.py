@@ -1,21 +1,116 @@
 """
 FastAPI main application
 """
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
-from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, Dict, Optional
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, Header, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse, PlainTextResponse
+from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from backend.models.game import GameRequest, ConversationRequest, ConversationResponse, GameState, AudioStreamRequest
-from backend.services.pirate_service import PirateService
-from backend.services.speech_to_text_service import SpeechToTextService
-from backend.services.gpt_audio_service import GPTAudioService
+from backend.models.game import GameRequest, ConversationRequest, ConversationResponse, GameState, AudioStreamRequest, HistoryPage
+from backend.services.admission import OverloadedError
+from backend.services.game_feed import TooManySubscribersError
+from backend.services.idempotency import IdempotencyConflictError
+from backend.services.upstream import upstream_scheduler
+from backend.services.metrics import registry
+from backend.services.tracing import tracer, new_turn_id
+from backend.services.cost_tracker import cost_tracker, BudgetSpentError
+from backend.services.log import get_logger, dropped_records as dropped_log_records
+from backend.services import json_codec
 from backend.config import settings
 import uvicorn
+import asyncio
 import base64
+import time
+
+if TYPE_CHECKING:
+    from backend.services.pirate_service import PirateService
+    from backend.services.speech_to_text_service import SpeechToTextService
+    from backend.services.gpt_audio_service import GPTAudioService
+
+log = get_logger("api")
+
+# Service singletons, built once per process by _build_services (None until then)
+pirate_service: Optional["PirateService"] = None
+speech_to_text_service: Optional["SpeechToTextService"] = None
+gpt_audio_service: Optional["GPTAudioService"] = None
+_services_built: Optional["asyncio.Future[None]"] = None
+
+
+def _build_services() -> None:
+    """Import and construct the services; langgraph and langchain_core load here, not at import"""
+    global pirate_service, speech_to_text_service, gpt_audio_service
+    started = time.perf_counter()
+    from backend.services.pirate_service import PirateService
+    from backend.services.speech_to_text_service import SpeechToTextService
+    service = PirateService()
+    speech_to_text_service = SpeechToTextService()
+    # PirateService already owns a GPTAudioService; the streaming endpoints share it
+    gpt_audio_service = service.gpt_audio_service
+    pirate_service = service
+    log.info("Services ready", seconds=round(time.perf_counter() - started, 3))
+
+
+def _start_building_services() -> "asyncio.Future[None]":
+    global _services_built
+    if _services_built is None:
+        _services_built = asyncio.ensure_future(asyncio.to_thread(_build_services))
+    return _services_built
+
+
+async def services_ready() -> None:
+    """Dependency of routes that use the services: waits for the startup build to finish"""
+    if pirate_service is None:
+        await asyncio.shield(_start_building_services())
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the configured JSON backend (orjson/msgspec when installed)"""
+
+    def render(self, content: Any) -> bytes:
+        return json_codec.dumps(content)
+
+
+def model_response(model: BaseModel, headers: Optional[Dict[str, str]] = None, **dump_options: Any) -> Response:
+    """
+    Response for a pydantic model serialized by pydantic-core in one pass
+
+    Returning a Response skips FastAPI's re-validation against response_model
+    and its jsonable_encoder walk, which for GameState covers the whole
+    conversation history; response_model still documents the schema.
+    """
+    return Response(model.model_dump_json(**dump_options), media_type="application/json", headers=headers)
+
+
+def _version_etag(version: int, *variant: Any) -> str:
+    """ETag for a response built from a game at `version`; variant lists the query parameters that shape the body"""
+    return '"' + "-".join(str(part) for part in (version, *variant)) + '"'
+
+
+def _not_modified(if_none_match: Optional[str], etag: str) -> Optional[Response]:
+    """304 response when the client's If-None-Match already names the current ETag"""
+    if not if_none_match:
+        return None
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if etag in candidates or "*" in candidates:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build in a worker thread without holding up startup: the port binds and /health answers
+    # while the heavy imports run, and the first request that needs a service waits for them
+    _start_building_services()
+    yield
+
 
 app = FastAPI(
     title="Outwit the AI Pirate Game API",
     description="API for the Outwit the AI Pirate conversation game",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # CORS middleware for Streamlit frontend
@@ -28,11 +123,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-pirate_service = PirateService()
-speech_to_text_service = SpeechToTextService()
-gpt_audio_service = GPTAudioService()
-
 
 @app.get("/")
 async def root():
@@ -50,7 +140,7 @@ async def health_check():
     return {"status": "healthy"}
 
 
-@app.post("/api/game/start", response_model=GameState)
+@app.post("/api/game/start", response_model=GameState, dependencies=[Depends(services_ready)])
 async def start_game(request: GameRequest):
     """Start a new game"""
     try:
@@ -58,37 +148,259 @@ async def start_game(request: GameRequest):
             difficulty=request.difficulty.value,
             pirate_name=request.pirate_name or "Kapitan"
         )
-        return game_state
+        return model_response(game_state)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/game/conversation", response_model=ConversationResponse)
-async def send_message(request: ConversationRequest):
-    """Send a message in the conversation"""
-    try:
+async def _run_turn(request: ConversationRequest) -> ConversationResponse:
+    turn_id = new_turn_id()
+    with tracer.start_trace("conversation_turn", trace_id=turn_id, game_id=request.game_id, turn_id=turn_id):
         response = await pirate_service.process_conversation(
             game_id=request.game_id,
             user_message=request.message,
             include_audio=request.include_audio
         )
-        return response
+    response.turn_id = turn_id
+    return response
+
+
+@app.post("/api/game/conversation", response_model=ConversationResponse, dependencies=[Depends(services_ready)])
+async def send_message(
+    request: ConversationRequest,
+    idempotency_key: Optional[str] = Header(default=None, max_length=255)
+):
+    """
+    Send a message in the conversation
+
+    With an Idempotency-Key header (or client_turn_id), a retry of the same
+    turn does not run it again: it waits for the original if that is still
+    running, or gets its stored response. Either way the response carries
+    Idempotent-Replayed: true.
+    """
+    key = idempotency_key or request.client_turn_id
+    try:
+        if key is None:
+            return model_response(await _run_turn(request))
+        response, duplicate = await pirate_service.idempotency.run(
+            (request.game_id, key),
+            (request.message, request.include_audio),
+            lambda: _run_turn(request)
+        )
+        if duplicate is None:
+            return model_response(response)
+        log.info("Duplicate conversation turn", game_id=request.game_id, turn_id=response.turn_id, outcome=duplicate)
+        return model_response(response, headers={"Idempotent-Replayed": "true"})
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except OverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except BudgetSpentError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/game/{game_id}", response_model=GameState)
-async def get_game_state(game_id: str):
-    """Get current game state"""
+@app.get("/api/stats/load", dependencies=[Depends(services_ready)])
+async def load_stats():
+    """Admission queue, idempotency keys, per-provider upstream concurrency and record/replay statistics"""
+    from backend.services.cassette import cassette
+    return {
+        "admission": pirate_service.admission.snapshot(),
+        "idempotency": pirate_service.idempotency.snapshot(),
+        "upstream": upstream_scheduler.snapshot(),
+        "cassette": cassette.stats if cassette is not None else None
+    }
+
+
+def _collect_service_metrics():
+    """Gauges and counters read from service statistics at scrape time"""
+    yield "pirate_log_records_dropped_total", "counter", "Log records dropped because the log writer fell behind", [
+        ({}, dropped_log_records())
+    ]
+
+    upstream = upstream_scheduler.snapshot()
+    in_flight, waiting, paused = [], [], []
+    for provider, queue in upstream.items():
+        paused.append(({"provider": provider}, int(queue["background_paused"])))
+        for cls, stats in queue["classes"].items():
+            in_flight.append(({"provider": provider, "priority": cls}, stats["in_flight"]))
+            waiting.append(({"provider": provider, "priority": cls}, stats["waiting"]))
+    yield "pirate_upstream_in_flight", "gauge", "Upstream requests holding a provider slot", in_flight
+    yield "pirate_upstream_waiting", "gauge", "Upstream requests waiting for a provider slot", waiting
+    yield "pirate_upstream_background_paused", "gauge", "Whether background upstream work is held back", paused
+
+    if pirate_service is None:
+        # Still building at startup; importing the services here would block the event loop
+        return
+    from backend.services.openrouter_service import OpenRouterService
+
+    feed = pirate_service.feed
+    yield "pirate_game_feed_subscribers", "gauge", "Open game change feed streams", [({}, feed.subscriber_count())]
+    yield "pirate_game_feed_events_total", "counter", "Game change events published", [({}, feed.stats["events"])]
+    yield "pirate_game_feed_dropped_subscribers_total", "counter", "Feed subscribers dropped for falling behind", [
+        ({}, feed.stats["dropped_subscribers"])
+    ]
+
+    idempotency = pirate_service.idempotency.snapshot()
+    yield "pirate_idempotent_duplicates_total", "counter", "Conversation turns answered without running again, by how", [
+        ({"outcome": "attached"}, idempotency["attached"]),
+        ({"outcome": "replayed"}, idempotency["replayed"])
+    ]
+    yield "pirate_idempotency_conflicts_total", "counter", "Idempotency keys reused for a different message", [
+        ({}, idempotency["conflicts"])
+    ]
+
+    admission = pirate_service.admission.snapshot()
+    yield "pirate_admission_in_flight", "gauge", "Conversation turns running", [({}, admission["in_flight"])]
+    yield "pirate_admission_queue_depth", "gauge", "Conversation turns waiting for a slot", [({}, admission["queue_depth"])]
+    yield "pirate_admission_rejected_total", "counter", "Conversation turns rejected by admission control", [
+        ({"reason": "queue_full"}, admission["rejected_queue_full"]),
+        ({"reason": "wait"}, admission["rejected_wait"])
+    ]
+
+    breakers = OpenRouterService.get_circuit_breaker_stats()
+    yield "pirate_circuit_open", "gauge", "Whether a model's circuit breaker rejects calls (half-open counts as open)", [
+        ({"model": model}, int(stats["state"] != "closed")) for model, stats in breakers.items()
+    ]
+
+    yield "pirate_json_parse_failures_total", "counter", "Structured LLM outputs that failed to parse", [
+        ({"model": model}, stats["failures"]) for model, stats in OpenRouterService.json_parse_stats.items()
+    ]
+
+    graph = pirate_service.conversation_graph
+    yield "pirate_graph_degraded_total", "counter", "Optional graph nodes skipped on deadline or error", [
+        ({"node": node}, count) for node, count in graph.degraded_counts.items()
+    ]
+    if graph.semantic_batcher is not None:
+        yield "pirate_semantic_batches_total", "counter", "Semantic check batches sent", [
+            ({}, graph.semantic_batcher.stats["batches"])
+        ]
+
+    routing = OpenRouterService.get_routing_stats()
+    yield "pirate_routing_expected_latency_seconds", "gauge", "Router's expected latency per model and role", [
+        ({"role": role, "model": model}, stats["expected_latency"])
+        for role, models in routing.items() for model, stats in models.items()
+    ]
+
+
+registry.add_collector(_collect_service_metrics)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/stats/costs")
+async def cost_stats():
+    """Token usage and cost across games, per difficulty and per model, with budget settings"""
+    return cost_tracker.snapshot()
+
+
+@app.get("/api/game/{game_id}/costs", dependencies=[Depends(services_ready)])
+async def get_game_costs(game_id: str):
+    """Token usage, cost and budget state of one game"""
+    if not pirate_service.get_game_state(game_id):
+        raise HTTPException(status_code=404, detail="Game not found")
+    usage = cost_tracker.game_snapshot(game_id)
+    if usage is None:
+        return {"game_id": game_id, "cost_usd": 0.0, "calls": 0, "budget_state": cost_tracker.budget_state(game_id)}
+    return usage
+
+
+@app.get("/api/game/{game_id}", response_model=GameState, dependencies=[Depends(services_ready)])
+async def get_game_state(
+    game_id: str,
+    include_history: bool = Query(default=True, description="Include conversation_history (see /history for pages of it)"),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """Get current game state; 304 when If-None-Match carries the current ETag (game version and include_history)"""
+    game_state = pirate_service.get_game_state(game_id)
+    if not game_state:
+        raise HTTPException(status_code=404, detail="Game not found")
+    etag = _version_etag(game_state.version, "full" if include_history else "summary")
+    not_modified = _not_modified(if_none_match, etag)
+    if not_modified is not None:
+        return not_modified
+    return model_response(
+        game_state,
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+        exclude=None if include_history else {"conversation_history"}
+    )
+
+
+@app.get("/api/game/{game_id}/events", dependencies=[Depends(services_ready)])
+async def game_events(game_id: str):
+    """
+    Server-sent events with the game's changes, instead of polling GET /api/game/{game_id}
+
+    The first event ("snapshot") carries the current version, total_turns and
+    score fields. Each "update" carries the new version plus only what changed:
+    new history messages under "turns" and changed fields. The stream ends after
+    the game is won or lost; a "dropped" event means this client fell too far
+    behind and should reload the game and subscribe again.
+    """
+    game_state = pirate_service.get_game_state(game_id)
+    if not game_state:
+        raise HTTPException(status_code=404, detail="Game not found")
+    feed = pirate_service.feed
+    if not feed.has_room(game_id):
+        raise HTTPException(status_code=429, detail="Too many feed subscribers for this game")
+
+    async def stream_events():
+        # Subscribed here rather than above so the subscription's lifetime is exactly the stream's
+        try:
+            subscription = feed.subscribe(game_state)
+        except TooManySubscribersError:
+            return
+        try:
+            async for frame in subscription.frames(settings.game_feed_keepalive_seconds):
+                yield frame
+        finally:
+            feed.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream_events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+@app.get("/api/game/{game_id}/history", response_model=HistoryPage, dependencies=[Depends(services_ready)])
+async def get_game_history(
+    game_id: str,
+    since_turn: int = Query(default=0, ge=0, description="First message to return (position in the history, from 0)"),
+    limit: int = Query(default=50, ge=1, le=500, description="Maximum number of messages to return"),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """
+    Page through the conversation history
+
+    Resume or poll with since_turn set to the previous page's next_turn. The
+    ETag covers the game version and the requested window (since_turn, limit),
+    so a 304 only ever answers a repeat of the same request on an unchanged
+    game, never the request for the next page.
+    """
     game_state = pirate_service.get_game_state(game_id)
     if not game_state:
         raise HTTPException(status_code=404, detail="Game not found")
-    return game_state
+    etag = _version_etag(game_state.version, since_turn, limit)
+    not_modified = _not_modified(if_none_match, etag)
+    if not_modified is not None:
+        return not_modified
+    page = pirate_service.get_history_page(game_id, since_turn=since_turn, limit=limit)
+    return model_response(page, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 
-@app.post("/api/speech-to-text")
+@app.post("/api/speech-to-text", dependencies=[Depends(services_ready)])
 async def speech_to_text(
     audio: UploadFile = File(...),
     format: str = Form(default="wav")
@@ -115,7 +427,7 @@ async def speech_to_text(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/game/conversation/stream-audio")
+@app.post("/api/game/conversation/stream-audio", dependencies=[Depends(services_ready)])
 async def stream_audio(request: AudioStreamRequest):
     """Stream audio for provided text using GPT Audio"""
     try:
@@ -125,15 +437,29 @@ async def stream_audio(request: AudioStreamRequest):
         
         # Stream audio chunks as Server-Sent Events
         async def generate_audio_stream():
-            try:
-                async for audio_chunk in gpt_audio_service.generate_audio_stream(text):
-                    # Encode chunk as base64 for SSE
-                    chunk_base64 = base64.b64encode(audio_chunk).decode('utf-8')
-                    yield f"data: {chunk_base64}\n\n"
-                yield "data: [DONE]\n\n"
-            except Exception as e:
-                error_msg = base64.b64encode(f"Error: {str(e)}".encode()).decode('utf-8')
-                yield f"data: ERROR:{error_msg}\n\n"
+            # Consumed by a single response task, so the root span may stay current across yields
+            with tracer.start_trace("audio_stream", turn_id=request.turn_id or "", chars=len(text)) as span:
+                started = time.perf_counter()
+                chunk_index = 0
+                try:
+                    async for audio_chunk in gpt_audio_service.generate_audio_stream(text):
+                        # Time to first byte of every chunk, relative to the start of the stream
+                        span.add_event(
+                            "audio_chunk",
+                            index=chunk_index,
+                            bytes=len(audio_chunk),
+                            ttfb_ms=round((time.perf_counter() - started) * 1000, 1)
+                        )
+                        chunk_index += 1
+                        # Encode chunk as base64 for SSE
+                        chunk_base64 = base64.b64encode(audio_chunk).decode('utf-8')
+                        yield f"data: {chunk_base64}\n\n"
+                    yield "data: [DONE]\n\n"
+                except Exception as e:
+                    span.set_attribute("error", str(e)[:200])
+                    error_msg = base64.b64encode(f"Error: {str(e)}".encode()).decode('utf-8')
+                    yield f"data: ERROR:{error_msg}\n\n"
+                span.set_attribute("chunks", chunk_index)
         
         return StreamingResponse(
             generate_audio_stream(),
@@ -150,7 +476,7 @@ async def stream_audio(request: AudioStreamRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/test/gpt-audio-stream")
+@app.post("/api/test/gpt-audio-stream", dependencies=[Depends(services_ready)])
 async def test_gpt_audio_stream(text: str):
     """Test endpoint for GPT Audio streaming"""
     try:
@@ -169,11 +495,9 @@ async def test_gpt_audio_stream(text: str):
                     chunk_base64 = base64.b64encode(audio_chunk).decode('utf-8')
                     yield f"data: {chunk_base64}\n\n"
                 yield f"data: [DONE]\n\n"
-                print(f"[Test] Stream completed: {chunk_count} chunks, {total_bytes} total bytes")
+                log.info("Test stream completed", chunks=chunk_count, bytes=total_bytes)
             except Exception as e:
-                import traceback
-                error_trace = traceback.format_exc()
-                print(f"[Test] Error in stream: {e}\n{error_trace}")
+                log.exception("Error in test stream", error=str(e))
                 error_msg = base64.b64encode(f"Error: {str(e)}".encode()).decode('utf-8')
                 yield f"data: ERROR:{error_msg}\n\n"
         
@@ -187,8 +511,7 @@ async def test_gpt_audio_stream(text: str):
             }
         )
     except Exception as e:
-        import traceback
-        print(f"[Test] Endpoint error: {e}\n{traceback.format_exc()}")
+        log.exception("Test endpoint error", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -20,13 +20,18 @@ class GameState(BaseModel):
     difficulty: DifficultyLevel = Field(default=DifficultyLevel.EASY)
     conversation_history: List[Dict[str, str]] = Field(default_factory=list)
     merit_score: int = Field(default=0, ge=-100, le=100, description="Deception/misguidance score (-100 to +100)")
+    merit_has_earned_it: bool = Field(default=False, description="Last committed judge verdict on reaching the win threshold")
+    negative_categories: Optional[Dict[str, int]] = Field(default=None, description="Last committed negative point categories breakdown")
     player_personas: List[str] = Field(default_factory=list, description="Personas/identities player has claimed (may be false)")
     strategies_attempted: List[str] = Field(default_factory=list, description="Deception strategies attempted")
+    pinned_facts: List[str] = Field(default_factory=list, description="Player claims kept in context even after old turns are evicted")
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
     is_won: bool = Field(default=False, description="Whether player won by reaching deception threshold")
     is_lost: bool = Field(default=False, description="Whether player lost by falling below loss threshold")
     win_phrase_detected: bool = Field(default=False, description="Whether pirate said the treasure phrase")
+    budget_exhausted: bool = Field(default=False, description="Whether the game was ended because its cost budget was spent")
+    version: int = Field(default=0, description="Incremented on every change to the game; used as its ETag")
 
 
 class Message(BaseModel):
@@ -47,11 +52,17 @@ class ConversationRequest(BaseModel):
     game_id: str = Field(..., description="Game identifier")
     message: str = Field(..., description="User message")
     include_audio: bool = Field(default=False, description="Include TTS audio response")
+    client_turn_id: Optional[str] = Field(
+        default=None,
+        max_length=255,
+        description="Client-generated ID for this turn, used like the Idempotency-Key header when that is absent"
+    )
 
 
 class AudioStreamRequest(BaseModel):
     """Request to stream TTS audio for a given text"""
     text: str = Field(..., description="Text to convert to speech")
+    turn_id: Optional[str] = Field(default=None, description="Turn the audio belongs to, recorded on the audio trace")
 
 
 class ConversationResponse(BaseModel):
@@ -65,6 +76,30 @@ class ConversationResponse(BaseModel):
     is_lost: bool = Field(default=False, description="Whether player lost (score below loss threshold)")
     win_phrase_detected: bool = Field(default=False, description="Whether pirate said the treasure phrase")
     negative_categories: Optional[Dict[str, int]] = Field(default=None, description="Negative point categories breakdown")
+    degraded: bool = Field(default=False, description="Whether any step ran out of time budget and used a fallback")
+    degraded_nodes: List[str] = Field(default_factory=list, description="Graph nodes that used their degrade path")
+    served_models: Dict[str, str] = Field(default_factory=dict, description="Model that actually served each role this turn (generation, judge, semantic_check)")
+    turn_id: Optional[str] = Field(default=None, description="Turn identifier, also the trace ID when the turn was sampled")
+    budget_downgraded: bool = Field(default=False, description="Whether this turn ran on cheaper models because the cost budget was spent")
+    budget_exhausted: bool = Field(default=False, description="Whether the game has ended because its cost budget was spent")
+    version: int = Field(default=0, description="Game version after this turn")
+
+
+class HistoryTurn(BaseModel):
+    """One message of the conversation history"""
+    turn: int = Field(..., description="Position in the conversation history, from 0")
+    role: str = Field(..., description="Role: 'user' or 'pirate'")
+    content: str = Field(..., description="Message content")
+
+
+class HistoryPage(BaseModel):
+    """A window of the conversation history"""
+    game_id: str
+    version: int = Field(..., description="Game version the page was read at")
+    total_turns: int = Field(..., description="Messages in the conversation history")
+    turns: List[HistoryTurn] = Field(default_factory=list)
+    next_turn: int = Field(..., description="since_turn for the next page (or the next poll once has_more is false)")
+    has_more: bool = Field(..., description="Whether messages after this page already exist")
 
 
 class MeritEvaluation(BaseModel):
@@ -87,6 +122,7 @@ class MeritEvaluation(BaseModel):
     has_earned_it: bool = Field(..., description="Whether deception score is high enough to win")
     has_lost: bool = Field(default=False, description="Whether deception score is below loss threshold")
     feedback: str = Field(..., description="Feedback for pirate behavior adjustment")
+    evaluation_model: Optional[str] = Field(default=None, description="Model that produced the verdict (None for heuristic fallback)")
 
 
 
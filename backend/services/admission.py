@@ -0,0 +1,115 @@
+"""
+Admission control - bounded queue in front of conversation turns with fail-fast overload rejection
+"""
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+from backend.config import settings
+
+
+class OverloadedError(Exception):
+    """Raised when a turn is rejected because the server is at capacity"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Limits how many conversation turns run at once
+
+    Up to max_in_flight turns run concurrently and up to max_queue wait for
+    a slot. A turn is rejected right away when the queue is full or when
+    its expected wait (turns ahead of it times the smoothed turn duration,
+    divided by the number of slots) exceeds max_wait_seconds; a queued turn
+    that still waits longer than max_wait_seconds is rejected as well.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        max_wait_seconds: Optional[float] = None
+    ):
+        self.max_in_flight = max_in_flight or settings.admission_max_in_flight
+        self.max_queue = max_queue if max_queue is not None else settings.admission_max_queue
+        self.max_wait_seconds = max_wait_seconds or settings.admission_max_wait_seconds
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self.in_flight = 0
+        self._pending = 0  # Admitted past the checks, not yet holding a slot
+        self._service_time = 2.0  # EWMA of turn duration, seconds (initial guess)
+        self._wait_time = 0.0  # EWMA of queue wait, seconds
+        self.stats: Dict[str, float] = {"admitted": 0, "rejected_queue_full": 0, "rejected_wait": 0, "max_wait_seconds": 0.0}
+
+    @property
+    def queue_depth(self) -> int:
+        """Turns waiting because every slot is taken"""
+        return max(0, self.in_flight + self._pending - self.max_in_flight)
+
+    def expected_wait(self) -> float:
+        """Estimated queueing delay for a turn arriving now"""
+        # Turns that must finish before this one gets a slot
+        ahead = self.in_flight + self._pending + 1 - self.max_in_flight
+        if ahead <= 0:
+            return 0.0
+        return ahead * self._service_time / self.max_in_flight
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """
+        Run the enclosed turn once a slot is free
+
+        Raises:
+            OverloadedError: If the turn is rejected (queue full or wait too long)
+        """
+        expected = self.expected_wait()
+        if self.queue_depth >= self.max_queue:
+            self.stats["rejected_queue_full"] += 1
+            raise OverloadedError("Server busy: admission queue full", self._retry_after(expected))
+        if expected > self.max_wait_seconds:
+            self.stats["rejected_wait"] += 1
+            raise OverloadedError(f"Server busy: expected wait {expected:.1f}s", self._retry_after(expected))
+
+        started = time.monotonic()
+        self._pending += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            self.stats["rejected_wait"] += 1
+            raise OverloadedError("Server busy: timed out waiting for a slot", self._retry_after(self.expected_wait()))
+        finally:
+            self._pending -= 1
+
+        waited = time.monotonic() - started
+        self._wait_time = 0.2 * waited + 0.8 * self._wait_time
+        self.stats["admitted"] += 1
+        self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], waited)
+        self.in_flight += 1
+        run_started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+            self._service_time = 0.2 * (time.monotonic() - run_started) + 0.8 * self._service_time
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Queue depth, wait time and rejection counts"""
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "expected_wait_seconds": round(self.expected_wait(), 3),
+            "avg_wait_seconds": round(self._wait_time, 3),
+            "avg_turn_seconds": round(self._service_time, 3),
+            **self.stats
+        }
+
+    @staticmethod
+    def _retry_after(expected_wait: float) -> int:
+        """Retry-After value in whole seconds (at least 1)"""
+        return max(1, math.ceil(expected_wait))
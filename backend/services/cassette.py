@@ -0,0 +1,247 @@
+"""
+Cassette - record and replay upstream HTTP traffic (OpenRouter, Kie.ai) for deterministic benchmarks
+"""
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+import httpx
+from backend.config import settings
+from backend.services.log import get_logger
+
+log = get_logger("cassette")
+
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+
+# Response headers worth keeping; everything else is reproduced by httpx itself
+KEPT_HEADERS = ("content-type", "content-encoding", "retry-after")
+
+
+def request_key(request: httpx.Request) -> str:
+    """
+    Hash of a normalized request
+
+    The host is left out so a cassette recorded against the real providers
+    replays behind any base URL; query parameters and JSON bodies are sorted
+    so key order does not matter.
+    """
+    url = urlsplit(str(request.url))
+    query = sorted(parse_qsl(url.query, keep_blank_values=True))
+    body = request.content
+    if body:
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        except ValueError:
+            pass
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {url.path} {query}\n".encode("utf-8"))
+    digest.update(body or b"")
+    return digest.hexdigest()[:32]
+
+
+def _encode_chunk(chunk: bytes) -> Any:
+    try:
+        return chunk.decode("utf-8")
+    except UnicodeDecodeError:
+        return {"b64": base64.b64encode(chunk).decode("ascii")}
+
+
+def _decode_chunk(chunk: Any) -> bytes:
+    if isinstance(chunk, dict):
+        return base64.b64decode(chunk["b64"])
+    return chunk.encode("utf-8")
+
+
+class Cassette:
+    """
+    On-disk list of request/response interactions (JSONL, gzipped when the path ends in .gz)
+
+    Each interaction stores the request key, status, a few headers, the time
+    until headers arrived and the response body as chunks with their time
+    offsets, so streams replay with their original pacing. Identical
+    requests (e.g. repeated Kie.ai status polls) replay in recorded order;
+    once they run out, the last one is served again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._interactions: Optional[Dict[str, Deque[Dict[str, Any]]]] = None
+        self._last: Dict[str, Dict[str, Any]] = {}
+        self._write_lock = threading.Lock()
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+
+    def _open(self, mode: str):
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, mode + "t", encoding="utf-8")
+        return open(self.path, mode, encoding="utf-8")
+
+    def append(self, interaction: Dict[str, Any]) -> None:
+        line = json.dumps(interaction, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._write_lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # One gzip member per append; gzip readers concatenate members transparently
+            with self._open("a") as f:
+                f.write(line)
+        self.stats["recorded"] += 1
+
+    def next_for(self, key: str) -> Optional[Dict[str, Any]]:
+        """Next recorded interaction for a request key, or None on a miss"""
+        if self._interactions is None:
+            self._load()
+        queue = self._interactions.get(key)
+        if queue:
+            self._last[key] = queue.popleft()
+            self.stats["replayed"] += 1
+            return self._last[key]
+        if key in self._last:
+            self.stats["replayed"] += 1
+            return self._last[key]
+        self.stats["misses"] += 1
+        return None
+
+    def _load(self) -> None:
+        self._interactions = {}
+        if not os.path.exists(self.path):
+            log.warning("Cassette not found, every request will miss", path=self.path)
+            return
+        with self._open("r") as f:
+            for line in f:
+                if line.strip():
+                    interaction = json.loads(line)
+                    self._interactions.setdefault(interaction["key"], deque()).append(interaction)
+        log.info("Cassette loaded", path=self.path, interactions=sum(len(q) for q in self._interactions.values()))
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+    """Passes the upstream body through while noting each chunk and its time offset"""
+
+    def __init__(self, inner: httpx.AsyncByteStream, on_close):
+        self._inner = inner
+        self._on_close = on_close
+        self._chunks: List[Tuple[float, Any]] = []
+        self._started = time.monotonic()
+        self._complete = False
+        self._closed = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._inner:
+            self._chunks.append((round(time.monotonic() - self._started, 4), _encode_chunk(chunk)))
+            yield chunk
+        self._complete = True
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+        if not self._closed:
+            self._closed = True
+            # An early-closed stream is recorded as far as it was read; replays stop there too
+            self._on_close(self._chunks, self._complete)
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    """Serves recorded chunks, optionally at their recorded pace"""
+
+    def __init__(self, chunks: List[List[Any]], paced: bool):
+        self._chunks = chunks
+        self._paced = paced
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        started = time.monotonic()
+        for offset, chunk in self._chunks:
+            if self._paced:
+                delay = started + offset - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield _decode_chunk(chunk)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class CassetteTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that records to or replays from a cassette
+
+    In record mode requests go to the wrapped transport and every exchange
+    is appended to the cassette when its body is closed. In replay mode no
+    network is used: a request missing from the cassette gets a 404 (which
+    callers treat as non-retryable) so a stale cassette fails fast.
+    """
+
+    def __init__(self, cassette: Cassette, mode: str, paced: bool = True, inner: Optional[httpx.AsyncBaseTransport] = None):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode '{mode}', expected 'record' or 'replay'")
+        self.cassette = cassette
+        self.mode = mode
+        self.paced = paced
+        self._inner = inner or (httpx.AsyncHTTPTransport() if mode == RECORD else None)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request)
+        if self.mode == REPLAY:
+            return await self._replay(request, key)
+
+        started = time.monotonic()
+        response = await self._inner.handle_async_request(request)
+        headers_after = round(time.monotonic() - started, 4)
+        headers = {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers}
+
+        def on_close(chunks: List[Tuple[float, Any]], complete: bool) -> None:
+            self.cassette.append({
+                "key": key,
+                "method": request.method,
+                "path": request.url.path,
+                "status": response.status_code,
+                "headers": headers,
+                "headers_after": headers_after,
+                "chunks": chunks,
+                "complete": complete
+            })
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response.stream, on_close),
+            extensions=response.extensions
+        )
+
+    async def _replay(self, request: httpx.Request, key: str) -> httpx.Response:
+        interaction = self.cassette.next_for(key)
+        if interaction is None:
+            log.warning("Cassette miss", method=request.method, path=request.url.path)
+            return httpx.Response(
+                status_code=404,
+                json={"error": {"message": f"Cassette miss for {request.method} {request.url.path}"}},
+                request=request
+            )
+        if self.paced and interaction["headers_after"] > 0:
+            await asyncio.sleep(interaction["headers_after"])
+        return httpx.Response(
+            status_code=interaction["status"],
+            headers=interaction["headers"],
+            stream=_ReplayStream(interaction["chunks"], self.paced),
+            request=request
+        )
+
+    async def aclose(self) -> None:
+        if self._inner is not None:
+            await self._inner.aclose()
+
+
+# Shared by every upstream client in the process (None when CASSETTE_MODE is off)
+cassette = Cassette(settings.cassette_path) if settings.cassette_mode != OFF else None
+
+
+def cassette_transport() -> Optional[CassetteTransport]:
+    """Transport for a new upstream client, or None to use httpx's default"""
+    if cassette is None:
+        return None
+    return CassetteTransport(cassette, settings.cassette_mode, paced=settings.cassette_replay_timing == "recorded")
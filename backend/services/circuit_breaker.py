@@ -0,0 +1,143 @@
+"""
+Circuit breakers for upstream models - stop sending traffic to a model that is failing or hanging
+"""
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from backend.config import settings
+from backend.services.log import get_logger
+
+log = get_logger("circuit_breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker driven by error rate and slow-call rate
+
+    Outcomes of the last `window_size` calls are kept. Once at least
+    `min_calls` are recorded and the share of failures (errors plus calls
+    slower than `slow_call_seconds`) reaches `failure_rate_threshold`, the
+    breaker opens and rejects calls for `open_seconds`. After that it lets
+    `half_open_probes` trial calls through: a success closes it again, a
+    failure re-opens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: Optional[float] = None,
+        slow_call_seconds: Optional[float] = None,
+        window_size: Optional[int] = None,
+        min_calls: Optional[int] = None,
+        open_seconds: Optional[float] = None,
+        half_open_probes: Optional[int] = None
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold or settings.circuit_failure_rate
+        self.slow_call_seconds = slow_call_seconds or settings.circuit_slow_call_seconds
+        self.min_calls = min_calls or settings.circuit_min_calls
+        self.open_seconds = open_seconds or settings.circuit_open_seconds
+        self.half_open_probes = half_open_probes or settings.circuit_half_open_probes
+        self.state = CLOSED
+        self._outcomes: Deque[bool] = deque(maxlen=window_size or settings.circuit_window_size)
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self.times_opened = 0
+
+    def allow_request(self) -> bool:
+        """
+        Whether a call may be sent now
+
+        In half-open state this reserves one of the probe slots, so callers
+        must report the outcome with record_success/record_failure.
+        """
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                return False
+            self.state = HALF_OPEN
+            self._probes_in_flight = 0
+            log.info("Circuit half-open, probing", breaker=self.name)
+
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_probes:
+                return False
+            self._probes_in_flight += 1
+        return True
+
+    def is_available(self) -> bool:
+        """Non-reserving check used to rank candidates (an expired open breaker counts as available)"""
+        if self.state == OPEN:
+            return time.monotonic() - self._opened_at >= self.open_seconds
+        if self.state == HALF_OPEN:
+            return self._probes_in_flight < self.half_open_probes
+        return True
+
+    def record_success(self, latency: float) -> None:
+        """Record a completed call; calls slower than slow_call_seconds count as failures"""
+        if latency >= self.slow_call_seconds:
+            self.record_failure(f"slow call ({latency:.1f}s)")
+            return
+        if self.state == HALF_OPEN:
+            self._close()
+            return
+        self._outcomes.append(True)
+
+    def record_failure(self, reason: str = "") -> None:
+        """Record a failed call and open the breaker if the failure rate is too high"""
+        if self.state == HALF_OPEN:
+            self._open(f"probe failed: {reason}")
+            return
+        self._outcomes.append(False)
+        if len(self._outcomes) >= self.min_calls:
+            failures = self._outcomes.count(False)
+            if failures / len(self._outcomes) >= self.failure_rate_threshold:
+                self._open(f"{failures}/{len(self._outcomes)} recent calls failed, last: {reason}")
+
+    def release_probe(self) -> None:
+        """Give back a half-open probe slot for a call that ended without a verdict (cancelled, client error)"""
+        if self.state == HALF_OPEN and self._probes_in_flight > 0:
+            self._probes_in_flight -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current state for diagnostics"""
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            "recent_calls": calls,
+            "failure_rate": self._outcomes.count(False) / calls if calls else 0.0,
+            "times_opened": self.times_opened
+        }
+
+    def _open(self, reason: str) -> None:
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._probes_in_flight = 0
+        self.times_opened += 1
+        log.warning("Circuit opened", breaker=self.name, open_seconds=self.open_seconds, reason=reason)
+
+    def _close(self) -> None:
+        self.state = CLOSED
+        self._outcomes.clear()
+        self._probes_in_flight = 0
+        log.info("Circuit closed", breaker=self.name)
+
+
+class CircuitBreakerRegistry:
+    """One breaker per upstream model, created on first use"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = CircuitBreaker(name)
+        return breaker
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """State of every known breaker"""
+        return {name: breaker.snapshot() for name, breaker in self._breakers.items()}
@@ -0,0 +1,267 @@
+"""
+Context builder - token-budgeted conversation context with pinned facts and rolling summaries
+"""
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from backend.config import settings
+from backend.services.upstream import BACKGROUND
+from backend.services.log import get_logger
+
+log = get_logger("context")
+
+# Fixed per-message overhead (role markers, separators) in estimated tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate token count of a text locally (no tokenizer download needed)
+
+    Polish text with diacritics splits into more BPE tokens than English,
+    so we take the larger of a character-based and a word-based estimate.
+    The estimate is deliberately pessimistic to keep prompts under budget.
+
+    Args:
+        text: Text to estimate
+
+    Returns:
+        Estimated number of tokens
+    """
+    if not text:
+        return 0
+    by_chars = (len(text) + 2) // 3
+    by_words = (len(text.split()) * 5 + 2) // 3
+    return max(by_chars, by_words)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text so that its estimated token count fits in max_tokens"""
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # Character budget matches the char-based estimate, then shrink for word-heavy text
+    cut = text[:max_tokens * 3]
+    while cut and estimate_tokens(cut + "…") > max_tokens:
+        cut = cut[:int(len(cut) * 0.9)]
+    return cut.rstrip() + "…" if cut else ""
+
+
+@dataclass
+class ConversationContext:
+    """Result of building a budgeted context for a single LLM call"""
+    messages: List[Dict[str, str]]
+    summary: str = ""
+    pinned_facts: List[str] = field(default_factory=list)
+    evicted_count: int = 0
+    estimated_tokens: int = 0
+
+
+@dataclass
+class _RollingSummary:
+    """Rolling summary of the turns one game's contexts of one token budget evicted"""
+    text: str = ""
+    covered: int = 0  # Number of leading history entries folded into text
+    target: int = 0  # Highest eviction point requested so far
+    task: Optional[asyncio.Task] = None
+
+
+class ContextBuilder:
+    """Builds bounded conversation contexts and maintains rolling summaries of evicted turns"""
+
+    def __init__(self, llm_service=None):
+        self.llm_service = llm_service
+        self.summary_model = settings.context_summary_model
+        self.summary_max_tokens = settings.context_summary_max_tokens
+        self.pinned_max_tokens = settings.context_pinned_max_tokens
+        # game_id -> token_budget -> summary: generation and the judge keep different
+        # amounts of history, so each budget folds in exactly the turns it evicted
+        self._summaries: Dict[str, Dict[int, _RollingSummary]] = {}
+
+    def build(
+        self,
+        conversation_history: List[Dict[str, str]],
+        token_budget: int,
+        game_id: Optional[str] = None,
+        pinned_facts: Optional[List[str]] = None
+    ) -> ConversationContext:
+        """
+        Build a context that fits in the token budget
+
+        Recent messages are kept newest-first until the budget runs out. Older
+        messages are represented by the rolling summary for the game (updated
+        in the background) and pinned facts are always included, each capped by
+        its own budget, so the total size per call is bounded.
+
+        Args:
+            conversation_history: Full history with 'role' and 'content'
+            token_budget: Budget for verbatim recent messages
+            game_id: Game identifier used to key the rolling summary
+            pinned_facts: Facts that must survive eviction (claimed personas, strategies)
+
+        Returns:
+            ConversationContext with kept messages, summary and pinned facts
+        """
+        kept, evicted_count = self._select_recent(conversation_history, token_budget)
+        pinned = self._select_pinned(pinned_facts or [])
+
+        summary = ""
+        if evicted_count:
+            summary = self._summary_for(game_id, token_budget, conversation_history, evicted_count)
+
+        estimated = sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in kept)
+        estimated += estimate_tokens(summary) + sum(estimate_tokens(f) for f in pinned)
+
+        return ConversationContext(
+            messages=kept,
+            summary=summary,
+            pinned_facts=pinned,
+            evicted_count=evicted_count,
+            estimated_tokens=estimated
+        )
+
+    def forget(self, game_id: str) -> None:
+        """Drop rolling summary state for a finished or removed game"""
+        for entry in self._summaries.pop(game_id, {}).values():
+            if entry.task and not entry.task.done():
+                entry.task.cancel()
+
+    def _select_recent(
+        self,
+        conversation_history: List[Dict[str, str]],
+        token_budget: int
+    ) -> Tuple[List[Dict[str, str]], int]:
+        """Keep the newest non-empty messages that fit the budget; return (kept, evicted_count)"""
+        kept: List[Dict[str, str]] = []
+        used = 0
+        index = len(conversation_history)
+
+        while index > 0:
+            msg = conversation_history[index - 1]
+            content = (msg.get("content") or "").strip()
+            if not content:
+                index -= 1
+                continue
+
+            cost = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+            if used + cost > token_budget:
+                if not kept:
+                    # Always keep the latest message, truncated to whatever fits
+                    content = truncate_to_tokens(content, token_budget - MESSAGE_OVERHEAD_TOKENS)
+                    if content:
+                        kept.append({"role": msg.get("role", "user"), "content": content})
+                    index -= 1
+                break
+
+            kept.append({"role": msg.get("role", "user"), "content": content})
+            used += cost
+            index -= 1
+
+        kept.reverse()
+        return kept, index
+
+    def _select_pinned(self, pinned_facts: List[str]) -> List[str]:
+        """Keep the earliest pinned facts that fit the pinned budget"""
+        selected = []
+        used = 0
+        for fact in pinned_facts:
+            cost = estimate_tokens(fact)
+            if used + cost > self.pinned_max_tokens:
+                break
+            selected.append(fact)
+            used += cost
+        return selected
+
+    def _summary_for(
+        self,
+        game_id: Optional[str],
+        token_budget: int,
+        conversation_history: List[Dict[str, str]],
+        evicted_count: int
+    ) -> str:
+        """Return the current summary for evicted turns and schedule a refresh if it lags behind"""
+        entry = (
+            self._summaries.setdefault(game_id, {}).setdefault(token_budget, _RollingSummary())
+            if game_id else _RollingSummary()
+        )
+
+        # Turns evicted but not yet folded into the summary get a cheap local digest
+        pending_digest = self._local_digest(conversation_history[entry.covered:evicted_count])
+        text = "\n".join(part for part in (entry.text, pending_digest) if part)
+
+        if game_id and evicted_count > entry.covered:
+            entry.target = max(entry.target, evicted_count)
+            self._schedule_update(game_id, entry, conversation_history)
+
+        return truncate_to_tokens(text, self.summary_max_tokens)
+
+    def _local_digest(self, messages: List[Dict[str, str]]) -> str:
+        """Extractive fallback: one short line per evicted player message"""
+        lines = []
+        for msg in messages:
+            if msg.get("role") != "user":
+                continue
+            content = " ".join((msg.get("content") or "").split())
+            if content:
+                lines.append(f"- Gracz: {truncate_to_tokens(content, 24)}")
+        return "\n".join(lines)
+
+    def _schedule_update(
+        self,
+        game_id: str,
+        entry: _RollingSummary,
+        conversation_history: List[Dict[str, str]]
+    ) -> None:
+        """Start a background summary refresh unless one is already running"""
+        if self.llm_service is None or (entry.task and not entry.task.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        # Snapshot the slice now: the history list keeps growing while the task runs
+        start, end = entry.covered, entry.target
+        evicted = [dict(m) for m in conversation_history[start:end]]
+        entry.task = loop.create_task(self._update_summary(game_id, entry, evicted, end))
+
+    async def _update_summary(
+        self,
+        game_id: str,
+        entry: _RollingSummary,
+        evicted: List[Dict[str, str]],
+        new_covered: int
+    ) -> None:
+        """Fold newly evicted turns into the rolling summary using a cheap model"""
+        transcript = []
+        for msg in evicted:
+            speaker = "Pirat" if msg.get("role") == "pirate" else "Gracz"
+            transcript.append(f"{speaker}: {msg.get('content', '')}")
+
+        prompt = f"""Aktualizujesz zwięzłe streszczenie wcześniejszej części rozmowy gracza z piratem.
+
+Dotychczasowe streszczenie:
+{entry.text or 'brak'}
+
+Nowe wiadomości do uwzględnienia:
+{chr(10).join(transcript)}
+
+Napisz nowe streszczenie (maksymalnie 5 krótkich punktów). Zachowaj kim gracz się podawał, jakie historie opowiadał i jakie strategie stosował - to ważne do wykrywania sprzeczności. Zwróć TYLKO punkty streszczenia."""
+
+        try:
+            response = await self.llm_service.generate_response(
+                messages=[
+                    {"role": "system", "content": "Streszczasz rozmowy zwięźle i rzeczowo, po polsku."},
+                    {"role": "user", "content": prompt}
+                ],
+                model=self.summary_model,
+                temperature=0.2,
+                max_tokens=self.summary_max_tokens,
+                priority=BACKGROUND
+            )
+            if response and response.strip():
+                entry.text = truncate_to_tokens(response.strip(), self.summary_max_tokens)
+                entry.covered = new_covered
+        except Exception as e:
+            # Keep the previous summary; the local digest covers the gap until the next build
+            log.warning("Rolling summary update failed", game_id=game_id, error=str(e))
@@ -0,0 +1,231 @@
+"""
+Cost accounting - token usage and spend per game, difficulty and model, with budget enforcement
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, Optional
+from backend.config import MODEL_PRICING, settings
+
+BUDGET_OK = "ok"
+BUDGET_DOWNGRADE = "downgrade"
+BUDGET_END = "end"
+
+
+class BudgetSpentError(Exception):
+    """Raised when a turn is refused because today's global budget is spent; the game itself carries on tomorrow"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class UsageTotals:
+    """Accumulated tokens and cost of a set of calls"""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    calls: int = 0
+
+    def add(self, prompt_tokens: int, completion_tokens: int, cost_usd: float) -> None:
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cost_usd += cost_usd
+        self.calls += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "calls": self.calls
+        }
+
+
+@dataclass
+class GameUsage:
+    """Usage of one game, broken down by model and role"""
+    game_id: str
+    difficulty: str
+    totals: UsageTotals = field(default_factory=UsageTotals)
+    by_model: Dict[str, UsageTotals] = field(default_factory=dict)
+    by_role: Dict[str, UsageTotals] = field(default_factory=dict)
+    downgraded: bool = False
+
+
+# Game whose turn is running in this context (inherited by tasks the turn spawns, e.g. lagged judges)
+_current_game: ContextVar[Optional[GameUsage]] = ContextVar("current_game", default=None)
+
+
+class CostTracker:
+    """
+    Accumulates OpenRouter usage and enforces spending budgets
+
+    Cost is taken from usage.cost when OpenRouter reports it, otherwise it
+    is estimated from MODEL_PRICING. Once a game's spend reaches the
+    per-game budget, or today's (UTC) spend across all games reaches the
+    global daily budget, the configured action applies to the game's next
+    turns: "downgrade" switches every call to the difficulty's budget_model,
+    "end" ends the game, or, when only the global budget is spent, refuses
+    turns until the next UTC day without ending anything.
+    """
+
+    def __init__(
+        self,
+        per_game_budget: Optional[float] = None,
+        global_daily_budget: Optional[float] = None,
+        action: Optional[str] = None
+    ):
+        self.per_game_budget = per_game_budget if per_game_budget is not None else settings.budget_per_game_usd
+        self.global_daily_budget = (
+            global_daily_budget if global_daily_budget is not None else settings.budget_global_daily_usd
+        )
+        self.action = action or settings.budget_action
+        if self.action not in (BUDGET_DOWNGRADE, BUDGET_END):
+            raise ValueError(f"Unknown budget action '{self.action}', expected 'downgrade' or 'end'")
+        self.games: Dict[str, GameUsage] = {}
+        self.by_difficulty: Dict[str, UsageTotals] = {}
+        self.by_model: Dict[str, UsageTotals] = {}
+        self.totals = UsageTotals()
+        self._day = self._today()
+        self.today = UsageTotals()
+        self.unpriced_calls = 0
+
+    @contextmanager
+    def game_scope(self, game_id: str, difficulty: str) -> Iterator[GameUsage]:
+        """Attribute usage recorded inside the block (and tasks it starts) to the game"""
+        usage = self.games.get(game_id)
+        if usage is None:
+            usage = self.games[game_id] = GameUsage(game_id=game_id, difficulty=difficulty)
+        token = _current_game.set(usage)
+        try:
+            yield usage
+        finally:
+            _current_game.reset(token)
+
+    def record(self, model: str, role: Optional[str], usage: Dict[str, Any]) -> float:
+        """
+        Fold one OpenRouter usage object into the totals
+
+        Args:
+            model: Model that served the call
+            role: Call role ("generation", "judge", ...), or None
+            usage: OpenRouter usage object
+
+        Returns:
+            Cost of the call in USD (reported or estimated)
+        """
+        prompt_tokens = int(usage.get("prompt_tokens") or 0)
+        completion_tokens = int(usage.get("completion_tokens") or 0)
+        cost = self.cost_of(model, usage)
+
+        self._roll_day()
+        self.totals.add(prompt_tokens, completion_tokens, cost)
+        self.today.add(prompt_tokens, completion_tokens, cost)
+        self.by_model.setdefault(model, UsageTotals()).add(prompt_tokens, completion_tokens, cost)
+
+        game = _current_game.get()
+        if game is not None:
+            game.totals.add(prompt_tokens, completion_tokens, cost)
+            game.by_model.setdefault(model, UsageTotals()).add(prompt_tokens, completion_tokens, cost)
+            game.by_role.setdefault(role or "other", UsageTotals()).add(prompt_tokens, completion_tokens, cost)
+            self.by_difficulty.setdefault(game.difficulty, UsageTotals()).add(prompt_tokens, completion_tokens, cost)
+        return cost
+
+    def cost_of(self, model: str, usage: Dict[str, Any]) -> float:
+        """Reported cost, or an estimate from MODEL_PRICING (0 for unknown models)"""
+        if usage.get("cost") is not None:
+            return float(usage["cost"])
+        pricing = MODEL_PRICING.get(model)
+        if pricing is None:
+            self.unpriced_calls += 1
+            return 0.0
+        return (
+            (usage.get("prompt_tokens") or 0) * pricing["prompt"]
+            + (usage.get("completion_tokens") or 0) * pricing["completion"]
+        ) / 1_000_000
+
+    def budget_state(self, game_id: str) -> str:
+        """BUDGET_OK, or the configured action once the game's or today's budget is spent"""
+        if self.game_budget_spent(game_id) or self.global_budget_spent():
+            return self.action
+        return BUDGET_OK
+
+    def game_budget_spent(self, game_id: str) -> bool:
+        """Whether the game has spent its own budget"""
+        game = self.games.get(game_id)
+        return bool(self.per_game_budget) and game is not None and game.totals.cost_usd >= self.per_game_budget
+
+    def global_budget_spent(self) -> bool:
+        """Whether today's (UTC) spend across all games has reached the global daily budget"""
+        self._roll_day()
+        return bool(self.global_daily_budget) and self.today.cost_usd >= self.global_daily_budget
+
+    @staticmethod
+    def seconds_until_reset() -> int:
+        """Whole seconds until the global daily budget resets at UTC midnight (at least 1)"""
+        now = datetime.now(timezone.utc)
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+        return max(1, int((midnight - now).total_seconds()) + 1)
+
+    def forget(self, game_id: str) -> None:
+        """Drop a removed game's usage; its spend stays in the global, difficulty and model totals"""
+        self.games.pop(game_id, None)
+
+    @staticmethod
+    def is_downgraded() -> bool:
+        """Whether the game whose turn is running has been switched to budget models"""
+        game = _current_game.get()
+        return game is not None and game.downgraded
+
+    def game_snapshot(self, game_id: str) -> Optional[Dict[str, Any]]:
+        """Usage of one game, or None if it has not made any tracked call"""
+        game = self.games.get(game_id)
+        if game is None:
+            return None
+        return {
+            "game_id": game_id,
+            "difficulty": game.difficulty,
+            **game.totals.to_dict(),
+            "by_model": {model: totals.to_dict() for model, totals in game.by_model.items()},
+            "by_role": {role: totals.to_dict() for role, totals in game.by_role.items()},
+            "budget_usd": self.per_game_budget or None,
+            "budget_state": self.budget_state(game_id),
+            "downgraded": game.downgraded
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Totals across games, per difficulty and per model, and budget settings"""
+        self._roll_day()
+        games = [game.totals.cost_usd for game in self.games.values() if game.totals.calls]
+        return {
+            "total": self.totals.to_dict(),
+            "today": {"date": self._day, **self.today.to_dict()},
+            "by_difficulty": {difficulty: totals.to_dict() for difficulty, totals in self.by_difficulty.items()},
+            "by_model": {model: totals.to_dict() for model, totals in self.by_model.items()},
+            "games": len(games),
+            "avg_game_cost_usd": round(sum(games) / len(games), 6) if games else 0.0,
+            "max_game_cost_usd": round(max(games), 6) if games else 0.0,
+            "unpriced_calls": self.unpriced_calls,
+            "budgets": {
+                "per_game_usd": self.per_game_budget or None,
+                "global_daily_usd": self.global_daily_budget or None,
+                "action": self.action
+            }
+        }
+
+    def _roll_day(self) -> None:
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self.today = UsageTotals()
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(timezone.utc).date().isoformat()
+
+
+# Shared by every service in the process
+cost_tracker = CostTracker()
@@ -5,6 +5,10 @@ import httpx
 import asyncio
 from typing import Optional
 from backend.config import settings, ELEVENLABS_VOICES
+from backend.services.upstream import upstream_scheduler, upstream_client, KIE_AI, INTERACTIVE_AUDIO
+from backend.services.metrics import TTS_QUEUE_SECONDS, TTS_SYNTHESIS_SECONDS, TTS_SECONDS
+from backend.services.tracing import tracer
+from backend.services import json_codec
 
 
 class ElevenLabsService:
@@ -12,7 +16,7 @@ class ElevenLabsService:
     
     def __init__(self):
         self.api_key = settings.kie_ai_api_key
-        self.base_url = "https://api.kie.ai/api/v1"
+        self.base_url = settings.kie_ai_base_url
         self.model = settings.elevenlabs_model
         self.default_voice = settings.elevenlabs_voice
         self.language_code = settings.elevenlabs_language_code
@@ -25,7 +29,8 @@ class ElevenLabsService:
         similarity_boost: float = 0.75,
         style: float = 0.0,
         speed: float = 1.0,
-        callback_url: Optional[str] = None
+        callback_url: Optional[str] = None,
+        priority: str = INTERACTIVE_AUDIO
     ) -> dict:
         """
         Create a TTS task via Kie.ai API
@@ -38,6 +43,7 @@ class ElevenLabsService:
             style: Style exaggeration (0-1)
             speed: Speech speed (0.7-1.2)
             callback_url: Optional callback URL for completion
+            priority: Upstream scheduler class
             
         Returns:
             Task creation response with taskId
@@ -74,21 +80,24 @@ class ElevenLabsService:
             "Authorization": f"Bearer {self.api_key}"
         }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{self.base_url}/jobs/createTask",
-                json=payload,
-                headers=headers
-            )
-            response.raise_for_status()
-            return response.json()
+        with tracer.span("kie_ai.create_task", model=self.model, chars=len(text), priority=priority) as span:
+            async with upstream_scheduler.slot(KIE_AI, priority), upstream_client(timeout=30.0) as client:
+                response = await client.post(
+                    f"{self.base_url}/jobs/createTask",
+                    content=json_codec.dumps(payload),
+                    headers=headers
+                )
+                span.set_attribute("http.status_code", response.status_code)
+                response.raise_for_status()
+                return json_codec.loads(response.content)
     
-    async def get_task_status(self, task_id: str) -> dict:
+    async def get_task_status(self, task_id: str, priority: str = INTERACTIVE_AUDIO) -> dict:
         """
         Get status of a TTS task
         
         Args:
             task_id: Task identifier from create_tts_task
+            priority: Upstream scheduler class
             
         Returns:
             Task status and result if completed
@@ -100,21 +109,26 @@ class ElevenLabsService:
             "Authorization": f"Bearer {self.api_key}"
         }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{self.base_url}/jobs/recordInfo",
-                params={"taskId": task_id},
-                headers=headers
-            )
-            response.raise_for_status()
-            return response.json()
+        with tracer.span("kie_ai.poll", task_id=task_id, priority=priority) as span:
+            async with upstream_scheduler.slot(KIE_AI, priority), upstream_client(timeout=30.0) as client:
+                response = await client.get(
+                    f"{self.base_url}/jobs/recordInfo",
+                    params={"taskId": task_id},
+                    headers=headers
+                )
+                span.set_attribute("http.status_code", response.status_code)
+                response.raise_for_status()
+                result = json_codec.loads(response.content)
+                span.set_attribute("state", str(result.get("data", {}).get("state")))
+                return result
     
     async def generate_speech(
         self,
         text: str,
         voice: Optional[str] = None,
         wait_for_completion: bool = True,
-        max_wait_time: int = 60
+        max_wait_time: int = 60,
+        priority: str = INTERACTIVE_AUDIO
     ) -> Optional[str]:
         """
         Generate speech and wait for completion
@@ -124,12 +138,16 @@ class ElevenLabsService:
             voice: Voice name (optional)
             wait_for_completion: Whether to wait for task completion
             max_wait_time: Maximum seconds to wait
+            priority: Upstream scheduler class (BACKGROUND for pre-rendering)
             
         Returns:
             Audio URL if completed, None if async
         """
+        import time
+        created_at = time.time()
+
         # Create task
-        task_response = await self.create_tts_task(text, voice=voice)
+        task_response = await self.create_tts_task(text, voice=voice, priority=priority)
         task_id = task_response.get("data", {}).get("taskId")
         
         if not task_id:
@@ -139,31 +157,53 @@ class ElevenLabsService:
             return None  # Return task_id for async processing
             
         # Poll for completion
-        import time
         start_time = time.time()
+        generating_at = None
         
         while time.time() - start_time < max_wait_time:
-            status_response = await self.get_task_status(task_id)
+            status_response = await self.get_task_status(task_id, priority=priority)
             data = status_response.get("data", {})
             state = data.get("state")
             
+            if state == "generating" and generating_at is None:
+                generating_at = time.time()
+            
             if state == "success":
+                self._observe_tts(created_at, generating_at, "ok")
                 result_json = data.get("resultJson", "{}")
-                import json
-                result = json.loads(result_json)
+                result = json_codec.loads(result_json)
                 result_urls = result.get("resultUrls", [])
                 if result_urls:
                     return result_urls[0]  # Return first audio URL
                     
             elif state == "failed":
+                self._observe_tts(created_at, generating_at, "error")
                 fail_msg = data.get("failMsg", "Unknown error")
                 raise Exception(f"TTS task failed: {fail_msg}")
                 
             # Wait before next poll
             await asyncio.sleep(2)
             
+        self._observe_tts(created_at, generating_at, "timeout")
         raise TimeoutError(f"TTS task did not complete within {max_wait_time} seconds")
 
+    @staticmethod
+    def _observe_tts(created_at: float, generating_at: Optional[float], outcome: str) -> None:
+        """
+        Record TTS timings; queue/synthesis split only when a poll saw the task generating
+
+        Args:
+            created_at: Wall time before the task was created
+            generating_at: Wall time of the first poll reporting "generating", if any
+            outcome: "ok", "error" or "timeout"
+        """
+        import time
+        now = time.time()
+        TTS_SECONDS.observe(now - created_at, provider=KIE_AI, outcome=outcome)
+        if generating_at is not None and outcome == "ok":
+            TTS_QUEUE_SECONDS.observe(generating_at - created_at)
+            TTS_SYNTHESIS_SECONDS.observe(now - generating_at)
+
 
 
 
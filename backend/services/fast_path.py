@@ -0,0 +1,62 @@
+"""
+Fast paths - turns answered without the conversation graph: finished games and repeated messages
+"""
+import hashlib
+import itertools
+import re
+import unicodedata
+from typing import Dict, List
+
+FINISHED_REPLIES = {
+    "won": "Arrr, skarb już jest twój, marynarzu. Ta gra skończona, zacznij nową!",
+    "lost": "Arrr, przejrzałem cię na wylot i ta rozmowa skończona. Zacznij nową grę, jeśli się odważysz!"
+}
+
+# Rotated by how many times the message was already sent
+REPEAT_REPLIES = [
+    "Arrr, to już słyszałem, szczurze lądowy. Powiedz coś nowego albo zejdź z mojego pokładu!",
+    "Znowu to samo? Papuga na moim ramieniu ma bogatszy repertuar niż ty!",
+    "Powtarzanie tych samych słów nie otworzy mojej skrzyni. Kapitan się nudzi..."
+]
+
+_NOT_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase, without diacritics, punctuation or extra whitespace, so near-identical pastes compare equal"""
+    decomposed = unicodedata.normalize("NFKD", message.lower().replace("ł", "l"))
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _NOT_WORD.sub(" ", stripped).strip()
+
+
+def message_digest(normalized: str) -> bytes:
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).digest()
+
+
+def count_repeats(history: List[Dict[str, str]], message: str, window: int, min_chars: int) -> int:
+    """
+    How many of the player's last `window` messages match `message` after normalization
+
+    Messages shorter than min_chars once normalized ("tak", "nie") never count,
+    since answering the pirate's questions the same way is not spam. Only
+    messages the pirate answered count: one left unanswered by a failed turn
+    is what the player retries, not a repeat.
+    """
+    normalized = normalize_message(message)
+    if window <= 0 or len(normalized) < min_chars:
+        return 0
+    digest = message_digest(normalized)
+    answered = (
+        history[index]["content"]
+        for index in range(len(history) - 2, -1, -1)
+        if history[index].get("role") == "user" and history[index + 1].get("role") == "pirate"
+    )
+    return sum(message_digest(normalize_message(content)) == digest for content in itertools.islice(answered, window))
+
+
+def repeat_reply(repeats: int) -> str:
+    return REPEAT_REPLIES[(repeats - 1) % len(REPEAT_REPLIES)]
+
+
+def finished_reply(is_won: bool) -> str:
+    return FINISHED_REPLIES["won" if is_won else "lost"]
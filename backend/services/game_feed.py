@@ -0,0 +1,184 @@
+"""
+Game feed - pushes compact game-state change events to SSE subscribers
+"""
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+from backend.config import settings
+from backend.models.game import GameState
+from backend.services import json_codec
+
+# Fields whose changes are pushed; turns are sent separately as new history messages
+TRACKED_FIELDS = ("merit_score", "negative_categories", "is_won", "is_lost", "win_phrase_detected", "budget_exhausted")
+
+
+class TooManySubscribersError(Exception):
+    """Raised when a game already has the maximum number of feed subscribers"""
+
+
+def _frame(event: str, version: int, data: Dict[str, Any]) -> str:
+    """One SSE frame; the version doubles as the event ID"""
+    return f"id: {version}\nevent: {event}\ndata: {json_codec.dumps_str(data)}\n\n"
+
+
+class Subscription:
+    """
+    One subscriber's bounded queue of encoded SSE frames
+
+    A None in the queue ends the stream. One slot beyond max_queue is kept
+    free for it, so ending never blocks.
+    """
+
+    def __init__(self, game_id: str, max_queue: int):
+        self.game_id = game_id
+        self.max_queue = max_queue
+        self._queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=max_queue + 1)
+        self.closed = False
+
+    def offer(self, frame: str) -> bool:
+        """Queue a frame; False when the subscriber is max_queue frames behind"""
+        if self.closed:
+            return True
+        if self._queue.qsize() >= self.max_queue:
+            return False
+        self._queue.put_nowait(frame)
+        return True
+
+    def close(self, final_frame: Optional[str] = None, discard_pending: bool = False) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        if discard_pending:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+        if final_frame is not None:
+            self._queue.put_nowait(final_frame)
+        self._queue.put_nowait(None)
+
+    async def frames(self, keepalive_seconds: float) -> AsyncIterator[str]:
+        """Frames until the subscription ends, with SSE comments as keepalives while idle"""
+        while True:
+            try:
+                frame = await asyncio.wait_for(self._queue.get(), timeout=keepalive_seconds)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if frame is None:
+                return
+            yield frame
+
+
+class GameFeed:
+    """
+    Per-game change feed
+
+    PirateService publishes after every change it commits (the player's
+    message, the end of a turn). Each event carries only what changed since
+    the previous one: new history messages and tracked fields with new
+    values. An event is encoded once and shared by every subscriber. A
+    subscriber that falls max_queue events behind is dropped: its pending
+    events are discarded and it gets a final "dropped" event, after which
+    the client resyncs from GET /api/game/{game_id} and resubscribes.
+    """
+
+    def __init__(self, max_queue: Optional[int] = None, max_subscribers: Optional[int] = None):
+        self.max_queue = max_queue or settings.game_feed_queue_size
+        self.max_subscribers = max_subscribers or settings.game_feed_max_subscribers
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        # Last state published per game with subscribers: tracked field values and history length
+        self._published: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"events": 0, "dropped_subscribers": 0, "rejected_subscribers": 0}
+
+    @staticmethod
+    def _snapshot(game_state: GameState) -> Dict[str, Any]:
+        snapshot = {field: getattr(game_state, field) for field in TRACKED_FIELDS}
+        if snapshot["negative_categories"] is not None:
+            # Copied so a later in-place update still shows up as a change
+            snapshot["negative_categories"] = dict(snapshot["negative_categories"])
+        snapshot["total_turns"] = len(game_state.conversation_history)
+        return snapshot
+
+    def has_room(self, game_id: str) -> bool:
+        """Whether the game can take another subscriber"""
+        return len(self._subscribers.get(game_id, ())) < self.max_subscribers
+
+    def is_followed(self, game_id: str) -> bool:
+        """Whether the game has at least one subscriber"""
+        return bool(self._subscribers.get(game_id))
+
+    def subscribe(self, game_state: GameState) -> Subscription:
+        """
+        Subscribe to a game's changes; the first frame is a snapshot of its current state
+
+        Args:
+            game_state: Game to follow
+
+        Returns:
+            The subscription; pass it to unsubscribe() when the stream ends
+
+        Raises:
+            TooManySubscribersError: If the game already has max_subscribers subscribers
+        """
+        game_id = game_state.game_id
+        if not self.has_room(game_id):
+            self.stats["rejected_subscribers"] += 1
+            raise TooManySubscribersError(f"Game {game_id} already has {self.max_subscribers} feed subscribers")
+        subscription = Subscription(game_id, self.max_queue)
+        snapshot = self._snapshot(game_state)
+        subscribers = self._subscribers.setdefault(game_id, set())
+        if not subscribers:
+            self._published[game_id] = snapshot
+        subscribers.add(subscription)
+        subscription.offer(_frame("snapshot", game_state.version, {"version": game_state.version, **snapshot}))
+        if game_state.is_won or game_state.is_lost or game_state.budget_exhausted:
+            subscription.close()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscription.close()
+        subscribers = self._subscribers.get(subscription.game_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.game_id]
+            self._published.pop(subscription.game_id, None)
+
+    def publish(self, game_state: GameState) -> None:
+        """Push what changed in a game since its previous event to every subscriber"""
+        subscribers = self._subscribers.get(game_state.game_id)
+        if not subscribers:
+            return
+        previous = self._published[game_state.game_id]
+        current = self._snapshot(game_state)
+        self._published[game_state.game_id] = current
+
+        data: Dict[str, Any] = {"version": game_state.version}
+        history = game_state.conversation_history
+        if current["total_turns"] > previous["total_turns"]:
+            data["turns"] = [
+                {"turn": turn, "role": history[turn]["role"], "content": history[turn]["content"]}
+                for turn in range(previous["total_turns"], current["total_turns"])
+            ]
+        for field in TRACKED_FIELDS:
+            if current[field] != previous[field]:
+                data[field] = current[field]
+        frame = _frame("update", game_state.version, data)
+        self.stats["events"] += 1
+
+        ended = game_state.is_won or game_state.is_lost or game_state.budget_exhausted
+        slow: List[Subscription] = []
+        for subscription in subscribers:
+            if not subscription.offer(frame):
+                slow.append(subscription)
+            elif ended:
+                # Nothing follows a finished game; end the stream after this event
+                subscription.close()
+        for subscription in slow:
+            self.stats["dropped_subscribers"] += 1
+            subscription.close(
+                _frame("dropped", game_state.version, {"version": game_state.version, "reason": "slow_consumer"}),
+                discard_pending=True
+            )
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
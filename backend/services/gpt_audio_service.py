@@ -4,10 +4,15 @@ Supports streaming audio generation
 """
 import httpx
 import base64
-import json
 from typing import Optional, AsyncIterator, Dict, Any, List
 from backend.config import settings
 from backend.services.elevenlabs_service import ElevenLabsService
+from backend.services.upstream import upstream_scheduler, upstream_client, OPENROUTER, KIE_AI, INTERACTIVE_AUDIO
+from backend.services.tracing import tracer
+from backend.services.log import get_logger
+from backend.services import json_codec
+
+log = get_logger("gpt_audio")
 
 
 class GPTAudioService:
@@ -33,18 +38,21 @@ class GPTAudioService:
 
         audio_url = await self.elevenlabs_service.generate_speech(
             text=text.strip(),
-            wait_for_completion=True
+            wait_for_completion=True,
+            priority=INTERACTIVE_AUDIO
         )
         if not audio_url:
             raise ValueError("Kie.ai TTS error: No audio URL returned")
 
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            async with client.stream("GET", audio_url) as response:
-                response.raise_for_status()
-                audio_bytes = await response.aread()
-                if not audio_bytes:
-                    raise ValueError("Kie.ai TTS error: Empty audio content")
-                return audio_bytes
+        with tracer.span("kie_ai.download_audio") as span:
+            async with upstream_scheduler.slot(KIE_AI, INTERACTIVE_AUDIO), upstream_client(timeout=120.0) as client:
+                async with client.stream("GET", audio_url) as response:
+                    response.raise_for_status()
+                    audio_bytes = await response.aread()
+                    span.set_attribute("bytes", len(audio_bytes))
+                    if not audio_bytes:
+                        raise ValueError("Kie.ai TTS error: Empty audio content")
+                    return audio_bytes
         
     async def generate_audio_stream(
         self,
@@ -108,139 +116,141 @@ class GPTAudioService:
 
         # Provider requirement: streaming audio only supports pcm16
         if payload["audio"]["format"] != "pcm16":
-            print(f"[GPT Audio] Overriding audio.format '{payload['audio']['format']}' -> 'pcm16' for stream=true")
+            log.debug("Overriding audio format to pcm16 for streaming", requested_format=payload["audio"]["format"])
             payload["audio"]["format"] = "pcm16"
         
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            try:
-                async with client.stream(
-                    "POST",
-                    f"{self.base_url}/chat/completions",
-                    json=payload,
-                    headers=headers
-                ) as response:
-                    if response.status_code != 200:
-                        error_bytes = await response.aread()
-                        error_text = error_bytes.decode("utf-8", errors="replace")[:1000]
-                        print(f"[GPT Audio] Non-200 response ({response.status_code}): {error_text}")
-                        raise ValueError(f"GPT Audio API error: HTTP {response.status_code}: {error_text}")
+        # Not activated: this generator runs in the consumer's context between yields
+        with tracer.span("openrouter.audio_stream", activate=False, model=self.model) as span:
+            async with upstream_scheduler.slot(OPENROUTER, INTERACTIVE_AUDIO), upstream_client(timeout=120.0) as client:
+                try:
+                    async with client.stream(
+                        "POST",
+                        f"{self.base_url}/chat/completions",
+                        content=json_codec.dumps(payload),
+                        headers=headers
+                    ) as response:
+                        if response.status_code != 200:
+                            error_bytes = await response.aread()
+                            error_text = error_bytes.decode("utf-8", errors="replace")[:1000]
+                            log.warning("Audio stream rejected", status=response.status_code, error=error_text)
+                            raise ValueError(f"GPT Audio API error: HTTP {response.status_code}: {error_text}")
                     
-                    response.raise_for_status()
+                        response.raise_for_status()
                     
-                    chunk_count = 0
-                    line_count = 0
-                    async for line in response.aiter_lines():
-                        line_count += 1
-                        if not line.strip():
-                            continue
+                        chunk_count = 0
+                        line_count = 0
+                        async for line in response.aiter_lines():
+                            line_count += 1
+                            if not line.strip():
+                                continue
                             
-                        # Parse SSE format: "data: {...}"
-                        if line.startswith("data: "):
-                            data_str = line[6:]  # Remove "data: " prefix
+                            # Parse SSE format: "data: {...}"
+                            if line.startswith("data: "):
+                                data_str = line[6:]  # Remove "data: " prefix
                             
-                            if data_str == "[DONE]":
-                                print(f"[GPT Audio] Stream completed. Total chunks: {chunk_count}, Total lines: {line_count}")
-                                break
+                                if data_str == "[DONE]":
+                                    log.debug("Audio stream completed", chunks=chunk_count, lines=line_count)
+                                    break
                                 
-                            try:
-                                data = json.loads(data_str)
+                                try:
+                                    data = json_codec.loads(data_str)
                                 
-                                # Debug: log full structure for first few chunks
-                                if chunk_count < 2:
-                                    print(f"[GPT Audio] Raw data keys: {list(data.keys())}")
+                                    # Debug: log full structure for first few chunks
+                                    if chunk_count < 2:
+                                        log.debug("Raw stream data", keys=list(data.keys()))
                                 
-                                choices = data.get("choices", [])
+                                    choices = data.get("choices", [])
                                 
-                                if choices:
-                                    delta = choices[0].get("delta", {})
+                                    if choices:
+                                        delta = choices[0].get("delta", {})
                                     
-                                    # Debug: log delta structure
-                                    if chunk_count < 3:  # Log first 3 chunks for debugging
-                                        print(f"[GPT Audio] Chunk {chunk_count} delta keys: {list(delta.keys())}")
-                                        if "audio" not in delta:
-                                            print(f"[GPT Audio] Chunk {chunk_count} full delta: {delta}")
+                                        # Debug: log delta structure
+                                        if chunk_count < 3:  # Log first 3 chunks for debugging
+                                            log.debug("Stream delta", chunk=chunk_count, keys=list(delta.keys()))
+                                            if "audio" not in delta:
+                                                log.debug("Stream delta without audio", chunk=chunk_count, delta=delta)
                                     
-                                    # Check for audio data - format: {"audio": {"id": "...", "data": "base64...", "transcript": "..."}}
-                                    audio_data = delta.get("audio")
-                                    if audio_data:
-                                        chunk_count += 1
-                                        # Audio should be a dict with "id", "data", "transcript"
-                                        if isinstance(audio_data, dict):
-                                            # Format: {"id": "...", "data": "base64...", "transcript": "..."}
-                                            audio_base64 = audio_data.get("data", "")
-                                            if audio_base64:
+                                        # Check for audio data - format: {"audio": {"id": "...", "data": "base64...", "transcript": "..."}}
+                                        audio_data = delta.get("audio")
+                                        if audio_data:
+                                            chunk_count += 1
+                                            if chunk_count == 1:
+                                                span.add_event("first_audio_chunk")
+                                            # Audio should be a dict with "id", "data", "transcript"
+                                            if isinstance(audio_data, dict):
+                                                # Format: {"id": "...", "data": "base64...", "transcript": "..."}
+                                                audio_base64 = audio_data.get("data", "")
+                                                if audio_base64:
+                                                    try:
+                                                        audio_bytes = base64.b64decode(audio_base64)
+                                                        log.debug("Decoded audio chunk", chunk=chunk_count, bytes=len(audio_bytes))
+                                                        yield audio_bytes
+                                                    except Exception as e:
+                                                        log.warning("Failed to decode base64 audio", chunk=chunk_count, error=str(e))
+                                                        continue
+                                                else:
+                                                    log.debug("Audio delta has no data field", chunk=chunk_count, keys=list(audio_data.keys()))
+                                            elif isinstance(audio_data, str):
+                                                # Direct base64 string (fallback)
                                                 try:
-                                                    audio_bytes = base64.b64decode(audio_base64)
-                                                    print(f"[GPT Audio] ✅ Decoded audio chunk {chunk_count}, size: {len(audio_bytes)} bytes")
+                                                    audio_bytes = base64.b64decode(audio_data)
+                                                    log.debug("Decoded audio chunk", chunk=chunk_count, bytes=len(audio_bytes), format="string")
                                                     yield audio_bytes
                                                 except Exception as e:
-                                                    print(f"[GPT Audio] ❌ Failed to decode base64 audio: {e}")
+                                                    log.warning("Failed to decode base64 audio string", chunk=chunk_count, error=str(e))
                                                     continue
-                                            else:
-                                                print(f"[GPT Audio] ⚠️ Audio dict has no 'data' field. Keys: {list(audio_data.keys())}")
-                                        elif isinstance(audio_data, str):
-                                            # Direct base64 string (fallback)
-                                            try:
-                                                audio_bytes = base64.b64decode(audio_data)
-                                                print(f"[GPT Audio] ✅ Decoded audio chunk {chunk_count} (string format), size: {len(audio_bytes)} bytes")
-                                                yield audio_bytes
-                                            except Exception as e:
-                                                print(f"[GPT Audio] ❌ Failed to decode base64 audio string: {e}")
-                                                continue
-                                    else:
-                                        # Check for other content types - might be text-only response
-                                        if "content" in delta:
-                                            if chunk_count < 3:
-                                                print(f"[GPT Audio] ⚠️ Chunk {chunk_count} has text content only, no audio. Delta keys: {list(delta.keys())}")
-                                        # Check if this is the first chunk with model info
-                                        if "role" in delta and chunk_count == 0:
-                                            print(f"[GPT Audio] First chunk - role: {delta.get('role')}")
+                                        else:
+                                            # Check for other content types - might be text-only response
+                                            if "content" in delta:
+                                                if chunk_count < 3:
+                                                    log.debug("Stream delta has text only", chunk=chunk_count, keys=list(delta.keys()))
+                                            # Check if this is the first chunk with model info
+                                            if "role" in delta and chunk_count == 0:
+                                                log.debug("First stream delta", role=delta.get("role"))
                                     
-                                    # Also check for transcript (optional)
-                                    transcript = delta.get("transcript", "")
-                                    if transcript:
-                                        if chunk_count < 3:
-                                            print(f"[GPT Audio] Transcript chunk: {transcript[:50]}")
+                                        # Also check for transcript (optional)
+                                        transcript = delta.get("transcript", "")
+                                        if transcript:
+                                            if chunk_count < 3:
+                                                log.debug("Transcript chunk", transcript=transcript[:50])
                                         
-                            except json.JSONDecodeError as e:
-                                print(f"[GPT Audio] Failed to parse JSON: {e}, line: {line[:200]}")
-                                continue
+                                except json_codec.DecodeError as e:
+                                    log.warning("Failed to parse stream line", error=str(e), line=line[:200])
+                                    continue
                     
-                    if chunk_count == 0:
-                        print(f"[GPT Audio] WARNING: No audio chunks received!")
+                        if chunk_count == 0:
+                            log.warning("Audio stream ended without audio chunks", model=self.model)
                                 
-            except httpx.HTTPStatusError as e:
-                error_detail = f"HTTP {e.response.status_code}"
-                try:
-                    # Read error response if possible
-                    if hasattr(e.response, 'read'):
-                        try:
-                            error_text = e.response.read().decode('utf-8')[:500]
+                except httpx.HTTPStatusError as e:
+                    error_detail = f"HTTP {e.response.status_code}"
+                    try:
+                        # Read error response if possible
+                        if hasattr(e.response, 'read'):
                             try:
-                                error_body = json.loads(error_text)
-                                if "error" in error_body:
-                                    error_detail = error_body["error"].get("message", str(error_body["error"]))
-                                elif "detail" in error_body:
-                                    error_detail = error_body["detail"]
-                                else:
+                                error_text = e.response.read().decode('utf-8')[:500]
+                                try:
+                                    error_body = json_codec.loads(error_text)
+                                    if "error" in error_body:
+                                        error_detail = error_body["error"].get("message", str(error_body["error"]))
+                                    elif "detail" in error_body:
+                                        error_detail = error_body["detail"]
+                                    else:
+                                        error_detail = error_text
+                                except:
                                     error_detail = error_text
                             except:
-                                error_detail = error_text
-                        except:
+                                error_detail = str(e)
+                        else:
                             error_detail = str(e)
-                    else:
-                        error_detail = str(e)
-                except Exception as read_error:
-                    print(f"[GPT Audio] Could not read error response: {read_error}")
-                    error_detail = f"HTTP {e.response.status_code}: {str(e)}"
-                raise ValueError(f"GPT Audio API error: {error_detail}")
-            except httpx.RequestError as e:
-                raise ValueError(f"Request to GPT Audio API failed: {str(e)}")
-            except Exception as e:
-                print(f"[GPT Audio] Unexpected error in generate_audio_stream: {e}")
-                import traceback
-                traceback.print_exc()
-                raise
+                    except Exception as read_error:
+                        log.warning("Could not read error response", error=str(read_error))
+                        error_detail = f"HTTP {e.response.status_code}: {str(e)}"
+                    raise ValueError(f"GPT Audio API error: {error_detail}")
+                except httpx.RequestError as e:
+                    raise ValueError(f"Request to GPT Audio API failed: {str(e)}")
+                except Exception as e:
+                    log.exception("Unexpected error in audio stream", error=str(e))
+                    raise
     
     async def generate_audio_complete(
         self,
@@ -0,0 +1,105 @@
+"""
+Idempotency keys - one execution per client-supplied key, shared by duplicates and replayed for a TTL
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from backend.config import settings
+
+ATTACHED = "attached"
+REPLAYED = "replayed"
+
+
+class IdempotencyConflictError(Exception):
+    """Raised when a key is reused for a request with a different body"""
+
+
+class IdempotencyCache:
+    """
+    Runs each keyed operation once
+
+    The first request with a key starts the operation as its own task, so it
+    keeps running when that client disconnects. A duplicate arriving while
+    it runs waits for the same task (attached); one arriving after it
+    succeeded gets the stored result for ttl_seconds (replayed). Failures
+    are not stored: duplicates already waiting see the same error, later
+    ones run the operation again. A key reused with a different fingerprint
+    (request body) is a client bug and is rejected. At most max_keys
+    results are kept, the oldest dropped first.
+    """
+
+    def __init__(self, ttl_seconds: Optional[float] = None, max_keys: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds or settings.idempotency_ttl_seconds
+        self.max_keys = max_keys or settings.idempotency_max_keys
+        self._in_flight: Dict[Hashable, Tuple[Hashable, "asyncio.Task[Any]"]] = {}
+        # key -> (fingerprint, result, expires at), ordered by completion so expired entries are at the front
+        self._done: "OrderedDict[Hashable, Tuple[Hashable, Any, float]]" = OrderedDict()
+        self.stats = {"executed": 0, ATTACHED: 0, REPLAYED: 0, "conflicts": 0}
+
+    async def run(
+        self,
+        key: Hashable,
+        fingerprint: Hashable,
+        operation: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, Optional[str]]:
+        """
+        Run operation once per key
+
+        Args:
+            key: Idempotency key, scoped by the caller (e.g. with the game ID)
+            fingerprint: Identifies the request body; duplicates must match it
+            operation: Starts the work; only called for the first request with the key
+
+        Returns:
+            (result, None) for the request that ran the operation, or
+            (result, ATTACHED / REPLAYED) for a duplicate
+
+        Raises:
+            IdempotencyConflictError: If the key was used with a different fingerprint
+        """
+        self._expire()
+        done = self._done.get(key)
+        if done is not None:
+            self._check(fingerprint, done[0])
+            self.stats[REPLAYED] += 1
+            return done[1], REPLAYED
+
+        running = self._in_flight.get(key)
+        if running is not None:
+            self._check(fingerprint, running[0])
+            self.stats[ATTACHED] += 1
+            # Shielded so a waiter that goes away does not cancel the shared task
+            return await asyncio.shield(running[1]), ATTACHED
+
+        task = asyncio.ensure_future(operation())
+        self._in_flight[key] = (fingerprint, task)
+        self.stats["executed"] += 1
+        task.add_done_callback(lambda finished: self._finish(key, fingerprint, finished))
+        return await asyncio.shield(task), None
+
+    def _check(self, fingerprint: Hashable, stored: Hashable) -> None:
+        if fingerprint != stored:
+            self.stats["conflicts"] += 1
+            raise IdempotencyConflictError("Idempotency key was already used for a different request")
+
+    def _finish(self, key: Hashable, fingerprint: Hashable, task: "asyncio.Task[Any]") -> None:
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._done[key] = (fingerprint, task.result(), time.monotonic() + self.ttl_seconds)
+        self._done.move_to_end(key)
+        while len(self._done) > self.max_keys:
+            self._done.popitem(last=False)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self._done:
+            key, (_, _, expires_at) = next(iter(self._done.items()))
+            if expires_at > now:
+                break
+            del self._done[key]
+
+    def snapshot(self) -> Dict[str, int]:
+        """Stored and running keys, executions and duplicates"""
+        return {"stored": len(self._done), "in_flight": len(self._in_flight), **self.stats}
@@ -0,0 +1,75 @@
+"""
+JSON codec - orjson or msgspec when installed, the standard library otherwise
+
+Used for API responses, upstream request bodies and upstream (SSE) responses.
+Output is compact UTF-8. orjson and msgspec keep non-ASCII characters as-is;
+the stdlib fallback escapes them, which keeps json's C encoder on its fast path.
+"""
+import json
+from typing import Any, Callable, Optional, Union
+from backend.config import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+ORJSON = "orjson"
+MSGSPEC = "msgspec"
+STDLIB = "stdlib"
+
+
+def _select_backend(requested: str) -> str:
+    available = {ORJSON: orjson is not None, MSGSPEC: msgspec is not None, STDLIB: True}
+    if requested == "auto":
+        return next(name for name in (ORJSON, MSGSPEC, STDLIB) if available[name])
+    if requested not in available:
+        raise ValueError(f"Unknown JSON backend '{requested}', expected auto, orjson, msgspec or stdlib")
+    if not available[requested]:
+        raise ValueError(f"JSON backend '{requested}' is not installed")
+    return requested
+
+
+BACKEND = _select_backend(settings.json_backend)
+
+if BACKEND == ORJSON:
+    # Subclass of json.JSONDecodeError, so callers may catch either
+    DecodeError: type = orjson.JSONDecodeError
+
+    def loads(data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+
+    def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+        return orjson.dumps(obj, default=default)
+
+elif BACKEND == MSGSPEC:
+    DecodeError = msgspec.DecodeError
+    _decoder = msgspec.json.Decoder()
+    _encoder = msgspec.json.Encoder()
+
+    def loads(data: Union[str, bytes]) -> Any:
+        return _decoder.decode(data)
+
+    def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+        if default is None:
+            return _encoder.encode(obj)
+        return msgspec.json.encode(obj, enc_hook=default)
+
+else:
+    DecodeError = json.JSONDecodeError
+
+    def loads(data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+    def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), default=default).encode("utf-8")
+
+
+def dumps_str(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> str:
+    """dumps() decoded to text, for writers that take str"""
+    return dumps(obj, default).decode("utf-8")
@@ -0,0 +1,142 @@
+"""
+Incremental JSON object parser for streamed LLM output
+"""
+import json
+from typing import Any, Dict, Iterable, Optional
+
+
+class JSONStreamError(ValueError):
+    """Raised when streamed text does not contain a valid JSON object"""
+
+
+class IncrementalJSONParser:
+    """
+    Parses a single JSON object from text arriving in chunks
+
+    Leading prose or markdown fences before the first '{' are skipped. The
+    parser reports completion as soon as the top-level object is closed or,
+    if required_keys is given, as soon as all of those keys have complete
+    values - so the caller can stop the upstream stream before trailing
+    fields (e.g. a free-text "reason") are generated.
+    """
+
+    def __init__(self, required_keys: Optional[Iterable[str]] = None):
+        self.required_keys = set(required_keys or [])
+        self.values: Dict[str, Any] = {}
+        self.complete = False
+        self._buffer: list = []
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._current_key: Optional[str] = None
+        self._expect_key = False
+        self._token_start: Optional[int] = None  # Offset of the current top-level key/value
+        self._length = 0
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Consume a chunk of text
+
+        Args:
+            chunk: Next piece of streamed text
+
+        Returns:
+            True once the object (or all required keys) is complete
+
+        Raises:
+            JSONStreamError: If a completed value or the object is not valid JSON
+        """
+        if self.complete or not chunk:
+            return self.complete
+
+        for char in chunk:
+            if not self._started:
+                if char != "{":
+                    continue
+                self._started = True
+
+            offset = self._length
+            self._buffer.append(char)
+            self._length += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect_key:
+                        self._current_key = json.loads(self._slice(self._token_start, offset + 1))
+                        self._expect_key = False
+                        self._token_start = None
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._token_start is None:
+                    self._token_start = offset
+            elif char in "{[":
+                if self._depth == 1 and self._token_start is None:
+                    self._token_start = offset
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect_key = True
+            elif char in "}]":
+                if self._depth == 1:
+                    self._capture_value(offset)
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_object()
+                    return True
+            elif char == "," and self._depth == 1:
+                self._capture_value(offset)
+                self._expect_key = True
+            elif char == ":" and self._depth == 1:
+                self._token_start = None
+            elif not char.isspace() and self._depth == 1 and self._token_start is None:
+                self._token_start = offset
+
+            if self.required_keys and self.required_keys.issubset(self.values):
+                self.complete = True
+                return True
+
+        return False
+
+    def result(self) -> Dict[str, Any]:
+        """
+        Return the parsed object
+
+        Raises:
+            JSONStreamError: If the stream did not contain a complete JSON object
+        """
+        if not self.complete:
+            preview = "".join(self._buffer)[:200]
+            raise JSONStreamError(f"Incomplete JSON object in stream: {preview!r}")
+        return self.values
+
+    def _slice(self, start: int, end: int) -> str:
+        return "".join(self._buffer[start:end])
+
+    def _capture_value(self, end: int) -> None:
+        """Store the top-level value that ends right before `end`"""
+        if self._current_key is not None and self._token_start is not None:
+            raw = self._slice(self._token_start, end).strip()
+            try:
+                self.values[self._current_key] = json.loads(raw)
+            except json.JSONDecodeError as e:
+                raise JSONStreamError(f"Invalid JSON value for '{self._current_key}': {raw[:100]!r}") from e
+        self._current_key = None
+        self._token_start = None
+
+    def _finish_object(self) -> None:
+        """Validate the whole object once the closing brace arrives"""
+        try:
+            parsed = json.loads("".join(self._buffer))
+        except json.JSONDecodeError as e:
+            raise JSONStreamError(f"Invalid JSON object: {e}") from e
+        if not isinstance(parsed, dict):
+            raise JSONStreamError("Expected a JSON object")
+        self.values = parsed
+        self.complete = True
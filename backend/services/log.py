@@ -0,0 +1,146 @@
+"""
+Structured logging - JSON lines written by a background thread so log calls never block the event loop
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+import traceback
+from typing import Any, Dict, Optional
+from backend.config import settings
+from backend.services import json_codec
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, msg, structured fields and exception"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json_codec.dumps_str(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable variant for local development: time level [logger] msg key=value ..."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", None) or {}
+        line = f"{time.strftime('%H:%M:%S', time.localtime(record.created))} {record.levelname:<7} [{record.name}] {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_text:
+            line += "\n" + record.exc_text.rstrip()
+        return line
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread without formatting them
+
+    Only the traceback is rendered on the calling thread (the frames are
+    gone afterwards); JSON encoding and the write happen on the writer.
+    The queue is a lock-free SimpleQueue capped by size: once the writer
+    is max_size records behind, new records are dropped and counted.
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue, max_size: int):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = "".join(traceback.format_exception(*record.exc_info))
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """
+    Logger taking structured fields as keyword arguments
+
+        log.info("Turn finished", game_id=game_id, seconds=1.2)
+
+    Disabled levels return after one cached level check. Enabled records
+    are built directly, skipping the stdlib's caller lookup (a stack walk
+    per call); file and line are not part of the output anyway.
+    """
+
+    def log(self, level: int, msg: Any, *args: Any, exc_info: Any = None, **fields: Any) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        if exc_info and not isinstance(exc_info, (tuple, BaseException)):
+            exc_info = sys.exc_info()
+        elif isinstance(exc_info, BaseException):
+            exc_info = (type(exc_info), exc_info, exc_info.__traceback__)
+        record = self.logger.makeRecord(
+            self.logger.name, level, "", 0, msg, args, exc_info or None,
+            extra={"fields": fields} if fields else None
+        )
+        self.logger.handle(record)
+
+
+_ROOT = "pirate"
+_handler: Optional[_NonBlockingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _configure() -> None:
+    global _handler, _listener
+    # Neither formatter prints thread or process, so skip looking them up for every record
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(TextFormatter() if settings.log_format == "text" else JsonFormatter())
+    _handler = _NonBlockingQueueHandler(log_queue, settings.log_queue_size)
+    root = logging.getLogger(_ROOT)
+    root.setLevel(settings.log_level.upper())
+    root.addHandler(_handler)
+    root.propagate = False
+    _listener = logging.handlers.QueueListener(log_queue, stream)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def get_logger(name: str) -> StructuredLogger:
+    """
+    Structured logger for a component
+
+    Args:
+        name: Short component name, e.g. "openrouter" (logged as "pirate.openrouter")
+    """
+    if _handler is None:
+        _configure()
+    return StructuredLogger(logging.getLogger(f"{_ROOT}.{name}"), {})
+
+
+def shutdown() -> None:
+    """Write out queued records and stop the writer thread (also runs at exit)"""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+def dropped_records() -> int:
+    """Records dropped because the writer fell behind"""
+    return _handler.dropped if _handler is not None else 0
@@ -1,20 +1,50 @@
 """
 Deception evaluation service - evaluates player deception and misguidance using LLM
 """
-from typing import List, Dict, Any
-import json
+from typing import List, Dict, Any, Optional, Tuple
 import asyncio
+import time
 from backend.models.game import MeritEvaluation
-from backend.config import DIFFICULTY_LEVELS
-from backend.services.openrouter_service import OpenRouterService
+from backend.config import DIFFICULTY_LEVELS, settings
+from backend.services.openrouter_service import OpenRouterService, served_models
+from backend.services.context_builder import ContextBuilder
+from backend.services.json_stream import JSONStreamError
+from backend.services.upstream import INTERACTIVE_TURN
+from backend.services.log import get_logger
+
+log = get_logger("merit")
+
+# Judge output schema; every category is required so the stream can stop right after the last one
+EVALUATION_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "strategy_variety": {"type": "integer"},
+        "conversation_depth": {"type": "integer"},
+        "creativity": {"type": "integer"},
+        "persistence": {"type": "integer"},
+        "obvious_lies": {"type": "integer"},
+        "repetitive_strategy": {"type": "integer"},
+        "aggressive_behavior": {"type": "integer"},
+        "direct_demands": {"type": "integer"},
+        "contradictions": {"type": "integer"},
+        "short_messages": {"type": "integer"}
+    },
+    "required": [
+        "strategy_variety", "conversation_depth", "creativity", "persistence",
+        "obvious_lies", "repetitive_strategy", "aggressive_behavior",
+        "direct_demands", "contradictions", "short_messages"
+    ],
+    "additionalProperties": False
+}
 
 
 class MeritCheckService:
     """Service for evaluating player deception/misguidance using LLM"""
     
-    def __init__(self):
+    def __init__(self, context_builder: Optional[ContextBuilder] = None):
         self.llm_service = OpenRouterService()
-        # Use Claude Sonnet 4.5 for evaluation (better at analysis and understanding)
+        self.context_builder = context_builder or ContextBuilder(self.llm_service)
+        # Strong model when no tier policy applies (Claude Sonnet 4.5 - better at analysis and understanding)
         self.evaluation_model = "anthropic/claude-sonnet-4.5"
         
     async def evaluate_merit(
@@ -22,7 +52,11 @@ class MeritCheckService:
         conversation_history: List[Dict[str, str]],
         difficulty: str,
         strategies_attempted: List[str],
-        player_personas: List[str]
+        player_personas: List[str],
+        game_id: Optional[str] = None,
+        pinned_facts: Optional[List[str]] = None,
+        current_score: Optional[int] = None,
+        timeout: Optional[float] = None
     ) -> MeritEvaluation:
         """
         Evaluate player's deception/misguidance using LLM analysis
@@ -32,12 +66,17 @@ class MeritCheckService:
             difficulty: Difficulty level ('easy', 'medium', 'hard')
             strategies_attempted: List of strategy types attempted
             player_personas: List of personas/roles player claimed
+            game_id: Game identifier (keys the rolling summary of evicted turns)
+            pinned_facts: Player claims kept in context regardless of age
+            current_score: Running score before this turn; selects the judge tier
+            timeout: Time budget in seconds for all judge calls; heuristic scoring when exceeded
             
         Returns:
             MeritEvaluation with deception scores and feedback
+            (evaluation_model is None when the heuristic fallback was used)
         """
         # Build conversation context for LLM
-        conversation_text = self._format_conversation(conversation_history)
+        conversation_text = self._format_conversation(conversation_history, game_id, pinned_facts)
         
         # Create evaluation prompt
         evaluation_prompt = self._build_evaluation_prompt(
@@ -47,59 +86,36 @@ class MeritCheckService:
             difficulty
         )
         
+        # Get thresholds for difficulty
+        difficulty_config = DIFFICULTY_LEVELS.get(difficulty, DIFFICULTY_LEVELS["easy"])
+        threshold = difficulty_config.get("merit_threshold", 40)
+        loss_threshold = difficulty_config.get("loss_threshold", -30)
+        tiers = difficulty_config.get("judge_tiers")
+        
+        messages = [
+            {"role": "system", "content": "Jesteś ekspertem w analizie konwersacji i wykrywaniu oszustw, manipulacji i wprowadzania w błąd. Odpowiadasz TYLKO w formacie JSON."},
+            {"role": "user", "content": evaluation_prompt}
+        ]
+        
         # Call LLM for deception evaluation
+        deadline = time.monotonic() + timeout if timeout is not None else None
         try:
-            messages = [
-                {"role": "system", "content": "Jesteś ekspertem w analizie konwersacji i wykrywaniu oszustw, manipulacji i wprowadzania w błąd. Odpowiadasz TYLKO w formacie JSON."},
-                {"role": "user", "content": evaluation_prompt}
-            ]
-            
-            response = await self.llm_service.generate_response(
-                messages=messages,
-                model=self.evaluation_model,
-                temperature=0.3,  # Lower temperature for more consistent evaluation
-                max_tokens=500
+            evaluation, model_used = await asyncio.wait_for(
+                self._judge(messages, current_score, threshold, loss_threshold, tiers, deadline, difficulty),
+                timeout=timeout
             )
-            
-            # Parse LLM response
-            evaluation = self._parse_llm_evaluation(response)
-            
         except Exception as e:
             # Fallback to basic scoring if LLM fails
-            print(f"LLM evaluation failed: {e}, using fallback scoring")
+            log.warning("LLM evaluation failed, using fallback scoring", error=str(e) or type(e).__name__)
             evaluation = self._fallback_evaluation(
                 conversation_history,
                 strategies_attempted,
                 player_personas
             )
+            model_used = None
         
-        # Get thresholds for difficulty
-        difficulty_config = DIFFICULTY_LEVELS.get(difficulty, DIFFICULTY_LEVELS["easy"])
-        threshold = difficulty_config.get("merit_threshold", 40)
-        loss_threshold = difficulty_config.get("loss_threshold", -30)
-        
-        # Calculate positive score
-        positive_score = (
-            evaluation.get("strategy_variety", 0) +
-            evaluation.get("conversation_depth", 0) +
-            evaluation.get("creativity", 0) +
-            evaluation.get("persistence", 0)
-        )
-        
-        # Calculate negative total
-        negative_total = (
-            evaluation.get("obvious_lies", 0) +
-            evaluation.get("repetitive_strategy", 0) +
-            evaluation.get("aggressive_behavior", 0) +
-            evaluation.get("direct_demands", 0) +
-            evaluation.get("contradictions", 0) +
-            evaluation.get("short_messages", 0)
-        )
-        
-        # Calculate total score (positive + negative)
-        total_score = positive_score + negative_total
-        # Clamp to range -100 to 100
-        total_score = max(-100, min(100, total_score))
+        negative_total = self._negative_total(evaluation)
+        total_score = self._total_score(evaluation)
         
         has_earned_it = total_score >= threshold
         has_lost = total_score <= loss_threshold
@@ -129,13 +145,194 @@ class MeritCheckService:
             loss_threshold=loss_threshold,
             has_earned_it=has_earned_it,
             has_lost=has_lost,
-            feedback=feedback
+            feedback=feedback,
+            evaluation_model=model_used
         )
     
-    def _format_conversation(self, conversation_history: List[Dict[str, str]]) -> str:
-        """Format conversation history for LLM analysis"""
+    def fallback_merit(
+        self,
+        conversation_history: List[Dict[str, str]],
+        difficulty: str,
+        strategies_attempted: List[str],
+        player_personas: List[str]
+    ) -> MeritEvaluation:
+        """Heuristic-only evaluation, used when there is no time budget left for the judge"""
+        evaluation = self._fallback_evaluation(conversation_history, strategies_attempted, player_personas)
+        difficulty_config = DIFFICULTY_LEVELS.get(difficulty, DIFFICULTY_LEVELS["easy"])
+        total_score = self._total_score(evaluation)
+        threshold = difficulty_config.get("merit_threshold", 40)
+        loss_threshold = difficulty_config.get("loss_threshold", -30)
+        return MeritEvaluation(
+            total_score=total_score,
+            negative_total=self._negative_total(evaluation),
+            threshold=threshold,
+            loss_threshold=loss_threshold,
+            has_earned_it=total_score >= threshold,
+            has_lost=total_score <= loss_threshold,
+            feedback=f"Ocena heurystyczna (wynik: {total_score}/{threshold}).",
+            **evaluation
+        )
+    
+    async def _judge(
+        self,
+        messages: List[Dict[str, str]],
+        current_score: Optional[int],
+        threshold: int,
+        loss_threshold: int,
+        tiers: Optional[Dict[str, Any]],
+        deadline: Optional[float],
+        difficulty: Optional[str] = None
+    ) -> tuple:
+        """Run the tiered judge; returns (evaluation, model_used)"""
+        evaluation = None
+        model_used = None
+        if tiers and not self._near_boundary(current_score, threshold, loss_threshold, tiers):
+            # Far from any decision boundary: the cheap model is good enough
+            try:
+                evaluation, served = await self._evaluate_with_model(messages, tiers["fast_model"], deadline, difficulty)
+            except Exception as e:
+                # Upstream error or every fast fallback's circuit open: the strong model may still answer
+                log.warning("Fast judge failed, escalating", model=tiers["fast_model"], error=str(e) or type(e).__name__)
+                evaluation = None
+            else:
+                if self._is_consistent(evaluation, current_score, threshold, loss_threshold, tiers):
+                    model_used = served
+                else:
+                    log.info("Fast judge output inconsistent, escalating", current_score=current_score)
+                    evaluation = None
+        
+        if evaluation is None:
+            strong_model = tiers["strong_model"] if tiers else self.evaluation_model
+            evaluation, model_used = await self._evaluate_with_model(messages, strong_model, deadline, difficulty)
+        
+        if evaluation is None:
+            # Unparseable even after retries: score heuristically rather than with zeros
+            raise ValueError(f"{model_used} returned no valid evaluation JSON")
+        return evaluation, model_used
+    
+    async def _evaluate_with_model(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        deadline: Optional[float] = None,
+        difficulty: Optional[str] = None
+    ) -> Tuple[Optional[Dict[str, int]], str]:
+        """
+        Run the judge prompt on one model (or its fallbacks)
+        
+        Returns:
+            Tuple of (evaluation or None if unparseable after retries, model that served it)
+        """
+        served = served_models.get()
+        if served is None:
+            # Called outside a conversation turn: track the serving model for this call chain only
+            served = {}
+            served_models.set(served)
+        for attempt in range(1 + settings.json_parse_retries):
+            try:
+                data = await self.llm_service.generate_json(
+                    messages=messages,
+                    model=model,
+                    schema=EVALUATION_SCHEMA,
+                    schema_name="merit_evaluation",
+                    temperature=0.3,  # Lower temperature for more consistent evaluation
+                    max_tokens=500,
+                    required_keys=EVALUATION_SCHEMA["required"],
+                    timeout=max(0.1, deadline - time.monotonic()) if deadline is not None else None,
+                    role="judge",
+                    difficulty=difficulty,
+                    priority=INTERACTIVE_TURN
+                )
+            except JSONStreamError as e:
+                log.warning("Failed to parse LLM evaluation", model=model, attempt=attempt + 1, error=str(e))
+                continue
+            try:
+                return self._normalize_evaluation(data), served.get("judge", model)
+            except (ValueError, TypeError) as e:
+                log.warning("Invalid LLM evaluation values", model=model, attempt=attempt + 1, error=str(e))
+        return None, served.get("judge", model)
+    
+    @staticmethod
+    def _near_boundary(
+        current_score: Optional[int],
+        threshold: int,
+        loss_threshold: int,
+        tiers: Dict[str, Any]
+    ) -> bool:
+        """Whether the running score is close enough to a win/loss threshold to need the strong judge"""
+        if current_score is None:
+            return True
+        margin = tiers.get("escalation_margin", 15)
+        return abs(current_score - threshold) <= margin or abs(current_score - loss_threshold) <= margin
+    
+    def _is_consistent(
+        self,
+        evaluation: Optional[Dict[str, int]],
+        current_score: Optional[int],
+        threshold: int,
+        loss_threshold: int,
+        tiers: Dict[str, Any]
+    ) -> bool:
+        """
+        Sanity-check a fast-tier verdict before trusting it
+        
+        The verdict is rejected when it could not be parsed, when it jumps
+        further from the running score than max_score_jump, or when it lands
+        near a decision boundary (where only the strong model may decide).
+        """
+        if evaluation is None:
+            return False
+        new_score = self._total_score(evaluation)
+        if current_score is not None and abs(new_score - current_score) > tiers.get("max_score_jump", 30):
+            return False
+        return not self._near_boundary(new_score, threshold, loss_threshold, tiers)
+    
+    @staticmethod
+    def _negative_total(evaluation: Dict[str, int]) -> int:
+        """Sum of negative point categories"""
+        return (
+            evaluation.get("obvious_lies", 0) +
+            evaluation.get("repetitive_strategy", 0) +
+            evaluation.get("aggressive_behavior", 0) +
+            evaluation.get("direct_demands", 0) +
+            evaluation.get("contradictions", 0) +
+            evaluation.get("short_messages", 0)
+        )
+    
+    @classmethod
+    def _total_score(cls, evaluation: Dict[str, int]) -> int:
+        """Total score (positive + negative), clamped to -100..100"""
+        positive_score = (
+            evaluation.get("strategy_variety", 0) +
+            evaluation.get("conversation_depth", 0) +
+            evaluation.get("creativity", 0) +
+            evaluation.get("persistence", 0)
+        )
+        return max(-100, min(100, positive_score + cls._negative_total(evaluation)))
+    
+    def _format_conversation(
+        self,
+        conversation_history: List[Dict[str, str]],
+        game_id: Optional[str] = None,
+        pinned_facts: Optional[List[str]] = None
+    ) -> str:
+        """Format token-budgeted conversation history for LLM analysis"""
+        context = self.context_builder.build(
+            conversation_history,
+            token_budget=settings.context_budget_judge,
+            game_id=game_id,
+            pinned_facts=pinned_facts
+        )
         formatted = []
-        for msg in conversation_history[-15:]:  # Last 15 messages for context
+        if context.pinned_facts:
+            formatted.append("[Wcześniejsze deklaracje gracza]")
+            formatted.extend(f"- {fact}" for fact in context.pinned_facts)
+        if context.summary:
+            formatted.append(f"[Streszczenie {context.evicted_count} wcześniejszych wiadomości]")
+            formatted.append(context.summary)
+        if formatted:
+            formatted.append("[Ostatnie wiadomości]")
+        for msg in context.messages:
             role = msg.get("role", "unknown")
             content = msg.get("content", "")
             if role == "user":
@@ -204,47 +401,19 @@ NEGATYWNE:
 - Sprzeczności w opowieściach
 - Zbyt krótkie wiadomości (np. "cos", "daj", "skarb")"""
     
-    def _parse_llm_evaluation(self, response: str) -> Dict[str, int]:
-        """Parse LLM JSON response"""
-        try:
-            # Try to extract JSON from response
-            response = response.strip()
-            # Remove markdown code blocks if present
-            if response.startswith("```"):
-                lines = response.split("\n")
-                response = "\n".join(lines[1:-1])
-            response = response.strip()
-            
-            # Try to find JSON object
-            if response.startswith("{"):
-                data = json.loads(response)
-                return {
-                    "strategy_variety": min(30, max(0, int(data.get("strategy_variety", 0)))),
-                    "conversation_depth": min(25, max(0, int(data.get("conversation_depth", 0)))),
-                    "creativity": min(25, max(0, int(data.get("creativity", 0)))),
-                    "persistence": min(20, max(0, int(data.get("persistence", 0)))),
-                    "obvious_lies": max(-20, min(0, int(data.get("obvious_lies", 0)))),
-                    "repetitive_strategy": max(-15, min(0, int(data.get("repetitive_strategy", 0)))),
-                    "aggressive_behavior": max(-15, min(0, int(data.get("aggressive_behavior", 0)))),
-                    "direct_demands": max(-10, min(0, int(data.get("direct_demands", 0)))),
-                    "contradictions": max(-15, min(0, int(data.get("contradictions", 0)))),
-                    "short_messages": max(-10, min(0, int(data.get("short_messages", 0))))
-                }
-        except (json.JSONDecodeError, ValueError, KeyError) as e:
-            print(f"Failed to parse LLM evaluation: {e}, response: {response[:200]}")
-        
-        # Return default if parsing fails
+    def _normalize_evaluation(self, data: Dict[str, Any]) -> Dict[str, int]:
+        """Clamp parsed judge output to the allowed range of each category"""
         return {
-            "strategy_variety": 0,
-            "conversation_depth": 0,
-            "creativity": 0,
-            "persistence": 0,
-            "obvious_lies": 0,
-            "repetitive_strategy": 0,
-            "aggressive_behavior": 0,
-            "direct_demands": 0,
-            "contradictions": 0,
-            "short_messages": 0
+            "strategy_variety": min(30, max(0, int(data.get("strategy_variety", 0)))),
+            "conversation_depth": min(25, max(0, int(data.get("conversation_depth", 0)))),
+            "creativity": min(25, max(0, int(data.get("creativity", 0)))),
+            "persistence": min(20, max(0, int(data.get("persistence", 0)))),
+            "obvious_lies": max(-20, min(0, int(data.get("obvious_lies", 0)))),
+            "repetitive_strategy": max(-15, min(0, int(data.get("repetitive_strategy", 0)))),
+            "aggressive_behavior": max(-15, min(0, int(data.get("aggressive_behavior", 0)))),
+            "direct_demands": max(-10, min(0, int(data.get("direct_demands", 0)))),
+            "contradictions": max(-15, min(0, int(data.get("contradictions", 0)))),
+            "short_messages": max(-10, min(0, int(data.get("short_messages", 0))))
         }
     
     def _fallback_evaluation(
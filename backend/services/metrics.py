@@ -0,0 +1,202 @@
+"""
+Metrics - in-process counters, gauges and histograms rendered in Prometheus text format
+"""
+import math
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+from backend.services.log import get_logger
+
+log = get_logger("metrics")
+
+# Upper bounds in seconds; wide enough for multi-second LLM calls and TTS polling
+LATENCY_BUCKETS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+# (labels, value) pairs produced by a collector for one metric family
+Samples = List[Tuple[Dict[str, str], float]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base for labelled metric families; children are keyed by a tuple of label values"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        # Missing labels become "" so call sites can stay terse on the hot path
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing value"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}" for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    """Bucketed distribution with sum and count"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per child: [count per bucket (non-cumulative, +Inf last), sum, count]
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        child = self._values.get(key)
+        if child is None:
+            child = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        child[0][bisect_left(self.buckets, value)] += 1
+        child[1] += value
+        child[2] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe the wall-clock duration of the block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Registry:
+    """
+    Holds metric families and scrape-time collectors
+
+    Collectors are callables returning (name, kind, documentation, samples)
+    tuples; they read existing service statistics only when /metrics is
+    scraped, so nothing extra runs on the request path.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Samples]]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, Samples]]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """All metrics in Prometheus text exposition format (version 0.0.4)"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                log.warning("Metrics collector failed", error=str(e))
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labelnames: Iterable[str] = (),
+    buckets: Tuple[float, ...] = LATENCY_BUCKETS
+) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# Metric families shared across services
+GRAPH_NODE_SECONDS = histogram("pirate_graph_node_seconds", "Duration of conversation graph nodes", ["node"])
+TURN_SECONDS = histogram("pirate_turn_seconds", "Duration of admitted conversation turns", ["difficulty"])
+FAST_PATH_TURNS = counter("pirate_fast_path_turns_total", "Conversation turns answered without running the graph", ["reason"])
+UPSTREAM_REQUEST_SECONDS = histogram(
+    "pirate_upstream_request_seconds",
+    "Duration of upstream LLM calls per model attempt (time to first chunk for streams)",
+    ["provider", "model", "role", "outcome"]
+)
+LLM_PROMPT_TOKENS = counter("pirate_llm_prompt_tokens_total", "Prompt tokens reported by OpenRouter usage", ["model", "role"])
+LLM_COMPLETION_TOKENS = counter("pirate_llm_completion_tokens_total", "Completion tokens reported by OpenRouter usage", ["model", "role"])
+LLM_COST_USD = counter("pirate_llm_cost_usd_total", "Cost reported by OpenRouter usage (or estimated from MODEL_PRICING), in USD", ["model", "role"])
+GENERATION_EARLY_STOPS = counter("pirate_generation_early_stops_total", "Generation streams closed at the sentence limit", ["model"])
+GENERATION_TOKENS_SAVED = counter(
+    "pirate_generation_tokens_saved_total", "Estimated completion tokens not generated thanks to early stops", ["model"]
+)
+GENERATION_SECONDS_SAVED = counter(
+    "pirate_generation_seconds_saved_total", "Estimated generation time saved by early stops", ["model"]
+)
+TTS_QUEUE_SECONDS = histogram("pirate_tts_queue_seconds", "Time a Kie.ai TTS task waited before generation started")
+TTS_SYNTHESIS_SECONDS = histogram("pirate_tts_synthesis_seconds", "Time from Kie.ai TTS generation start to result")
+TTS_SECONDS = histogram("pirate_tts_seconds", "End-to-end text-to-speech time", ["provider", "outcome"])
+STT_SECONDS = histogram("pirate_stt_seconds", "Speech-to-text request time", ["outcome"])
@@ -0,0 +1,105 @@
+"""
+Latency-aware model router - ranks interchangeable models by live EWMA latency and error statistics
+"""
+import random
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from backend.config import settings
+
+
+@dataclass
+class ModelStats:
+    """Exponentially weighted latency and error rate of one model in one role"""
+    latency: float = 0.0
+    error_rate: float = 0.0
+    samples: int = 0
+    errors: int = 0
+
+
+class ModelRouter:
+    """
+    Orders an equivalence set of models so the fastest expected one is tried first
+
+    Statistics are kept per (role, model), since a model can be quick for a
+    short judge answer and slow for a streamed reply. The expected latency
+    of a model is its EWMA latency plus its EWMA error rate times a penalty,
+    so an unreliable model loses even if its successful calls are quick.
+    Models without samples rank first so every candidate gets measured, and
+    with probability exploration_rate a random non-best model is tried first
+    to keep the statistics of the others fresh.
+    """
+
+    def __init__(
+        self,
+        alpha: Optional[float] = None,
+        exploration_rate: Optional[float] = None,
+        error_penalty_seconds: Optional[float] = None
+    ):
+        self.alpha = alpha if alpha is not None else settings.routing_ewma_alpha
+        self.exploration_rate = exploration_rate if exploration_rate is not None else settings.routing_exploration_rate
+        self.error_penalty_seconds = (
+            error_penalty_seconds if error_penalty_seconds is not None else settings.routing_error_penalty_seconds
+        )
+        self._stats: Dict[Tuple[str, str], ModelStats] = {}
+
+    def rank(self, role: str, models: List[str]) -> List[str]:
+        """
+        Order models by expected latency for the role
+
+        Args:
+            role: Call role ("generation", "judge", "semantic_check")
+            models: Equivalence set; ties keep this order, so list the pinned model first
+
+        Returns:
+            Models ordered best-first (possibly with an exploration pick in front)
+        """
+        if len(models) < 2:
+            return list(models)
+        ranked = sorted(models, key=lambda model: self.expected_latency(role, model))
+        if random.random() < self.exploration_rate:
+            explore = random.choice(ranked[1:])
+            ranked.remove(explore)
+            ranked.insert(0, explore)
+        return ranked
+
+    def expected_latency(self, role: str, model: str) -> float:
+        """EWMA latency plus error penalty; 0 for models not measured yet"""
+        stats = self._stats.get((role, model))
+        if stats is None or stats.samples == 0:
+            return 0.0
+        return stats.latency + stats.error_rate * self.error_penalty_seconds
+
+    def record(self, role: str, model: str, latency: Optional[float], ok: bool) -> None:
+        """
+        Fold one call outcome into the model's statistics
+
+        Args:
+            role: Call role
+            model: Model that handled the call
+            latency: Seconds until the answer (ignored for failed calls)
+            ok: Whether the call succeeded
+        """
+        stats = self._stats.setdefault((role, model), ModelStats())
+        first = stats.samples == 0
+        stats.samples += 1
+        if ok and latency is not None:
+            stats.latency = latency if first or stats.latency == 0.0 else (
+                self.alpha * latency + (1 - self.alpha) * stats.latency
+            )
+        if not ok:
+            stats.errors += 1
+        outcome = 0.0 if ok else 1.0
+        stats.error_rate = outcome if first else self.alpha * outcome + (1 - self.alpha) * stats.error_rate
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Statistics grouped by role, then model"""
+        result: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for (role, model), stats in self._stats.items():
+            result.setdefault(role, {})[model] = {
+                "ewma_latency": round(stats.latency, 3),
+                "ewma_error_rate": round(stats.error_rate, 3),
+                "expected_latency": round(self.expected_latency(role, model), 3),
+                "samples": stats.samples,
+                "errors": stats.errors
+            }
+        return result
@@ -2,16 +2,91 @@
 OpenRouter LLM service
 """
 import httpx
-from typing import Optional, AsyncIterator, Dict, Any, List
-from backend.config import settings
+import time
+import random
+import asyncio
+from collections import deque
+import contextvars
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, AsyncIterator, Dict, Any, List, Iterable, Set, Callable, Awaitable, Deque
+from backend.config import DIFFICULTY_LEVELS, settings
+from backend.services.json_stream import IncrementalJSONParser, JSONStreamError
+from backend.services.sentences import SentenceLimiter
+from backend.services.circuit_breaker import CircuitBreakerRegistry
+from backend.services.model_router import ModelRouter
+from backend.services.upstream import upstream_scheduler, upstream_client, OPENROUTER, INTERACTIVE_TURN, BACKGROUND
+from backend.services.metrics import (
+    UPSTREAM_REQUEST_SECONDS, LLM_PROMPT_TOKENS, LLM_COMPLETION_TOKENS, LLM_COST_USD,
+    GENERATION_EARLY_STOPS, GENERATION_TOKENS_SAVED, GENERATION_SECONDS_SAVED
+)
+from backend.services.tracing import tracer
+from backend.services.cost_tracker import cost_tracker
+from backend.services.context_builder import estimate_tokens, MESSAGE_OVERHEAD_TOKENS
+from backend.services.log import get_logger
+from backend.services import json_codec
+
+log = get_logger("openrouter")
+
+
+# Responses worth retrying: rate limits and transient provider errors
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Model that actually served each role ("generation", "judge", "semantic_check") in the current turn.
+# The conversation graph installs a fresh dict per turn; tasks spawned during the turn share it.
+served_models: ContextVar[Optional[Dict[str, str]]] = ContextVar("served_models", default=None)
+
+
+def record_served_model(role: Optional[str], model: Optional[str]) -> None:
+    """Note which model served a role in the current turn (no-op outside a turn)"""
+    served = served_models.get()
+    if served is not None and role and model:
+        served[role] = model
+
+
+class OpenRouterError(ValueError):
+    """OpenRouter API error; transient errors (rate limits, 5xx, network) count against the model's breaker"""
+    
+    def __init__(self, message: str, status_code: Optional[int] = None, transient: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.transient = transient
 
 
 class OpenRouterService:
     """Service for OpenRouter LLM API"""
     
+    # Shared across instances: recent successful latencies per model (drives hedging)
+    _latency_samples: Dict[str, Deque[float]] = {}
+    # Shared across instances: per-model JSON parse outcomes {"model": {"requests": n, "failures": m}}
+    json_parse_stats: Dict[str, Dict[str, int]] = {}
+    # Shared across instances: per-model EWMA of what an early-stopped stream would still have produced
+    # {"model": {"tokens": t, "seconds": s, "samples": n}}, measured by calibration runs
+    tail_estimates: Dict[str, Dict[str, float]] = {}
+    # Running calibration per model (at most one; referenced so the task is not collected)
+    _tail_samplers: Dict[str, "asyncio.Task[None]"] = {}
+    # Models that rejected response_format at runtime, so we stop sending it
+    _structured_output_rejected: Set[str] = set()
+    # Shared across instances: one circuit breaker per model
+    circuit_breakers = CircuitBreakerRegistry()
+    # Shared across instances: EWMA latency/error statistics per (role, model)
+    router = ModelRouter()
+    
     def __init__(self):
         self.api_key = settings.openrouter_api_key
         self.base_url = settings.openrouter_base_url
+        self.structured_output_models = [
+            prefix.strip() for prefix in settings.structured_output_models.split(",") if prefix.strip()
+        ]
+        self.fallback_models: Dict[str, List[str]] = {
+            role: [name.strip() for name in value.split(",") if name.strip()]
+            for role, value in (
+                ("generation", settings.fallback_models_generation),
+                ("judge", settings.fallback_models_judge),
+                ("semantic_check", settings.fallback_models_semantic_check)
+            )
+        }
         
     async def generate_response(
         self,
@@ -19,17 +94,33 @@ class OpenRouterService:
         model: str,
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
-        stream: bool = False
+        stream: bool = False,
+        response_format: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        role: Optional[str] = None,
+        difficulty: Optional[str] = None,
+        priority: str = INTERACTIVE_TURN
     ) -> AsyncIterator[str] | str:
         """
         Generate LLM response via OpenRouter
         
+        With a role, the role's fallback models are tried in order after
+        the requested one when it fails or its circuit breaker is open; the
+        model that answered is recorded in `served_models`. With routing
+        enabled and a difficulty, the requested model and its equivalents
+        for that difficulty are first ordered by expected latency.
+        
         Args:
             messages: List of message dicts with 'role' and 'content'
             model: Model identifier (e.g., 'openai/gpt-4-turbo')
             temperature: Sampling temperature (0-2)
             max_tokens: Maximum tokens to generate
             stream: Whether to stream the response
+            response_format: Optional OpenAI-style response_format (e.g. a json_schema)
+            timeout: Upstream timeout in seconds (defaults to 60s)
+            role: Call role ("generation", "judge", "semantic_check") selecting fallback models
+            difficulty: Difficulty whose model_equivalents the router may choose from
+            priority: Upstream scheduler class (INTERACTIVE_TURN, INTERACTIVE_AUDIO, BACKGROUND)
             
         Returns:
             If stream=True: AsyncIterator of text chunks
@@ -47,21 +138,21 @@ class OpenRouterService:
         for msg in messages:
             if not isinstance(msg, dict):
                 raise ValueError(f"Invalid message format: {msg}")
-            role = msg.get("role", "").strip()
+            msg_role = msg.get("role", "").strip()
             content = msg.get("content", "").strip()
             
-            if not role:
+            if not msg_role:
                 raise ValueError(f"Message missing 'role' field: {msg}")
             if not content:
                 # Skip empty content messages, but allow system messages with empty content
-                if role != "system":
+                if msg_role != "system":
                     continue
             
-            if role not in ["system", "user", "assistant"]:
-                raise ValueError(f"Invalid role '{role}'. Must be 'system', 'user', or 'assistant'")
+            if msg_role not in ["system", "user", "assistant"]:
+                raise ValueError(f"Invalid role '{msg_role}'. Must be 'system', 'user', or 'assistant'")
             
             cleaned_messages.append({
-                "role": role,
+                "role": msg_role,
                 "content": content
             })
         
@@ -86,83 +177,702 @@ class OpenRouterService:
         
         if max_tokens:
             payload["max_tokens"] = int(max_tokens)
+        
+        if response_format:
+            payload["response_format"] = response_format
+        
+        # Ask OpenRouter to report the cost of the call in usage
+        payload["usage"] = {"include": True}
             
+        candidates = self.candidate_models(model.strip(), role, difficulty)
         if stream:
             payload["stream"] = True
-            return self._stream_response(headers, payload)
+            return self._stream_with_failover(headers, payload, candidates, role, timeout, priority)
         else:
-            return await self._get_complete_response(headers, payload)
+            return await self._complete_with_failover(headers, payload, candidates, role, timeout, priority)
     
-    async def _get_complete_response(
+    def candidate_models(self, model: str, role: Optional[str] = None, difficulty: Optional[str] = None) -> List[str]:
+        """
+        Models to try for a call, in order, without duplicates
+        
+        The requested model (or, with routing, its equivalence set ranked by
+        expected latency) followed by the role's fallback models. For a game
+        over its cost budget the difficulty's budget_model replaces the
+        requested model.
+        """
+        if difficulty and cost_tracker.is_downgraded():
+            model = DIFFICULTY_LEVELS.get(difficulty, {}).get("budget_model", model)
+        candidates = [model]
+        if settings.routing_enabled and role and difficulty:
+            equivalents = DIFFICULTY_LEVELS.get(difficulty, {}).get("model_equivalents", {}).get(model, [])
+            candidates = self.router.rank(role, candidates + [m for m in equivalents if m != model])
+        for fallback in self.fallback_models.get(role, []) if role else []:
+            if fallback not in candidates:
+                candidates.append(fallback)
+        return candidates
+    
+    @classmethod
+    def get_circuit_breaker_stats(cls) -> Dict[str, Dict[str, Any]]:
+        """State of every model's circuit breaker"""
+        return cls.circuit_breakers.snapshot()
+    
+    @classmethod
+    def get_routing_stats(cls) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """EWMA latency and error statistics per role and model"""
+        return cls.router.snapshot()
+    
+    async def _complete_with_failover(
         self,
         headers: Dict[str, str],
-        payload: Dict[str, Any]
+        payload: Dict[str, Any],
+        candidates: List[str],
+        role: Optional[str],
+        timeout: Optional[float],
+        priority: str = INTERACTIVE_TURN
     ) -> str:
-        """Get complete non-streaming response"""
-        async with httpx.AsyncClient(timeout=60.0) as client:
+        """Non-streaming call that moves down the candidate list on model failures"""
+        deadline = time.monotonic() + (timeout or 60.0)
+        last_error: Optional[Exception] = None
+        for candidate in candidates:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self._admit(candidate):
+                continue
+            started = time.monotonic()
+            try:
+                result = await self._get_complete_response(headers, self._payload_for(payload, candidate), remaining, priority, role)
+            except asyncio.CancelledError:
+                self._release(candidate)
+                raise
+            except Exception as e:
+                if not self._record_failure(role, candidate, e, time.monotonic() - started):
+                    raise
+                last_error = e
+                log.warning("Model failed, trying next model", model=candidate, role=role, error=str(e))
+                continue
+            self._record_success(role, candidate, time.monotonic() - started)
+            record_served_model(role, candidate)
+            return result
+        raise last_error or OpenRouterError(
+            f"No available model for {role or payload['model']} (circuit open)", transient=True
+        )
+    
+    async def _stream_with_failover(
+        self,
+        headers: Dict[str, str],
+        payload: Dict[str, Any],
+        candidates: List[str],
+        role: Optional[str],
+        timeout: Optional[float],
+        priority: str = INTERACTIVE_TURN
+    ) -> AsyncIterator[str]:
+        """Streaming call that fails over to the next candidate until the first chunk arrives"""
+        deadline = time.monotonic() + (timeout or 60.0)
+        last_error: Optional[Exception] = None
+        for candidate in candidates:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self._admit(candidate):
+                continue
+            started = time.monotonic()
+            first = True
+            chunks = self._stream_response(headers, self._payload_for(payload, candidate), remaining, priority, role)
+            try:
+                async for chunk in chunks:
+                    if first:
+                        # Time to first chunk is what a hanging provider hurts, so the breaker judges that
+                        first = False
+                        self._record_success(role, candidate, time.monotonic() - started)
+                        record_served_model(role, candidate)
+                    yield chunk
+                if first:
+                    self._record_success(role, candidate, time.monotonic() - started)
+                    record_served_model(role, candidate)
+                return
+            except Exception as e:
+                # Once text was handed to the caller the stream cannot move to another model
+                if not first or not self._record_failure(role, candidate, e, time.monotonic() - started):
+                    raise
+                last_error = e
+                log.warning("Model stream failed, trying next model", model=candidate, role=role, error=str(e))
+            except BaseException:
+                # Cancelled or closed by the caller before the model answered: not the model's fault
+                if first:
+                    self._release(candidate)
+                raise
+            finally:
+                await chunks.aclose()
+        raise last_error or OpenRouterError(
+            f"No available model for {role or payload['model']} (circuit open)", transient=True
+        )
+    
+    def _payload_for(self, payload: Dict[str, Any], model: str) -> Dict[str, Any]:
+        """Copy of the payload addressed to a (possibly fallback) model, without response_format if it does not take one"""
+        strip_format = "response_format" in payload and not self.supports_structured_output(model)
+        if model == payload["model"] and not strip_format:
+            return payload
+        candidate_payload = {**payload, "model": model}
+        if strip_format:
+            del candidate_payload["response_format"]
+        return candidate_payload
+    
+    def _admit(self, model: str) -> bool:
+        """Whether the model's breaker lets a call through (reserves a half-open probe slot)"""
+        if not settings.circuit_breaker_enabled:
+            return True
+        return self.circuit_breakers.get(model).allow_request()
+    
+    def _record_success(self, role: Optional[str], model: str, latency: float) -> None:
+        UPSTREAM_REQUEST_SECONDS.observe(latency, provider=OPENROUTER, model=model, role=role or "", outcome="ok")
+        if settings.circuit_breaker_enabled:
+            self.circuit_breakers.get(model).record_success(latency)
+        if role:
+            self.router.record(role, model, latency, ok=True)
+    
+    def _record_failure(self, role: Optional[str], model: str, error: BaseException, latency: float) -> bool:
+        """Count a model failure against its breaker and routing stats; False for errors that are not the model's fault"""
+        failure = self._is_model_failure(error)
+        UPSTREAM_REQUEST_SECONDS.observe(latency, provider=OPENROUTER, model=model, role=role or "", outcome="error")
+        if failure and role:
+            self.router.record(role, model, None, ok=False)
+        if settings.circuit_breaker_enabled:
+            breaker = self.circuit_breakers.get(model)
+            if failure:
+                breaker.record_failure(str(error)[:120])
+            else:
+                breaker.release_probe()
+        return failure
+    
+    @staticmethod
+    def _record_usage(model: str, role: Optional[str], usage: Optional[Dict[str, Any]]) -> None:
+        """Count tokens and cost from an OpenRouter usage object (per game via the cost tracker)"""
+        if not usage:
+            return
+        cost = cost_tracker.record(model, role, usage)
+        role = role or ""
+        LLM_PROMPT_TOKENS.inc(usage.get("prompt_tokens") or 0, model=model, role=role)
+        LLM_COMPLETION_TOKENS.inc(usage.get("completion_tokens") or 0, model=model, role=role)
+        LLM_COST_USD.inc(cost, model=model, role=role)
+    
+    @staticmethod
+    def _estimate_usage(payload: Dict[str, Any], completion: str) -> Dict[str, Any]:
+        """Local token estimate for a stream closed before OpenRouter sent its usage"""
+        prompt_tokens = sum(
+            estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in payload["messages"]
+        )
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": estimate_tokens(completion), "estimated": True}
+    
+    def _release(self, model: str) -> None:
+        if settings.circuit_breaker_enabled:
+            self.circuit_breakers.get(model).release_probe()
+    
+    @staticmethod
+    def _is_model_failure(error: BaseException) -> bool:
+        """Rate limits, server errors, timeouts and network errors are worth failing over on; 4xx are not"""
+        if isinstance(error, OpenRouterError):
+            return error.transient
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRYABLE_STATUS_CODES or error.response.status_code >= 500
+        return isinstance(error, (TimeoutError, asyncio.TimeoutError, httpx.TransportError))
+    
+    @staticmethod
+    def _response_format_rejected_by(error: httpx.HTTPStatusError) -> Optional[str]:
+        """The model whose request failed because of response_format, or None for any other error"""
+        if error.response.status_code != 400:
+            return None
+        try:
+            sent = json_codec.loads(error.request.content)
+            body = error.response.text
+        except (httpx.HTTPError, ValueError, TypeError):
+            return None
+        if "response_format" not in sent or not ("response_format" in body or "json_schema" in body):
+            return None
+        return sent.get("model")
+    
+    def supports_structured_output(self, model: str) -> bool:
+        """Whether response_format json_schema should be requested for this model"""
+        if model in self._structured_output_rejected:
+            return False
+        return any(model.startswith(prefix) for prefix in self.structured_output_models)
+    
+    async def generate_json(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        schema: Dict[str, Any],
+        schema_name: str = "response",
+        temperature: float = 0.2,
+        max_tokens: Optional[int] = None,
+        required_keys: Optional[Iterable[str]] = None,
+        timeout: Optional[float] = None,
+        role: Optional[str] = None,
+        difficulty: Optional[str] = None,
+        priority: str = INTERACTIVE_TURN
+    ) -> Dict[str, Any]:
+        """
+        Generate a JSON object, schema-constrained when the model supports it
+        
+        The response is streamed through an incremental parser and the
+        upstream stream is closed as soon as the object (or all
+        required_keys) is complete, so trailing tokens are not paid for.
+        
+        Args:
+            messages: List of message dicts with 'role' and 'content'
+            model: Model identifier
+            schema: JSON schema of the expected object
+            schema_name: Name reported to the provider for the schema
+            temperature: Sampling temperature (0-2)
+            max_tokens: Maximum tokens to generate
+            required_keys: Keys after which the stream may be cut early
+            timeout: Upstream timeout in seconds (defaults to 60s)
+            role: Call role selecting fallback models (see generate_response)
+            difficulty: Difficulty whose model_equivalents the router may choose from
+            priority: Upstream scheduler class (see generate_response)
+            
+        Returns:
+            Parsed JSON object
+            
+        Raises:
+            JSONStreamError: If no valid JSON object was produced
+            ValueError: On API errors
+            TimeoutError: If the upstream call timed out
+        """
+        # Dropped per candidate (see _payload_for) for models that do not take it
+        response_format = {
+            "type": "json_schema",
+            "json_schema": {"name": schema_name, "strict": True, "schema": schema}
+        }
+        
+        while True:
             try:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    json=payload,
-                    headers=headers
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                # Extract text from response
-                choices = result.get("choices", [])
-                if choices:
-                    return choices[0].get("message", {}).get("content", "")
-                return ""
+                return await self._stream_json(messages, model, temperature, max_tokens, response_format, required_keys, timeout, role, difficulty, priority)
             except httpx.HTTPStatusError as e:
-                # Get detailed error message from response
-                error_detail = f"HTTP {e.response.status_code}"
-                try:
-                    error_body = e.response.json()
-                    if "error" in error_body:
-                        error_detail = error_body["error"].get("message", str(error_body["error"]))
-                    elif "detail" in error_body:
-                        error_detail = error_body["detail"]
-                except:
-                    error_detail = e.response.text[:500] if e.response.text else str(e)
-                raise ValueError(f"OpenRouter API error: {error_detail}")
+                rejected_by = self._response_format_rejected_by(e)
+                if rejected_by is None or rejected_by in self._structured_output_rejected:
+                    raise ValueError(f"OpenRouter API error: HTTP {e.response.status_code}")
+                # The provider does not accept response_format for this model: remember it and retry,
+                # which sends that model prompt-only JSON. Other 400s (context length, bad messages) are not cached.
+                log.info("Model rejected response_format, falling back to prompt-only JSON", model=rejected_by)
+                self._structured_output_rejected.add(rejected_by)
+            except httpx.TimeoutException as e:
+                raise TimeoutError(f"OpenRouter request timed out: {str(e)}")
             except httpx.RequestError as e:
                 raise ValueError(f"Request to OpenRouter failed: {str(e)}")
     
+    async def _stream_json(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        response_format: Optional[Dict[str, Any]],
+        required_keys: Optional[Iterable[str]],
+        timeout: Optional[float] = None,
+        role: Optional[str] = None,
+        difficulty: Optional[str] = None,
+        priority: str = INTERACTIVE_TURN
+    ) -> Dict[str, Any]:
+        """Stream a completion into the incremental parser and record the parse outcome for the serving model"""
+        parser = IncrementalJSONParser(required_keys)
+        chunks = await self.generate_response(
+            messages=messages,
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            response_format=response_format,
+            timeout=timeout,
+            role=role,
+            difficulty=difficulty,
+            priority=priority
+        )
+        failed = False
+        try:
+            async for chunk in chunks:
+                if parser.feed(chunk):
+                    break
+            return parser.result()
+        except JSONStreamError:
+            failed = True
+            raise
+        finally:
+            # Closes the HTTP stream right away instead of reading the remaining tokens
+            await chunks.aclose()
+            # After failover the parse outcome belongs to the model that served the stream
+            served = (served_models.get() or {}).get(role) or model
+            stats = self.json_parse_stats.setdefault(served, {"requests": 0, "failures": 0})
+            stats["requests"] += 1
+            stats["failures"] += failed
+    
+    async def generate_sentences(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_sentences: int,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+        role: Optional[str] = None,
+        difficulty: Optional[str] = None,
+        priority: str = INTERACTIVE_TURN
+    ) -> str:
+        """
+        Stream a reply and close the stream once max_sentences sentences are complete
+        
+        Everything after the limit would be cut anyway, so neither the tokens
+        nor the time to generate them are spent. Each stop counts the model's
+        measured average tail as tokens and seconds saved; the average comes
+        from calibration runs (see _calibrate_tail) started for a
+        generation_tail_sample_rate share of stops.
+        
+        Returns:
+            The reply, at most max_sentences sentences long
+        """
+        limiter = SentenceLimiter(max_sentences)
+        chunks = await self.generate_response(
+            messages=messages,
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            timeout=timeout,
+            role=role,
+            difficulty=difficulty,
+            priority=priority
+        )
+        try:
+            async for chunk in chunks:
+                if limiter.feed(chunk):
+                    break
+        finally:
+            # Closes the HTTP stream (and frees its scheduler slot) instead of reading the remaining tokens
+            await chunks.aclose()
+        if not limiter.done:
+            return limiter.text()
+        
+        served = (served_models.get() or {}).get(role) or model
+        GENERATION_EARLY_STOPS.inc(model=served)
+        estimate = self.tail_estimates.get(served)
+        if estimate:
+            GENERATION_TOKENS_SAVED.inc(estimate["tokens"], model=served)
+            GENERATION_SECONDS_SAVED.inc(estimate["seconds"], model=served)
+        if served not in self._tail_samplers and random.random() < settings.generation_tail_sample_rate:
+            calibration = self._calibrate_tail(messages, served, max_sentences, temperature, max_tokens)
+            # Started in an empty context: not part of the player's turn, trace or cost budget
+            task = contextvars.Context().run(asyncio.create_task, calibration)
+            self._tail_samplers[served] = task
+            task.add_done_callback(lambda _: self._tail_samplers.pop(served, None))
+        return limiter.text()
+    
+    async def _calibrate_tail(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_sentences: int,
+        temperature: float,
+        max_tokens: Optional[int]
+    ) -> None:
+        """
+        Measure what a model writes past the sentence limit and fold it into its tail estimate
+        
+        Repeats the stopped request in full at BACKGROUND priority, so it
+        waits behind live players and costs a whole extra completion.
+        """
+        limiter = SentenceLimiter(max_sentences)
+        parts: List[str] = []
+        cut_at: Optional[float] = None
+        try:
+            chunks = await self.generate_response(
+                messages=messages,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                priority=BACKGROUND
+            )
+            try:
+                async for chunk in chunks:
+                    if cut_at is not None:
+                        parts.append(chunk)
+                    elif limiter.feed(chunk):
+                        cut_at = time.monotonic()
+                        parts.append(limiter.tail())
+            finally:
+                await chunks.aclose()
+        except Exception as e:
+            log.debug("Tail calibration failed", model=model, error=str(e))
+            return
+        if cut_at is None:
+            # This run stayed within the limit: nothing past the cut to measure
+            return
+        tokens, seconds = estimate_tokens("".join(parts)), time.monotonic() - cut_at
+        estimate = self.tail_estimates.get(model)
+        if estimate is None:
+            self.tail_estimates[model] = {"tokens": float(tokens), "seconds": seconds, "samples": 1}
+            return
+        estimate["tokens"] = 0.2 * tokens + 0.8 * estimate["tokens"]
+        estimate["seconds"] = 0.2 * seconds + 0.8 * estimate["seconds"]
+        estimate["samples"] += 1
+    
+    @classmethod
+    def get_json_parse_stats(cls) -> Dict[str, Dict[str, Any]]:
+        """Per-model JSON parse request/failure counts and failure rate"""
+        return {
+            model: {**stats, "failure_rate": stats["failures"] / stats["requests"] if stats["requests"] else 0.0}
+            for model, stats in cls.json_parse_stats.items()
+        }
+    
+    async def _get_complete_response(
+        self,
+        headers: Dict[str, str],
+        payload: Dict[str, Any],
+        timeout: Optional[float] = None,
+        priority: str = INTERACTIVE_TURN,
+        role: Optional[str] = None
+    ) -> str:
+        """Get complete non-streaming response (retried, optionally hedged)"""
+        deadline = time.monotonic() + (timeout or 60.0)
+        try:
+            result = await self._hedged(
+                payload["model"],
+                lambda: self._post_with_retry(headers, payload, deadline, priority)
+            )
+            
+            self._record_usage(payload["model"], role, result.get("usage"))
+            
+            # Extract text from response
+            choices = result.get("choices", [])
+            if choices:
+                return choices[0].get("message", {}).get("content", "")
+            return ""
+        except httpx.HTTPStatusError as e:
+            # Get detailed error message from response
+            error_detail = f"HTTP {e.response.status_code}"
+            try:
+                error_body = e.response.json()
+                if "error" in error_body:
+                    error_detail = error_body["error"].get("message", str(error_body["error"]))
+                elif "detail" in error_body:
+                    error_detail = error_body["detail"]
+            except:
+                error_detail = e.response.text[:500] if e.response.text else str(e)
+            raise OpenRouterError(
+                f"OpenRouter API error: {error_detail}",
+                status_code=e.response.status_code,
+                transient=e.response.status_code in RETRYABLE_STATUS_CODES or e.response.status_code >= 500
+            )
+        except httpx.TimeoutException as e:
+            raise TimeoutError(f"OpenRouter request timed out: {str(e)}")
+        except httpx.RequestError as e:
+            raise OpenRouterError(f"Request to OpenRouter failed: {str(e)}", transient=True)
+    
+    async def _post_with_retry(
+        self,
+        headers: Dict[str, str],
+        payload: Dict[str, Any],
+        deadline: float,
+        priority: str = INTERACTIVE_TURN
+    ) -> Dict[str, Any]:
+        """POST a completion, retrying 429/5xx and transport errors with jittered backoff"""
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise httpx.TimeoutException("Deadline exceeded before OpenRouter request")
+            started = time.monotonic()
+            try:
+                with tracer.span("openrouter.chat_completion", model=payload["model"], attempt=attempt, priority=priority) as span:
+                    async with upstream_scheduler.slot(OPENROUTER, priority), upstream_client(timeout=remaining) as client:
+                        response = await client.post(
+                            f"{self.base_url}/chat/completions",
+                            content=json_codec.dumps(payload),
+                            headers=headers
+                        )
+                    span.set_attribute("http.status_code", response.status_code)
+            except httpx.TransportError as e:
+                delay = self._retry_delay(attempt, None, deadline)
+                if delay is None:
+                    raise
+                log.warning("Transport error, retrying", model=payload["model"], error=type(e).__name__, retry=attempt + 1, delay_seconds=round(delay, 2))
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    response.raise_for_status()
+                    self._record_latency(payload["model"], time.monotonic() - started)
+                    return json_codec.loads(response.content)
+                delay = self._retry_delay(attempt, response, deadline)
+                if delay is None:
+                    response.raise_for_status()
+                log.warning("Retryable HTTP status, retrying", model=payload["model"], status=response.status_code, retry=attempt + 1, delay_seconds=round(delay, 2))
+            
+            attempt += 1
+            await asyncio.sleep(delay)
+    
+    def _retry_delay(
+        self,
+        attempt: int,
+        response: Optional[httpx.Response],
+        deadline: float
+    ) -> Optional[float]:
+        """
+        Delay before the next attempt, or None if we should give up
+        
+        Honors Retry-After when present, otherwise uses full-jitter
+        exponential backoff. Gives up when retries are exhausted or the
+        delay would run past the deadline.
+        """
+        if attempt >= settings.openrouter_max_retries:
+            return None
+        
+        delay = None
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    retry_at = parsedate_to_datetime(retry_after)
+                    delay = (retry_at - datetime.now(timezone.utc)).total_seconds()
+                except (TypeError, ValueError):
+                    delay = None
+        if delay is None:
+            ceiling = min(settings.openrouter_backoff_max, settings.openrouter_backoff_base * (2 ** attempt))
+            delay = random.uniform(0, ceiling)
+        delay = max(0.0, delay)
+        
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+    
+    def _record_latency(self, model: str, seconds: float) -> None:
+        """Keep a window of recent successful latencies per model for hedging"""
+        samples = self._latency_samples.get(model)
+        if samples is None:
+            samples = self._latency_samples[model] = deque(maxlen=200)
+        samples.append(seconds)
+    
+    def _hedge_delay(self, model: str) -> Optional[float]:
+        """Observed p95 latency for the model, or None if hedging is off or data is thin"""
+        if not settings.openrouter_hedge_enabled:
+            return None
+        samples = self._latency_samples.get(model)
+        if not samples or len(samples) < settings.openrouter_hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return max(settings.openrouter_hedge_min_delay, p95)
+    
+    async def _hedged(self, model: str, attempt: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Run an idempotent request, firing a second copy if the first is slower than p95
+        
+        Whichever copy succeeds first wins and the other is cancelled. If one
+        copy fails, the other is still awaited. Every copy is cancelled when
+        the caller is (e.g. by the turn deadline). Only non-streaming calls
+        are hedged; streams (generation, judge, semantic check) are not.
+        """
+        delay = self._hedge_delay(model)
+        if delay is None:
+            return await attempt()
+        
+        tasks = [asyncio.create_task(attempt())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return tasks[0].result()
+            
+            log.info("Slower than p95, sending hedged request", model=model, delay_seconds=round(delay, 2))
+            tasks.append(asyncio.create_task(attempt()))
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
     async def _stream_response(
         self,
         headers: Dict[str, str],
-        payload: Dict[str, Any]
+        payload: Dict[str, Any],
+        timeout: Optional[float] = None,
+        priority: str = INTERACTIVE_TURN,
+        role: Optional[str] = None
     ) -> AsyncIterator[str]:
-        """Stream response chunks"""
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            async with client.stream(
-                "POST",
-                f"{self.base_url}/chat/completions",
-                json=payload,
-                headers=headers
-            ) as response:
-                response.raise_for_status()
-                
-                async for line in response.aiter_lines():
-                    if line.startswith("data: "):
-                        data_str = line[6:]  # Remove "data: " prefix
-                        if data_str == "[DONE]":
-                            break
+        """Stream response chunks (retried only until the first chunk arrives)"""
+        deadline = time.monotonic() + (timeout or 60.0)
+        attempt = 0
+        while True:
+            started = False
+            delay = None
+            # Not activated: this generator runs in the consumer's context between yields
+            with tracer.span(
+                "openrouter.chat_completion_stream", activate=False, model=payload["model"], attempt=attempt, priority=priority
+            ) as span:
+                async with upstream_scheduler.slot(OPENROUTER, priority), upstream_client(timeout=max(0.1, deadline - time.monotonic())) as client:
+                    try:
+                        async with client.stream(
+                            "POST",
+                            f"{self.base_url}/chat/completions",
+                            content=json_codec.dumps(payload),
+                            headers=headers
+                        ) as response:
+                            span.set_attribute("http.status_code", response.status_code)
+                            if response.status_code in RETRYABLE_STATUS_CODES:
+                                delay = self._retry_delay(attempt, response, deadline)
+                            if delay is None:
+                                if response.is_error:
+                                    # Error bodies are short; read so callers can tell what was rejected
+                                    await response.aread()
+                                response.raise_for_status()
                             
-                        try:
-                            import json
-                            data = json.loads(data_str)
-                            choices = data.get("choices", [])
-                            if choices:
-                                delta = choices[0].get("delta", {})
-                                content = delta.get("content", "")
-                                if content:
-                                    yield content
-                        except json.JSONDecodeError:
-                            continue
-
-
-
-
-
+                                streamed: List[str] = []
+                                usage_seen = False
+                                try:
+                                    async for line in response.aiter_lines():
+                                        if line.startswith("data: "):
+                                            data_str = line[6:]  # Remove "data: " prefix
+                                            if data_str == "[DONE]":
+                                                break
+                                        
+                                            try:
+                                                data = json_codec.loads(data_str)
+                                                if data.get("usage"):
+                                                    # Final chunk; absent when the caller stops the stream early
+                                                    usage_seen = True
+                                                    self._record_usage(payload["model"], role, data["usage"])
+                                                choices = data.get("choices", [])
+                                                if choices:
+                                                    delta = choices[0].get("delta", {})
+                                                    content = delta.get("content", "")
+                                                    if content:
+                                                        if not started:
+                                                            span.add_event("first_chunk")
+                                                        started = True
+                                                        streamed.append(content)
+                                                        yield content
+                                            except json_codec.DecodeError:
+                                                continue
+                                except GeneratorExit:
+                                    if not usage_seen and streamed:
+                                        # Closed before the usage chunk: account an estimate instead
+                                        self._record_usage(payload["model"], role, self._estimate_usage(payload, "".join(streamed)))
+                                    raise
+                                return
+                            log.warning("Retryable HTTP status on stream, retrying", model=payload["model"], status=response.status_code, retry=attempt + 1, delay_seconds=round(delay, 2))
+                    except httpx.TransportError as e:
+                        # Once text was handed to the caller the stream cannot be replayed
+                        delay = None if started else self._retry_delay(attempt, None, deadline)
+                        if delay is None:
+                            raise
+                        log.warning("Transport error on stream, retrying", model=payload["model"], error=type(e).__name__, retry=attempt + 1, delay_seconds=round(delay, 2))
+            
+            attempt += 1
+            await asyncio.sleep(delay)
@@ -5,12 +5,28 @@ from typing import Dict, Any, Optional
 from backend.graph.conversation import ConversationGraph
 from backend.services.elevenlabs_service import ElevenLabsService
 from backend.services.gpt_audio_service import GPTAudioService
-from backend.models.game import GameState, ConversationResponse
-from backend.config import FORBIDDEN_PHRASE, settings
+from backend.models.game import GameState, ConversationResponse, HistoryPage, HistoryTurn
+from backend.config import DIFFICULTY_LEVELS, FORBIDDEN_PHRASE, settings
 from backend.services.validation import ValidationService
+from backend.services.admission import AdmissionController
+from backend.services.upstream import INTERACTIVE_AUDIO
+from backend.services.metrics import TURN_SECONDS, FAST_PATH_TURNS
+from backend.services.cost_tracker import cost_tracker, BudgetSpentError, BUDGET_DOWNGRADE, BUDGET_END
+from backend.services.log import get_logger
+from backend.services.game_feed import GameFeed
+from backend.services.idempotency import IdempotencyCache
+from backend.services.fast_path import count_repeats, finished_reply, repeat_reply
+from datetime import datetime, timedelta
+import asyncio
+import time
 import uuid
 import re
 
+log = get_logger("pirate")
+
+# Seconds between sweeps for idle games (the sweep runs on game start)
+EVICTION_INTERVAL_SECONDS = 60.0
+
 
 class PirateService:
     """Service for managing pirate conversations"""
@@ -21,6 +37,12 @@ class PirateService:
         self.gpt_audio_service = GPTAudioService()
         self.validation_service = ValidationService()
         self.games: Dict[str, GameState] = {}
+        self.admission = AdmissionController()
+        self.feed = GameFeed()
+        self.idempotency = IdempotencyCache()
+        # One lock per game: a game's turns (fast paths included) never interleave
+        self._turn_locks: Dict[str, asyncio.Lock] = {}
+        self._last_eviction = time.monotonic()
         
     def start_game(
         self,
@@ -28,6 +50,7 @@ class PirateService:
         pirate_name: str = "Kapitan"
     ) -> GameState:
         """Start a new game"""
+        self._evict_idle_games()
         game_id = str(uuid.uuid4())
         
         game_state = GameState(
@@ -45,25 +68,75 @@ class PirateService:
         user_message: str,
         include_audio: bool = False
     ) -> ConversationResponse:
-        """Process a conversation message"""
+        """
+        Process a conversation message
+        
+        Turns of one game run one at a time, in arrival order. Finished games
+        and repeats of the player's recent messages are answered right away,
+        without an admission slot or any model call.
+        
+        Raises:
+            ValueError: If the game does not exist
+            OverloadedError: If the server is at capacity and the turn was not admitted
+            BudgetSpentError: If today's global budget is spent and BUDGET_ACTION is "end"
+        """
         game_state = self.games.get(game_id)
         if not game_state:
             raise ValueError(f"Game {game_id} not found")
         
+        async with self._turn_locks.setdefault(game_id, asyncio.Lock()):
+            if game_state.is_won or game_state.is_lost:
+                return self._finished_response(game_state)
+            if game_state.budget_exhausted:
+                return self._budget_exhausted_response(game_state)
+            repeats = count_repeats(
+                game_state.conversation_history, user_message, settings.repeat_window_turns, settings.repeat_min_chars
+            )
+            if repeats:
+                return await self._repeat_turn(game_state, user_message, repeats)
+            
+            difficulty = getattr(game_state.difficulty, "value", game_state.difficulty)
+            async with self.admission.admit():
+                with TURN_SECONDS.time(difficulty=difficulty), cost_tracker.game_scope(game_id, difficulty) as usage:
+                    budget = cost_tracker.budget_state(game_id)
+                    if budget == BUDGET_END and not cost_tracker.game_budget_spent(game_id):
+                        # Only the global daily budget is spent: refuse the turn, the game itself goes on
+                        raise BudgetSpentError("Daily cost budget spent", cost_tracker.seconds_until_reset())
+                    if budget == BUDGET_END or game_state.budget_exhausted:
+                        return self._budget_exhausted_response(game_state)
+                    usage.downgraded = budget == BUDGET_DOWNGRADE
+                    return await self._process_turn(game_state, game_id, user_message, include_audio)
+    
+    async def _process_turn(
+        self,
+        game_state: GameState,
+        game_id: str,
+        user_message: str,
+        include_audio: bool
+    ) -> ConversationResponse:
+        """Run one admitted conversation turn"""
+        # Lagged merit mode: commit the previous turn's judge result before this turn starts
+        committed = await self.conversation_graph.commit_pending_merit(game_id)
+        if committed:
+            self._commit_merit(game_state, committed)
+        
         # Detect player persona/strategy from message
         persona = self._detect_persona(user_message)
         strategy = self._detect_strategy(user_message)
         
         if persona and persona not in game_state.player_personas:
             game_state.player_personas.append(persona)
+            game_state.pinned_facts.append(self._pin_fact("persona", persona, user_message))
         if strategy and strategy not in game_state.strategies_attempted:
             game_state.strategies_attempted.append(strategy)
+            game_state.pinned_facts.append(self._pin_fact("strategia", strategy, user_message))
         
         # Add user message to history
         game_state.conversation_history.append({
             "role": "user",
             "content": user_message
         })
+        self._touch(game_state)
         
         # Process through LangGraph
         result = await self.conversation_graph.process_message(
@@ -72,18 +145,25 @@ class PirateService:
             difficulty=game_state.difficulty,
             conversation_history=game_state.conversation_history,
             strategies_attempted=game_state.strategies_attempted,
-            player_personas=game_state.player_personas
+            player_personas=game_state.player_personas,
+            pinned_facts=game_state.pinned_facts,
+            committed_merit={
+                "merit_score": game_state.merit_score,
+                "merit_has_earned_it": game_state.merit_has_earned_it,
+                "negative_categories": game_state.negative_categories
+            }
         )
         
-        # Update game state
-        game_state.merit_score = result["merit_score"]
+        # Update game state (a lagged, not yet finished judge is committed next turn)
+        if result.get("merit_fresh", True):
+            self._commit_merit(game_state, result)
         game_state.conversation_history.append({
             "role": "pirate",
             "content": result["pirate_response"]
         })
         
         # Check for loss condition (score below loss threshold)
-        is_lost = result.get("is_lost", False)
+        is_lost = result.get("is_lost", False) or bool(committed and committed.get("is_lost"))
         if is_lost:
             game_state.is_lost = True
         
@@ -94,6 +174,10 @@ class PirateService:
             # Check if win was via phrase or just high deception score
             win_phrase_detected = self.validation_service.contains_forbidden_phrase(result["pirate_response"])
             game_state.win_phrase_detected = win_phrase_detected
+        self._touch(game_state)
+        if is_won or is_lost:
+            # Later messages get the finished fast path, which never needs the summaries or a judge
+            self.conversation_graph.forget_game(game_id)
         
         # Build negative categories dict for response
         negative_categories = None
@@ -109,40 +193,37 @@ class PirateService:
             if settings.use_gpt_audio:
                 # Use GPT Audio with streaming
                 try:
-                    print(f"[Audio] Using GPT Audio streaming for response (length: {len(pirate_response)}): {pirate_response[:50]}...")
+                    log.debug("Using GPT Audio streaming", game_id=game_id, length=len(pirate_response))
                     # Return streaming endpoint instead of generating audio synchronously
                     streaming_audio_endpoint = f"/api/game/conversation/stream-audio"
-                    print(f"[Audio] Streaming audio endpoint available: {streaming_audio_endpoint}")
                 except Exception as e:
-                    print(f"[Audio] GPT Audio setup failed: {e}")
-                    import traceback
-                    traceback.print_exc()
+                    log.exception("GPT Audio setup failed", game_id=game_id, error=str(e))
                     # Fallback to ElevenLabs if GPT Audio fails
                     try:
-                        print(f"[Audio] Falling back to ElevenLabs...")
+                        log.info("Falling back to ElevenLabs", game_id=game_id)
                         audio_url = await self.elevenlabs_service.generate_speech(
                             text=pirate_response,
-                            wait_for_completion=True
+                            wait_for_completion=True,
+                            priority=INTERACTIVE_AUDIO
                         )
-                        print(f"[Audio] ElevenLabs audio generated successfully: {audio_url}")
+                        log.debug("ElevenLabs audio generated", game_id=game_id, audio_url=audio_url)
                     except Exception as e2:
-                        print(f"[Audio] ElevenLabs fallback also failed: {e2}")
+                        log.warning("ElevenLabs fallback also failed", game_id=game_id, error=str(e2))
             else:
                 # Use ElevenLabs (legacy)
                 try:
-                    print(f"[Audio] Generating audio with ElevenLabs (length: {len(pirate_response)}): {pirate_response[:50]}...")
+                    log.debug("Generating audio with ElevenLabs", game_id=game_id, length=len(pirate_response))
                     audio_url = await self.elevenlabs_service.generate_speech(
                         text=pirate_response,
-                        wait_for_completion=True
+                        wait_for_completion=True,
+                        priority=INTERACTIVE_AUDIO
                     )
-                    print(f"[Audio] Audio generated successfully: {audio_url}")
+                    log.debug("Audio generated", game_id=game_id, audio_url=audio_url)
                 except Exception as e:
-                    print(f"[Audio] Audio generation failed: {e}")
-                    import traceback
-                    traceback.print_exc()
+                    log.exception("Audio generation failed", game_id=game_id, error=str(e))
                     # Continue without audio - don't fail the request
         else:
-            print(f"[Audio] Skipping audio generation - empty or missing pirate_response")
+            log.info("Skipping audio generation, empty pirate response", game_id=game_id)
         
         return ConversationResponse(
             game_id=game_id,
@@ -153,13 +234,168 @@ class PirateService:
             is_won=is_won,
             is_lost=is_lost,
             win_phrase_detected=game_state.win_phrase_detected if is_won else False,
-            negative_categories=negative_categories
+            negative_categories=negative_categories,
+            degraded=bool(result.get("degraded_nodes")),
+            degraded_nodes=result.get("degraded_nodes", []),
+            served_models=result.get("served_models", {}),
+            budget_downgraded=cost_tracker.is_downgraded(),
+            version=game_state.version
         )
     
+    def _finished_response(self, game_state: GameState) -> ConversationResponse:
+        """Answer a message sent to a won or lost game; nothing is recorded"""
+        FAST_PATH_TURNS.inc(reason="finished")
+        return ConversationResponse(
+            game_id=game_state.game_id,
+            pirate_response=finished_reply(game_state.is_won),
+            merit_score=game_state.merit_score,
+            is_won=game_state.is_won,
+            is_lost=game_state.is_lost,
+            win_phrase_detected=game_state.win_phrase_detected,
+            negative_categories=game_state.negative_categories,
+            version=game_state.version
+        )
+    
+    async def _repeat_turn(self, game_state: GameState, user_message: str, repeats: int) -> ConversationResponse:
+        """
+        Answer a message the player already sent in recent turns with a canned reply
+        
+        The judge would score the repeat as repetitive_strategy anyway, so the
+        penalty is applied here instead: repeat_penalty points off the merit
+        score. The category shows them up to the judge's -15 cap; past it the
+        score keeps dropping, so spamming never becomes free.
+        """
+        FAST_PATH_TURNS.inc(reason="repeat")
+        game_id = game_state.game_id
+        committed = await self.conversation_graph.commit_pending_merit(game_id)
+        if committed:
+            self._commit_merit(game_state, committed)
+        
+        categories = dict(game_state.negative_categories or {})
+        previous = categories.get("repetitive_strategy", 0)
+        penalty = -settings.repeat_penalty
+        shown = max(-15, previous + penalty) - previous
+        categories["repetitive_strategy"] = previous + shown
+        categories["negative_total"] = categories.get("negative_total", 0) + shown
+        game_state.negative_categories = categories
+        game_state.merit_score = max(-100, game_state.merit_score + penalty)
+        
+        difficulty = getattr(game_state.difficulty, "value", game_state.difficulty)
+        loss_threshold = DIFFICULTY_LEVELS.get(difficulty, DIFFICULTY_LEVELS["easy"]).get("loss_threshold", -30)
+        if game_state.merit_score <= loss_threshold:
+            game_state.is_lost = True
+        
+        pirate_response = repeat_reply(repeats)
+        game_state.conversation_history.append({"role": "user", "content": user_message})
+        game_state.conversation_history.append({"role": "pirate", "content": pirate_response})
+        self._touch(game_state)
+        log.info("Repeated message answered without the graph", game_id=game_id, repeats=repeats, penalty=penalty)
+        return ConversationResponse(
+            game_id=game_id,
+            pirate_response=pirate_response,
+            merit_score=game_state.merit_score,
+            is_lost=game_state.is_lost,
+            negative_categories=game_state.negative_categories,
+            version=game_state.version
+        )
+    
+    def _budget_exhausted_response(self, game_state: GameState) -> ConversationResponse:
+        """End the game without calling any model once its own cost budget is spent"""
+        FAST_PATH_TURNS.inc(reason="budget_exhausted")
+        if not game_state.budget_exhausted:
+            log.info("Game ended, cost budget spent", game_id=game_state.game_id)
+            game_state.budget_exhausted = True
+            self._touch(game_state)
+        return ConversationResponse(
+            game_id=game_state.game_id,
+            pirate_response="Arrr, Kapitan zwija żagle i odpływa. Na dziś koniec rozmów!",
+            merit_score=game_state.merit_score,
+            is_won=game_state.is_won,
+            is_lost=game_state.is_lost,
+            negative_categories=game_state.negative_categories,
+            budget_exhausted=True,
+            version=game_state.version
+        )
+    
+    def _commit_merit(self, game_state: GameState, merit: Dict[str, Any]) -> None:
+        """Commit a judge verdict to the game state"""
+        game_state.merit_score = merit["merit_score"]
+        game_state.merit_has_earned_it = merit["merit_has_earned_it"]
+        game_state.negative_categories = merit.get("negative_categories")
+        if merit.get("is_lost"):
+            game_state.is_lost = True
+    
+    def _touch(self, game_state: GameState) -> None:
+        """Record a change to the game: bump its version (the ETag), update time and notify feed subscribers"""
+        game_state.version += 1
+        game_state.updated_at = datetime.now()
+        self.feed.publish(game_state)
+    
+    def _evict_idle_games(self) -> None:
+        """
+        Drop games idle for game_retention_seconds, with their per-game state elsewhere
+
+        Runs at most every EVICTION_INTERVAL_SECONDS. Games with a turn in
+        progress or a feed subscriber are kept.
+        """
+        if settings.game_retention_seconds <= 0 or time.monotonic() - self._last_eviction < EVICTION_INTERVAL_SECONDS:
+            return
+        self._last_eviction = time.monotonic()
+        cutoff = datetime.now() - timedelta(seconds=settings.game_retention_seconds)
+        idle = [
+            game_id for game_id, game_state in self.games.items()
+            if game_state.updated_at < cutoff
+            and not (game_id in self._turn_locks and self._turn_locks[game_id].locked())
+            and not self.feed.is_followed(game_id)
+        ]
+        for game_id in idle:
+            del self.games[game_id]
+            self._turn_locks.pop(game_id, None)
+            self.conversation_graph.forget_game(game_id)
+            cost_tracker.forget(game_id)
+        if idle:
+            log.info("Idle games evicted", games=len(idle), remaining=len(self.games))
+    
     def get_game_state(self, game_id: str) -> Optional[GameState]:
         """Get game state"""
         return self.games.get(game_id)
     
+    def get_history_page(self, game_id: str, since_turn: int = 0, limit: int = 50) -> Optional[HistoryPage]:
+        """
+        Read a window of the conversation history
+        
+        Args:
+            game_id: Game identifier
+            since_turn: First message to return (position in the history, from 0)
+            limit: Maximum number of messages to return
+            
+        Returns:
+            The page, or None if the game does not exist
+        """
+        game_state = self.games.get(game_id)
+        if not game_state:
+            return None
+        history = game_state.conversation_history
+        end = min(len(history), since_turn + limit)
+        return HistoryPage(
+            game_id=game_id,
+            version=game_state.version,
+            total_turns=len(history),
+            turns=[
+                HistoryTurn(turn=turn, role=history[turn]["role"], content=history[turn]["content"])
+                for turn in range(since_turn, end)
+            ],
+            next_turn=max(end, since_turn),
+            has_more=end < len(history)
+        )
+    
+    def _pin_fact(self, kind: str, label: str, message: str) -> str:
+        """Build a pinned fact quoting the message where a persona/strategy first appeared"""
+        excerpt = " ".join(message.split())
+        if len(excerpt) > 160:
+            excerpt = excerpt[:160].rstrip() + "…"
+        return f"{kind} {label}: \"{excerpt}\""
+    
     def _detect_persona(self, message: str) -> Optional[str]:
         """Detect player persona from message (may be false/deceptive)"""
         message_lower = message.lower()
@@ -0,0 +1,228 @@
+"""
+Semantic check batcher - classifies replies from concurrent games in a single LLM request
+"""
+import asyncio
+import contextvars
+from typing import Any, Dict, List, Optional, Tuple
+from backend.config import settings
+from backend.services.context_builder import estimate_tokens
+from backend.services.openrouter_service import served_models, record_served_model
+from backend.services.upstream import INTERACTIVE_TURN
+from backend.services.validation import (
+    ValidationService,
+    TREASURE_EXAMPLES,
+    SEMANTIC_CHECK_SYSTEM_PROMPT
+)
+from backend.services.log import get_logger
+
+log = get_logger("semantic_batch")
+
+BATCH_CHECK_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "index": {"type": "integer"},
+                    "is_similar": {"type": "boolean"},
+                    "confidence": {"type": "number"}
+                },
+                "required": ["index", "is_similar", "confidence"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["results"],
+    "additionalProperties": False
+}
+
+
+class SemanticCheckBatcher:
+    """
+    Collects pending semantic treasure checks and sends them as one request
+
+    Checks arriving within the collection window (or until the batch is
+    full) share a single prompt with the few-shot examples. Items missing
+    from the batch answer, or a whole failed batch, fall back to the
+    per-item ValidationService check.
+
+    The shared request serves several games, so its cost is not charged to
+    any of them: it counts toward the global, daily and per-model totals
+    only. A single-item batch and fallback checks run in their own turn's
+    context and are charged to that game.
+    """
+
+    def __init__(
+        self,
+        validation_service: ValidationService,
+        llm_service,
+        window_ms: Optional[int] = None,
+        max_batch_size: Optional[int] = None
+    ):
+        self.validation_service = validation_service
+        self.llm_service = llm_service
+        self.window = (window_ms if window_ms is not None else settings.semantic_batch_window_ms) / 1000
+        self.max_batch_size = max_batch_size or settings.semantic_batch_max_size
+        # (reply, future for its verdict, context of the turn that queued it)
+        self._pending: List[Tuple[str, asyncio.Future, contextvars.Context]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self.stats: Dict[str, int] = {
+            "checks": 0,
+            "batches": 0,
+            "upstream_requests": 0,
+            "fallback_items": 0,
+            "prompt_tokens_estimated": 0
+        }
+
+    async def check(self, text: str) -> Tuple[bool, float]:
+        """
+        Queue a reply for the next batch and wait for its verdict
+
+        Args:
+            text: Pirate reply to classify
+
+        Returns:
+            Tuple of (is_similar, confidence) as in detects_similar_treasure_phrase_llm
+        """
+        if not text or not text.strip():
+            return False, 0.0
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, contextvars.copy_context()))
+        self.stats["checks"] += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        verdict, model = await future
+        # The batch ran in another game's task, so note the serving model for this turn here
+        record_served_model("semantic_check", model)
+        return verdict
+
+    def prompt_tokens_per_check(self) -> float:
+        """Average estimated prompt tokens spent per classified reply"""
+        return self.stats["prompt_tokens_estimated"] / self.stats["checks"] if self.stats["checks"] else 0.0
+
+    def _flush(self) -> None:
+        """Send everything collected so far as one batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        # A fresh context, not the turn (game) that happened to fill the batch or start its timer
+        task = contextvars.Context().run(asyncio.get_running_loop().create_task, self._run_batch(batch))
+        # Keep a reference so the task is not garbage collected mid-flight
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future, contextvars.Context]]) -> None:
+        """Classify a batch and resolve each waiting future with (verdict, serving model)"""
+        # Runs in its own task context: collect the serving model here instead of in the triggering turn
+        served: Dict[str, str] = {}
+        served_models.set(served)
+        self.stats["batches"] += 1
+        if len(batch) == 1:
+            await self._check_individually(batch, fallback=False)
+            return
+
+        verdicts: Dict[int, Tuple[bool, float]] = {}
+        try:
+            verdicts = await self._classify(batch)
+        except Exception as e:
+            log.warning("Semantic batch failed, checking items individually", size=len(batch), error=str(e))
+
+        missing = []
+        for index, (text, future, context) in enumerate(batch, start=1):
+            if future.done():
+                continue
+            if index in verdicts:
+                future.set_result((verdicts[index], served.get("semantic_check")))
+            else:
+                missing.append((text, future, context))
+
+        if missing:
+            await self._check_individually(missing)
+
+    async def _classify(self, batch: List[Tuple[str, asyncio.Future, contextvars.Context]]) -> Dict[int, Tuple[bool, float]]:
+        """One upstream request for a numbered list of replies"""
+        numbered = "\n".join(
+            f"{index}. {' '.join(text.split())}" for index, (text, *_) in enumerate(batch, start=1)
+        )
+        prompt = f"""Dla każdej z poniższych ponumerowanych odpowiedzi pirata oceń, czy oznacza ona, że pirat oddaje skarb graczowi (czyli że skarb jest teraz dla gracza, że gracz może go wziąć, że pirat się zgadza dać skarb).
+
+Odpowiedz TYLKO w formacie JSON, bez żadnych dodatkowych komentarzy:
+{{
+  "results": [{{"index": <numer odpowiedzi>, "is_similar": true/false, "confidence": 0.0-1.0}}, ...]
+}}
+Zwróć dokładnie jeden wynik dla każdej odpowiedzi.
+
+{TREASURE_EXAMPLES}
+
+Odpowiedzi pirata do przeanalizowania:
+{numbered}"""
+
+        messages = [
+            {"role": "system", "content": SEMANTIC_CHECK_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+        self.stats["upstream_requests"] += 1
+        self.stats["prompt_tokens_estimated"] += estimate_tokens(SEMANTIC_CHECK_SYSTEM_PROMPT) + estimate_tokens(prompt)
+
+        result = await self.llm_service.generate_json(
+            messages=messages,
+            model=self.validation_service.semantic_model,
+            schema=BATCH_CHECK_SCHEMA,
+            schema_name="treasure_check_batch",
+            temperature=0.1,
+            max_tokens=40 * len(batch) + 50,
+            role="semantic_check",
+            priority=INTERACTIVE_TURN
+        )
+
+        verdicts = {}
+        for item in result.get("results", []):
+            try:
+                index = int(item["index"])
+                verdicts[index] = self.validation_service.apply_confidence_threshold(
+                    bool(item.get("is_similar", False)),
+                    float(item.get("confidence", 0.0))
+                )
+            except (KeyError, TypeError, ValueError):
+                continue
+        return verdicts
+
+    async def _check_individually(
+        self,
+        items: List[Tuple[str, asyncio.Future, contextvars.Context]],
+        fallback: bool = True
+    ) -> None:
+        """Per-item check through the regular single-reply path, in the context (and game) of the turn that queued it"""
+        if fallback:
+            self.stats["fallback_items"] += len(items)
+        self.stats["upstream_requests"] += len(items)
+        self.stats["prompt_tokens_estimated"] += sum(
+            estimate_tokens(SEMANTIC_CHECK_SYSTEM_PROMPT) + estimate_tokens(TREASURE_EXAMPLES) + estimate_tokens(text)
+            for text, *_ in items
+        )
+
+        async def run(text: str, future: asyncio.Future) -> None:
+            served: Dict[str, str] = {}
+            served_models.set(served)
+            try:
+                verdict = await self.validation_service.detects_similar_treasure_phrase_llm(text, self.llm_service)
+            except Exception as e:
+                log.warning("Individual semantic check failed, defaulting to False", error=str(e))
+                verdict = (False, 0.0)
+            if not future.done():
+                future.set_result((verdict, served.get("semantic_check")))
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(context.run(loop.create_task, run(text, future)) for text, future, context in items))
@@ -0,0 +1,98 @@
+"""
+Sentence limiter - incremental Polish sentence boundary detection over streamed text
+"""
+from typing import Optional
+
+TERMINATORS = ".!?…"
+# Closing quotes and brackets that belong to the sentence they follow
+CLOSERS = "\"'”»)"
+# Characters a following sentence may start with besides an uppercase letter or digit
+OPENERS = "„\"«("
+
+# Words that end with a period without ending the sentence (compared lowercased, without the period)
+ABBREVIATIONS = frozenset({
+    "np", "tzn", "tj", "itd", "itp", "m.in", "dr", "prof", "ok", "godz", "ul", "św", "tys", "mln", "mld",
+    "wg", "str", "kpt", "pt", "ur", "zob", "nr", "im", "al", "tel", "jw", "gen", "płk", "mjr", "por",
+    "inż", "mgr", "hab", "p.n.e", "n.e", "ang", "łac", "tzw", "ds", "wyd", "red", "ks", "bł"
+})
+
+# Fragments shorter than this ("Arrr!", "Ha!") are merged into the next sentence instead of counting
+MIN_SENTENCE_WORDS = 3
+
+
+class SentenceLimiter:
+    """
+    Tells when streamed text has reached max_sentences sentences
+
+    A sentence ends at ., !, ? or … (and any closing quotes after it) when
+    whitespace and then an uppercase letter, digit or opening quote follow,
+    so the end of sentence N is only confirmed once sentence N+1 starts.
+    Periods after abbreviations (np., tzn., m.in., ...), single letters
+    and numbers (Polish ordinals: "3. dnia") are not boundaries. Unclear
+    cases are not counted: a missed boundary costs only the saving, a
+    wrong one would cut the reply short.
+    """
+
+    def __init__(self, max_sentences: int):
+        self.max_sentences = max_sentences
+        self.sentences = 0
+        self._text = ""
+        self._scanned = 0
+        self._sentence_start = 0
+        self._candidate: Optional[int] = None  # End of a possible sentence, awaiting what follows
+        self._space_seen = False
+        self._cut: Optional[int] = None
+
+    @property
+    def done(self) -> bool:
+        return self._cut is not None
+
+    def feed(self, chunk: str) -> bool:
+        """Add streamed text; True once max_sentences sentences are complete"""
+        if self._cut is not None:
+            return True
+        self._text += chunk
+        text = self._text
+        for index in range(self._scanned, len(text)):
+            char = text[index]
+            if self._candidate is not None:
+                if char.isspace():
+                    self._space_seen = True
+                    continue
+                if not self._space_seen and (char in TERMINATORS or char in CLOSERS):
+                    self._candidate = index + 1
+                    continue
+                if self._space_seen and (char.isupper() or char.isdigit() or char in OPENERS):
+                    self._confirm(self._candidate)
+                    if self._cut is not None:
+                        self._scanned = index + 1
+                        return True
+                self._candidate = None
+            if char in TERMINATORS and not (char == "." and self._abbreviation(index)):
+                self._candidate = index + 1
+                self._space_seen = False
+        self._scanned = len(text)
+        return False
+
+    def text(self) -> str:
+        """The text up to the cut, or everything fed so far if the limit was not reached"""
+        return (self._text if self._cut is None else self._text[:self._cut]).strip()
+
+    def tail(self) -> str:
+        """Text fed after the cut"""
+        return "" if self._cut is None else self._text[self._cut:]
+
+    def _confirm(self, end: int) -> None:
+        if len(self._text[self._sentence_start:end].split()) < MIN_SENTENCE_WORDS:
+            return
+        self.sentences += 1
+        self._sentence_start = end
+        if self.sentences >= self.max_sentences:
+            self._cut = end
+
+    def _abbreviation(self, period: int) -> bool:
+        start = period
+        while start > 0 and not self._text[start - 1].isspace():
+            start -= 1
+        word = self._text[start:period].lstrip(OPENERS + "-—–").lower()
+        return len(word) == 1 or word.isdigit() or word in ABBREVIATIONS
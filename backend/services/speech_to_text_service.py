@@ -4,8 +4,12 @@ Based on image_stand implementation
 """
 import httpx
 import base64
+import time
 from typing import Optional
 from backend.config import settings
+from backend.services.upstream import upstream_scheduler, upstream_client, OPENROUTER, INTERACTIVE_TURN
+from backend.services.metrics import STT_SECONDS
+from backend.services import json_codec
 
 
 class SpeechToTextService:
@@ -83,11 +87,13 @@ class SpeechToTextService:
             "max_tokens": 1000
         }
         
+        started = time.perf_counter()
+        outcome = "error"
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
+            async with upstream_scheduler.slot(OPENROUTER, INTERACTIVE_TURN), upstream_client(timeout=60.0) as client:
                 response = await client.post(
                     f"{self.base_url}/chat/completions",
-                    json=payload,
+                    content=json_codec.dumps(payload),
                     headers=headers
                 )
                 
@@ -104,7 +110,8 @@ class SpeechToTextService:
                         response=response
                     )
                 
-                result = response.json()
+                result = json_codec.loads(response.content)
+                outcome = "ok"
                 
                 # Extract text from response (OpenRouter returns OpenAI-compatible format)
                 if "choices" in result and len(result["choices"]) > 0:
@@ -124,4 +131,6 @@ class SpeechToTextService:
             raise ValueError(f"Speech-to-text API error: {error_detail}")
         except httpx.RequestError as e:
             raise ValueError(f"Request to speech-to-text API failed: {str(e)}")
+        finally:
+            STT_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
 
@@ -0,0 +1,322 @@
+"""
+Tracing - lightweight spans for conversation turns, graph nodes and upstream calls
+
+A turn starts a trace in send_message; spans opened while it runs (in the
+same task or in tasks it spawns) become its children through a ContextVar.
+Finished traces are handed to a background thread that writes them as
+JSONL and/or OTLP/JSON, so the request path only appends to a list.
+"""
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from backend.config import settings
+from backend.services.log import get_logger
+from backend.services import json_codec
+
+log = get_logger("tracing")
+
+
+class Span:
+    """One timed operation within a trace"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "events", "status", "error")
+
+    def __init__(self, trace: "_Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.events: List[Dict[str, Any]] = []
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes: Any) -> None:
+        """Point-in-time marker inside the span (e.g. an audio chunk arriving)"""
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3) if self.end_ns else None,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+            "events": self.events
+        }
+
+
+class _NoopSpan:
+    """Stand-in returned when the trace is not sampled; every call is a no-op"""
+
+    __slots__ = ()
+    span_id = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def add_event(self, name: str, **attributes: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _Trace:
+    """Spans of one sampled trace, exported together when the root span ends"""
+
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List[Span] = []
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class JsonlExporter:
+    """One JSON object per span, one span per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span]) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json_codec.dumps_str(span.to_dict(), default=str) + "\n")
+
+
+class OtlpJsonExporter:
+    """
+    OTLP/JSON ExportTraceServiceRequest per trace
+
+    Written one request per line to a file (the format of the OpenTelemetry
+    Collector file exporter, readable by its otlpjsonfile receiver) and/or
+    POSTed to an OTLP/HTTP endpoint's /v1/traces.
+    """
+
+    def __init__(self, path: Optional[str] = None, endpoint: Optional[str] = None, service_name: str = "pirate-backend"):
+        self.path = path
+        self.endpoint = endpoint.rstrip("/") if endpoint else None
+        self.service_name = service_name
+
+    def export(self, spans: List[Span]) -> None:
+        body = json_codec.dumps_str(self.to_otlp(spans), default=str)
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(body + "\n")
+        if self.endpoint:
+            import httpx
+            httpx.post(
+                f"{self.endpoint}/v1/traces",
+                content=body,
+                headers={"Content-Type": "application/json"},
+                timeout=5.0
+            )
+
+    def to_otlp(self, spans: List[Span]) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [self._attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "backend.services.tracing"},
+                    "spans": [self._span(span) for span in spans]
+                }]
+            }]
+        }
+
+    def _span(self, span: Span) -> Dict[str, Any]:
+        otlp = {
+            "traceId": span.trace.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns or span.start_ns),
+            "attributes": [self._attribute(k, v) for k, v in span.attributes.items()],
+            "events": [
+                {
+                    "timeUnixNano": str(event["time_ns"]),
+                    "name": event["name"],
+                    "attributes": [self._attribute(k, v) for k, v in event["attributes"].items()]
+                }
+                for event in span.events
+            ],
+            # STATUS_CODE_OK = 1, STATUS_CODE_ERROR = 2
+            "status": {"code": 1} if span.status == "ok" else {"code": 2, "message": span.error or ""}
+        }
+        if span.parent_id:
+            otlp["parentSpanId"] = span.parent_id
+        return otlp
+
+    @staticmethod
+    def _attribute(key: str, value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        return {"key": key, "value": typed}
+
+
+class Tracer:
+    """
+    Creates traces and spans and ships finished traces to the exporters
+
+    Sampling is decided once per trace: an unsampled trace (and everything
+    under it) costs a ContextVar lookup per span. Exporting happens on a
+    daemon thread fed by a bounded queue; when the queue is full the trace
+    is dropped and counted rather than slowing down requests.
+    """
+
+    def __init__(self, sample_rate: Optional[float] = None, exporters: Optional[List[Any]] = None, max_queue: int = 1000):
+        self.sample_rate = sample_rate if sample_rate is not None else settings.tracing_sample_rate
+        self.exporters = exporters if exporters is not None else self._configured_exporters()
+        self._queue: "queue.Queue[List[Span]]" = queue.Queue(maxsize=max_queue)
+        self._worker: Optional[threading.Thread] = None
+        self.dropped_traces = 0
+
+    @contextmanager
+    def start_trace(self, name: str, trace_id: Optional[str] = None, **attributes: Any) -> Iterator[Any]:
+        """
+        Open the root span of a new trace
+
+        Args:
+            name: Root span name
+            trace_id: 32 hex chars to use as trace ID (e.g. the turn ID); random if omitted
+            **attributes: Span attributes
+
+        Yields:
+            The root span, or NOOP_SPAN if the trace is not sampled
+        """
+        if not self.exporters or random.random() >= self.sample_rate:
+            token = _current_span.set(None)
+            try:
+                yield NOOP_SPAN
+            finally:
+                _current_span.reset(token)
+            return
+
+        trace = _Trace(trace_id or uuid.uuid4().hex)
+        try:
+            with self._open(trace, name, None, attributes) as span:
+                yield span
+        finally:
+            # Failed turns are the ones most worth looking at
+            self._enqueue(trace.spans)
+
+    @contextmanager
+    def span(self, name: str, activate: bool = True, **attributes: Any) -> Iterator[Any]:
+        """
+        Open a child of the current span (a no-op outside a sampled trace)
+
+        Args:
+            name: Span name
+            activate: Make it the current span for the block; pass False inside
+                async generators, whose ContextVar changes would leak into the
+                consumer between yields
+            **attributes: Span attributes
+
+        Yields:
+            The span, or NOOP_SPAN
+        """
+        parent = _current_span.get()
+        if parent is None:
+            yield NOOP_SPAN
+            return
+        with self._open(parent.trace, name, parent.span_id, attributes, activate) as span:
+            yield span
+
+    @contextmanager
+    def _open(
+        self,
+        trace: _Trace,
+        name: str,
+        parent_id: Optional[str],
+        attributes: Dict[str, Any],
+        activate: bool = True
+    ) -> Iterator[Span]:
+        span = Span(trace, name, parent_id, attributes)
+        trace.spans.append(span)
+        token = _current_span.set(span) if activate else None
+        try:
+            yield span
+        except GeneratorExit:
+            # Consumer stopped a stream early on purpose
+            span.set_attribute("closed_early", True)
+            raise
+        except BaseException as e:
+            span.status = "error"
+            span.error = f"{type(e).__name__}: {e}"[:500]
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            if token is not None:
+                try:
+                    _current_span.reset(token)
+                except ValueError:
+                    # Closed from another context (e.g. an abandoned async generator)
+                    pass
+
+    def _enqueue(self, spans: List[Span]) -> None:
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+            self._worker.start()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped_traces += 1
+
+    def _export_loop(self) -> None:
+        while True:
+            spans = self._queue.get()
+            for exporter in self.exporters:
+                try:
+                    exporter.export(spans)
+                except Exception as e:
+                    log.warning("Trace exporter failed", exporter=type(exporter).__name__, error=str(e))
+
+    @staticmethod
+    def _configured_exporters() -> List[Any]:
+        exporters: List[Any] = []
+        names = {name.strip() for name in settings.tracing_exporters.split(",") if name.strip()}
+        directory = settings.tracing_output_dir
+        if "jsonl" in names:
+            exporters.append(JsonlExporter(os.path.join(directory, "spans.jsonl")))
+        if "otlp" in names:
+            exporters.append(OtlpJsonExporter(
+                path=os.path.join(directory, "traces.otlp.jsonl"),
+                endpoint=settings.tracing_otlp_endpoint or None
+            ))
+        return exporters
+
+
+def new_turn_id() -> str:
+    """Turn ID, also used as the trace ID of the turn"""
+    return uuid.uuid4().hex
+
+
+# Shared by every service in the process
+tracer = Tracer()
@@ -0,0 +1,229 @@
+"""
+Upstream scheduler - shared per-provider concurrency budget with priority classes (OpenRouter, Kie.ai)
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Deque, Dict, Optional, Tuple
+from backend.config import settings
+
+if TYPE_CHECKING:
+    import httpx
+
+OPENROUTER = "openrouter"
+KIE_AI = "kie_ai"
+
+# Priority classes every upstream call site declares
+INTERACTIVE_TURN = "interactive_turn"  # A player is waiting for the reply (generation, judge, checks, STT)
+INTERACTIVE_AUDIO = "interactive_audio"  # A player is waiting for speech of a reply
+BACKGROUND = "background"  # Nobody waits on it directly (rolling summaries, pre-rendering, warmup)
+PRIORITY_CLASSES = (INTERACTIVE_TURN, INTERACTIVE_AUDIO, BACKGROUND)
+
+
+class _ProviderQueue:
+    """Scheduling state of one provider"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiters: Dict[str, Deque[Tuple[float, asyncio.Future]]] = {cls: deque() for cls in PRIORITY_CLASSES}
+        self.virtual_time: Dict[str, float] = {cls: 0.0 for cls in PRIORITY_CLASSES}
+        self.global_virtual_time = 0.0
+        self.in_flight_by_class: Dict[str, int] = {cls: 0 for cls in PRIORITY_CLASSES}
+        self.granted: Dict[str, int] = {cls: 0 for cls in PRIORITY_CLASSES}
+        self.wait_seconds_total: Dict[str, float] = {cls: 0.0 for cls in PRIORITY_CLASSES}
+        self.interactive_wait_ewma = 0.0
+        self.last_interactive = 0.0
+        self.background_deferrals = 0
+        self.retry_timer: Optional[asyncio.TimerHandle] = None
+
+
+class UpstreamScheduler:
+    """
+    Weighted fair queuing of upstream requests within a per-provider concurrency budget
+
+    Every outgoing HTTP request holds a slot of its provider for its whole
+    duration (for streams: until the stream is closed). When all slots are
+    taken, waiting requests are granted by start-time fair queuing: each
+    class advances its virtual time by 1/weight per grant and the waiting
+    class with the lowest virtual time goes next, so interactive turns get
+    most of the capacity without starving audio or background work.
+
+    Background requests never hold more than background_max_share of the
+    slots, and while the smoothed queueing delay of interactive requests is
+    above preempt_wait_seconds, no new background requests are started
+    (requests already running are left to finish).
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, int],
+        weights: Optional[Dict[str, float]] = None,
+        background_max_share: Optional[float] = None,
+        preempt_wait_seconds: Optional[float] = None
+    ):
+        self.weights = weights or {
+            INTERACTIVE_TURN: settings.scheduler_weight_interactive_turn,
+            INTERACTIVE_AUDIO: settings.scheduler_weight_interactive_audio,
+            BACKGROUND: settings.scheduler_weight_background
+        }
+        self.background_max_share = (
+            background_max_share if background_max_share is not None else settings.scheduler_background_max_share
+        )
+        self.preempt_wait_seconds = preempt_wait_seconds or settings.scheduler_preempt_wait_seconds
+        self._queues = {provider: _ProviderQueue(limit) for provider, limit in limits.items()}
+
+    @asynccontextmanager
+    async def slot(self, provider: str, priority: str) -> AsyncIterator[None]:
+        """
+        Hold one concurrency slot of the provider
+
+        Args:
+            provider: Provider key (OPENROUTER or KIE_AI)
+            priority: Priority class (INTERACTIVE_TURN, INTERACTIVE_AUDIO or BACKGROUND)
+        """
+        if priority not in self.weights:
+            raise ValueError(f"Unknown priority class '{priority}'")
+        queue = self._queues[provider]
+        started = time.monotonic()
+
+        if not self._backlogged(queue) and self._may_start(queue, priority):
+            self._grant(queue, priority)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            if not queue.waiters[priority]:
+                # A class returning from idle must not cash in credit for the time it sent nothing
+                queue.virtual_time[priority] = max(queue.virtual_time[priority], queue.global_virtual_time)
+            queue.waiters[priority].append((started, future))
+            self._dispatch(queue)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Granted right as we were cancelled: hand the slot on
+                    self._release(queue, priority)
+                else:
+                    future.cancel()
+                raise
+
+        self._record_wait(queue, priority, time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self._release(queue, priority)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Per-provider slots, queues and per-class statistics"""
+        result = {}
+        for provider, queue in self._queues.items():
+            result[provider] = {
+                "limit": queue.limit,
+                "in_flight": queue.in_flight,
+                "background_paused": self._background_paused(queue),
+                "background_deferrals": queue.background_deferrals,
+                "interactive_wait_ewma_seconds": round(queue.interactive_wait_ewma, 3),
+                "classes": {
+                    cls: {
+                        "in_flight": queue.in_flight_by_class[cls],
+                        "waiting": sum(1 for _, f in queue.waiters[cls] if not f.done()),
+                        "granted": queue.granted[cls],
+                        "avg_wait_seconds": queue.wait_seconds_total[cls] / queue.granted[cls] if queue.granted[cls] else 0.0
+                    }
+                    for cls in PRIORITY_CLASSES
+                }
+            }
+        return result
+
+    def _backlogged(self, queue: _ProviderQueue) -> bool:
+        return any(not f.done() for waiters in queue.waiters.values() for _, f in waiters)
+
+    def _may_start(self, queue: _ProviderQueue, priority: str) -> bool:
+        """Whether a request of this class may take a free slot now"""
+        if queue.in_flight >= queue.limit:
+            return False
+        if priority == BACKGROUND:
+            if self._background_paused(queue):
+                return False
+            cap = max(1, int(queue.limit * self.background_max_share))
+            return queue.in_flight_by_class[BACKGROUND] < cap
+        return True
+
+    def _background_paused(self, queue: _ProviderQueue) -> bool:
+        """Interactive requests are queueing noticeably (now or recently): hold background work back"""
+        now = time.monotonic()
+        for cls in (INTERACTIVE_TURN, INTERACTIVE_AUDIO):
+            for enqueued_at, future in queue.waiters[cls]:
+                if not future.done() and now - enqueued_at > self.preempt_wait_seconds:
+                    return True
+        return queue.interactive_wait_ewma > self.preempt_wait_seconds and now - queue.last_interactive < 5.0
+
+    def _grant(self, queue: _ProviderQueue, priority: str) -> None:
+        queue.in_flight += 1
+        queue.in_flight_by_class[priority] += 1
+        queue.granted[priority] += 1
+        queue.global_virtual_time = queue.virtual_time[priority]
+        queue.virtual_time[priority] += 1.0 / self.weights[priority]
+
+    def _release(self, queue: _ProviderQueue, priority: str) -> None:
+        queue.in_flight -= 1
+        queue.in_flight_by_class[priority] -= 1
+        self._dispatch(queue)
+
+    def _dispatch(self, queue: _ProviderQueue) -> None:
+        """Hand free slots to waiting requests in weighted fair order"""
+        while queue.in_flight < queue.limit:
+            eligible = []
+            for cls in PRIORITY_CLASSES:
+                waiters = queue.waiters[cls]
+                while waiters and waiters[0][1].done():
+                    waiters.popleft()  # Cancelled while waiting
+                if waiters and self._may_start(queue, cls):
+                    eligible.append(cls)
+            if not eligible:
+                if queue.waiters[BACKGROUND] and self._background_paused(queue):
+                    self._retry_background_later(queue)
+                return
+            cls = min(eligible, key=lambda c: queue.virtual_time[c])
+            self._grant(queue, cls)
+            queue.waiters[cls].popleft()[1].set_result(None)
+
+    def _retry_background_later(self, queue: _ProviderQueue) -> None:
+        """Background work held back by a pause: look again once it may have lifted"""
+        if queue.retry_timer is None:
+            queue.background_deferrals += 1
+
+            def retry() -> None:
+                queue.retry_timer = None
+                self._dispatch(queue)
+
+            queue.retry_timer = asyncio.get_running_loop().call_later(0.5, retry)
+
+    def _record_wait(self, queue: _ProviderQueue, priority: str, waited: float) -> None:
+        queue.wait_seconds_total[priority] += waited
+        if priority != BACKGROUND:
+            queue.interactive_wait_ewma = 0.2 * waited + 0.8 * queue.interactive_wait_ewma
+            queue.last_interactive = time.monotonic()
+
+
+# Shared by every upstream client in the process
+upstream_scheduler = UpstreamScheduler({
+    OPENROUTER: settings.upstream_concurrency_openrouter,
+    KIE_AI: settings.upstream_concurrency_kie_ai
+})
+
+
+def upstream_client(timeout: float) -> "httpx.AsyncClient":
+    """
+    HTTP client for one upstream call
+
+    Every OpenRouter and Kie.ai request goes through a client made here, so
+    record/replay (CASSETTE_MODE) covers all of them.
+
+    Args:
+        timeout: Request timeout in seconds
+    """
+    # Imported on first use so importing the scheduler does not load httpx
+    import httpx
+    from backend.services.cassette import cassette_transport
+    return httpx.AsyncClient(timeout=timeout, transport=cassette_transport())
@@ -2,9 +2,46 @@
 Validation service for blocking treasure phrase unless deception score is high enough
 """
 import re
-import json
-from typing import Optional, Tuple
-from backend.config import FORBIDDEN_PHRASE
+import asyncio
+from typing import Optional, Tuple, Dict, Any
+from backend.config import FORBIDDEN_PHRASE, settings
+from backend.services.json_stream import JSONStreamError
+from backend.services.upstream import INTERACTIVE_TURN
+from backend.services.log import get_logger
+
+log = get_logger("validation")
+
+# Semantic treasure check output; "reason" comes last so it can be skipped
+SEMANTIC_CHECK_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "is_similar": {"type": "boolean"},
+        "confidence": {"type": "number"},
+        "reason": {"type": "string"}
+    },
+    "required": ["is_similar", "confidence", "reason"],
+    "additionalProperties": False
+}
+
+# Few-shot examples shared by the single and batched semantic check prompts
+TREASURE_EXAMPLES = """Przykłady fraz które OZNACZAJĄ oddanie skarbu:
+- "skarb jest teraz twój"
+- "oddaję ci mój skarb"
+- "weź go, skarb jest twój"
+- "zgadzam się, możesz wziąć skarb"
+- "skarb należy do ciebie"
+
+Przykłady fraz które NIE oznaczają oddania skarbu:
+- "skarb jest ukryty"
+- "nie dam ci skarbu"
+- "skarb jest mój"
+- "może kiedyś oddam skarb"
+- "skarb jest ważny\""""
+
+SEMANTIC_CHECK_SYSTEM_PROMPT = "Jesteś ekspertem w analizie semantycznej tekstu. Odpowiadasz TYLKO w formacie JSON, bez żadnych dodatkowych komentarzy."
+
+# Minimum LLM confidence for a reply to count as giving the treasure away
+SEMANTIC_CONFIDENCE_THRESHOLD = 0.7
 
 
 class ValidationService:
@@ -17,6 +54,8 @@ class ValidationService:
             re.escape(self.forbidden_phrase),
             re.IGNORECASE
         )
+        # Claude Sonnet 4.5 for semantic check (better semantic understanding)
+        self.semantic_model = "anthropic/claude-sonnet-4.5"
         
     def contains_forbidden_phrase(self, text: str) -> bool:
         """
@@ -117,7 +156,8 @@ class ValidationService:
     async def detects_similar_treasure_phrase_llm(
         self,
         text: str,
-        llm_service
+        llm_service,
+        timeout: Optional[float] = None
     ) -> Tuple[bool, float]:
         """
         Use LLM to detect if text semantically means 'giving treasure to player'
@@ -125,6 +165,7 @@ class ValidationService:
         Args:
             text: Text to analyze
             llm_service: OpenRouterService instance for LLM calls
+            timeout: Upstream timeout in seconds; a timeout is re-raised, not defaulted
             
         Returns:
             Tuple of (is_similar, confidence_score) where:
@@ -144,19 +185,7 @@ Odpowiedz TYLKO w formacie JSON, bez żadnych dodatkowych komentarzy:
   "reason": "krótkie wyjaśnienie"
 }}
 
-Przykłady fraz które OZNACZAJĄ oddanie skarbu:
-- "skarb jest teraz twój"
-- "oddaję ci mój skarb"
-- "weź go, skarb jest twój"
-- "zgadzam się, możesz wziąć skarb"
-- "skarb należy do ciebie"
-
-Przykłady fraz które NIE oznaczają oddania skarbu:
-- "skarb jest ukryty"
-- "nie dam ci skarbu"
-- "skarb jest mój"
-- "może kiedyś oddam skarb"
-- "skarb jest ważny"
+{TREASURE_EXAMPLES}
 
 Odpowiedź pirata do przeanalizowania:
 {text}"""
@@ -165,7 +194,7 @@ Odpowiedź pirata do przeanalizowania:
             messages = [
                 {
                     "role": "system",
-                    "content": "Jesteś ekspertem w analizie semantycznej tekstu. Odpowiadasz TYLKO w formacie JSON, bez żadnych dodatkowych komentarzy."
+                    "content": SEMANTIC_CHECK_SYSTEM_PROMPT
                 },
                 {
                     "role": "user",
@@ -173,49 +202,61 @@ Odpowiedź pirata do przeanalizowania:
                 }
             ]
             
-            # Use Claude Sonnet 4.5 for semantic check (better semantic understanding)
-            response = await llm_service.generate_response(
-                messages=messages,
-                model="anthropic/claude-sonnet-4.5",  # Claude Sonnet 4.5 via OpenRouter for better semantic analysis
-                temperature=0.1,  # Low temperature for consistent analysis
-                max_tokens=200
-            )
-            
-            # Parse JSON response
-            response_text = response.strip()
-            # Remove markdown code blocks if present
-            if response_text.startswith("```"):
-                lines = response_text.split("\n")
-                response_text = "\n".join(lines[1:-1]) if len(lines) > 2 else response_text
+            # "reason" is generated last and not required, so the stream is cut before it
+            result = None
+            for attempt in range(1 + settings.json_parse_retries):
+                try:
+                    result = await llm_service.generate_json(
+                        messages=messages,
+                        model=self.semantic_model,
+                        schema=SEMANTIC_CHECK_SCHEMA,
+                        schema_name="treasure_check",
+                        temperature=0.1,  # Low temperature for consistent analysis
+                        max_tokens=200,
+                        required_keys=["is_similar", "confidence"],
+                        timeout=timeout,
+                        role="semantic_check",
+                        priority=INTERACTIVE_TURN
+                    )
+                    break
+                except JSONStreamError as e:
+                    log.warning("LLM semantic check returned invalid JSON", attempt=attempt + 1, error=str(e))
             
-            # Try to extract JSON
-            json_start = response_text.find("{")
-            json_end = response_text.rfind("}") + 1
-            if json_start >= 0 and json_end > json_start:
-                response_text = response_text[json_start:json_end]
-            
-            result = json.loads(response_text)
+            if result is None:
+                return False, 0.0
             
             is_similar = bool(result.get("is_similar", False))
             confidence = float(result.get("confidence", 0.0))
             
-            # Ensure confidence is in valid range
-            confidence = max(0.0, min(1.0, confidence))
-            
-            # Only consider it similar if confidence >= 0.7
-            if confidence >= 0.7:
-                return is_similar, confidence
-            else:
-                return False, confidence
+            return self.apply_confidence_threshold(is_similar, confidence)
                 
-        except (json.JSONDecodeError, KeyError, ValueError, TypeError) as e:
-            # If LLM fails or returns invalid JSON, fallback to False
-            print(f"LLM semantic check failed: {e}, defaulting to False")
+        except (asyncio.TimeoutError, TimeoutError):
+            # Out of time budget: the caller decides how to degrade
+            raise
+        except (KeyError, ValueError, TypeError) as e:
+            # If LLM fails or returns invalid values, fallback to False
+            log.warning("LLM semantic check failed, defaulting to False", error=str(e))
             return False, 0.0
         except Exception as e:
-            print(f"Error in LLM semantic check: {e}, defaulting to False")
+            log.warning("Error in LLM semantic check, defaulting to False", error=str(e))
             return False, 0.0
     
+    def regex_treasure_check(self, text: str) -> Tuple[bool, float]:
+        """Regex-only treasure detection (exact phrase or agreement), used when the LLM check is skipped"""
+        detected = self.contains_forbidden_phrase(text) or self.detects_treasure_agreement(text)
+        return detected, 1.0 if detected else 0.0
+    
+    @staticmethod
+    def apply_confidence_threshold(is_similar: bool, confidence: float) -> Tuple[bool, float]:
+        """Clamp confidence and only report a similar phrase at or above the threshold"""
+        # Ensure confidence is in valid range
+        confidence = max(0.0, min(1.0, confidence))
+        
+        # Only consider it similar if confidence >= threshold
+        if confidence >= SEMANTIC_CONFIDENCE_THRESHOLD:
+            return is_similar, confidence
+        return False, confidence
+    
     def _generate_alternative_response(self) -> str:
         """Generate alternative response when treasure phrase is blocked"""
         alternatives = [
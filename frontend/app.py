@@ -12,6 +12,7 @@ import wave
 
 # Configuration
 import os
+import uuid
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
 GPT_AUDIO_FORMAT = os.getenv("GPT_AUDIO_FORMAT", "pcm16").lower()
 GPT_AUDIO_SAMPLE_RATE = int(os.getenv("GPT_AUDIO_SAMPLE_RATE", "24000"))
@@ -44,6 +45,9 @@ if "transcribed_text" not in st.session_state:
     st.session_state.transcribed_text = None
 if "processed_audio_hash" not in st.session_state:
     st.session_state.processed_audio_hash = None
+if "pending_turn" not in st.session_state:
+    # Idempotency key of a message not yet answered, reused when it is sent again
+    st.session_state.pending_turn = None
 
 
 def pcm16_to_wav(pcm_bytes: bytes, sample_rate: int) -> bytes:
@@ -170,19 +174,35 @@ def send_message(message: str, include_audio: bool = False):
         st.warning("Please enter a message!")
         return False
     
+    # Same key for every attempt at this message, so a retry or resend after an
+    # error gets the original turn's response instead of running it again
+    pending = st.session_state.pending_turn
+    turn = {"game_id": st.session_state.game_id, "message": message.strip(), "include_audio": include_audio}
+    if not pending or {name: pending[name] for name in turn} != turn:
+        pending = {**turn, "key": uuid.uuid4().hex}
+        st.session_state.pending_turn = pending
+    
     try:
         with st.spinner("Sending message..."):
-            response = requests.post(
-                f"{API_BASE_URL}/api/game/conversation",
-                json={
-                    "game_id": st.session_state.game_id,
-                    "message": message.strip(),
-                    "include_audio": include_audio
-                },
-                timeout=120  # Increased timeout for audio generation
-            )
+            for attempt in range(2):
+                try:
+                    response = requests.post(
+                        f"{API_BASE_URL}/api/game/conversation",
+                        json={
+                            "game_id": st.session_state.game_id,
+                            "message": message.strip(),
+                            "include_audio": include_audio
+                        },
+                        headers={"Idempotency-Key": pending["key"]},
+                        timeout=120  # Increased timeout for audio generation
+                    )
+                    break
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    if attempt == 1:
+                        raise
             response.raise_for_status()
             data = response.json()
+            st.session_state.pending_turn = None
             
             # Add to conversation history
             st.session_state.conversation_history.append({